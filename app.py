@@ -1,46 +1,22 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-from sqlalchemy import create_engine, text
 import urllib.parse
 import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
-import time
-# ========== 2. 安全資料庫連線 ==========
-@st.cache_resource
-def get_engine():
-    try:
-        DB_PASSWORD = st.secrets["DB_PASSWORD"]
-        PROJECT_REF = st.secrets["PROJECT_REF"]
-        POOLER_HOST = st.secrets["POOLER_HOST"]
-        encoded_password = urllib.parse.quote_plus(DB_PASSWORD)
-        connection_string = f"postgresql://postgres.{PROJECT_REF}:{encoded_password}@{POOLER_HOST}:5432/postgres?sslmode=require"
-        return create_engine(connection_string)
-    except Exception as e:
-        st.error("❌ 資料庫連線失敗，請檢查 Streamlit Secrets 設定。")
-        st.stop()
-@st.cache_data(ttl=3600)
-def get_latest_data_date():
-    try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            # 抓取股價表中最晚的日期
-            query = text("SELECT MAX(date) FROM stock_prices")
-            result = conn.execute(query).scalar()
-            
-            # 如果 result 是 datetime 物件，轉為字串格式 (YYYY-MM-DD)
-            if hasattr(result, 'strftime'):
-                return result.strftime('%Y-%m-%d')
-            return str(result)
-    except Exception as e:
-        return "資料擷取中"
+from data_access import (
+    get_latest_data_date, fetch_heatmap_data, select_heatmap_stat, fetch_stat_summary,
+    fetch_bin_detail, HEATMAP_STATS
+)
+from binning import BINNING_SCHEMES, DEFAULT_BINNING_SCHEME
+from summary_tables import markdown_rows
+import profiler
 # ========== 1. 頁面配置 ==========
 st.set_page_config(
     page_title="StockRevenueLab | 趨勢觀測站",
     page_icon="🧪",
     layout="wide"
 )
+profiler.start_run("app")  # SRL_PROFILE=1 時記錄每段耗時，頁尾顯示計時面板
+profiler.mark("1. 頁面配置")
 
 # 自定義 CSS 美化
 st.markdown("""
@@ -58,7 +34,8 @@ st.markdown("""
 st.sidebar.success("💡 想要看『勝率分析』？請點選左側選單的 probability 頁面！")
 
 # 獲取資料庫最新日期
-latest_date = get_latest_data_date()
+with profiler.section("get_latest_data_date"):
+    latest_date = get_latest_data_date()
 
 # 顯示資料庫狀態（取代原本的計數器）
 st.sidebar.markdown(f"""
@@ -75,6 +52,7 @@ st.markdown("#### 透過 16 萬筆真實數據，揭開業績與股價漲幅的
 
 
 # ========== 🚀 核心變數定義區 (必須放在 fetch 數據之前) ==========
+profiler.mark("🚀 核心變數定義區")
 st.sidebar.header("🔬 研究條件篩選")
 
 # 1. 定義年度
@@ -96,254 +74,19 @@ price_calc = st.sidebar.radio(
 price_field = "year_close" if price_calc == "收盤價 (實戰版)" else "year_high"
 price_label = "收盤價" if price_calc == "收盤價 (實戰版)" else "最高價"
 
+# 2.6 定義漲幅分組方式（本機重新分組，不需重新查詢）
+binning_scheme = st.sidebar.selectbox(
+    "漲幅分組方式",
+    list(BINNING_SCHEMES),
+    index=list(BINNING_SCHEMES).index(DEFAULT_BINNING_SCHEME),
+    help="分位數分組：依當年樣本漲幅切分，各組股票檔數大致相同"
+)
+
 # 3. 定義統計模式
-stat_methods = [
-    "中位數 (排除極端值)",
-    "平均值 (含極端值)", 
-    "標準差 (波動程度)",
-    "變異係數 (相對波動)",
-    "偏度 (分佈形狀)",
-    "峰度 (尾部厚度)",
-    "四分位距 (離散程度)",
-    "正樣本比例"
-]
+stat_methods = list(HEATMAP_STATS)  # 中位數、平均值、標準差、變異係數、偏度、峰度、四分位距、正樣本比例
 stat_method = st.sidebar.selectbox("統計指標模式", stat_methods, index=0)
 
 # =============================================================
-# ========== 3. 數據抓取引擎 (支援多種統計模式，下跌10%間隔，上漲100%間隔) ==========
-@st.cache_data(ttl=3600)
-def fetch_heatmap_data(year, metric_col, stat_method, price_field="year_close"):
-    engine = get_engine()
-    minguo_year = int(year) - 1911
-    prev_minguo_year = minguo_year - 1
-    
-    # 根據統計方法選擇聚合函數
-    if stat_method == "中位數 (排除極端值)":
-        agg_func = f"percentile_cont(0.5) WITHIN GROUP (ORDER BY m.{metric_col})"
-        stat_label = "中位數"
-    elif stat_method == "平均值 (含極端值)":
-        agg_func = f"AVG(m.{metric_col})"
-        stat_label = "平均值"
-    elif stat_method == "標準差 (波動程度)":
-        agg_func = f"STDDEV(m.{metric_col})"
-        stat_label = "標準差"
-    elif stat_method == "變異係數 (相對波動)":
-        agg_func = f"CASE WHEN AVG(m.{metric_col}) = 0 THEN 0 ELSE (STDDEV(m.{metric_col}) / ABS(AVG(m.{metric_col}))) * 100 END"
-        stat_label = "變異係數%"
-    elif stat_method == "偏度 (分佈形狀)":
-        agg_func = f"""
-        CASE WHEN STDDEV(m.{metric_col}) = 0 THEN 0 
-             ELSE (AVG(POWER((m.{metric_col} - AVG(m.{metric_col}))/NULLIF(STDDEV(m.{metric_col}),0), 3))) 
-        END
-        """
-        stat_label = "偏度"
-    elif stat_method == "峰度 (尾部厚度)":
-        agg_func = f"""
-        CASE WHEN STDDEV(m.{metric_col}) = 0 THEN 0 
-             ELSE (AVG(POWER((m.{metric_col} - AVG(m.{metric_col}))/NULLIF(STDDEV(m.{metric_col}),0), 4)) - 3) 
-        END
-        """
-        stat_label = "峰度"
-    elif stat_method == "四分位距 (離散程度)":
-        agg_func = f"percentile_cont(0.75) WITHIN GROUP (ORDER BY m.{metric_col}) - percentile_cont(0.25) WITHIN GROUP (ORDER BY m.{metric_col})"
-        stat_label = "四分位距"
-    elif stat_method == "正樣本比例":
-        agg_func = f"SUM(CASE WHEN m.{metric_col} > 0 THEN 1 ELSE 0 END) * 100.0 / COUNT(*)"
-        stat_label = "正增長比例%"
-    else:
-        agg_func = f"AVG(m.{metric_col})"
-        stat_label = "平均值"
-    
-    # 修改這裡：下跌10%間隔，上漲100%間隔
-    query = f"""
-    WITH annual_bins AS (
-        SELECT 
-            symbol,
-            (({price_field} - year_open) / year_open) * 100 AS annual_return,
-            CASE 
-                -- 下跌區間：每10%一個間隔（從-100%到0%）
-                WHEN (({price_field} - year_open) / year_open) * 100 <= -100 THEN '00. 下跌-100%以下'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -90 THEN '01. 下跌-100%至-90%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -80 THEN '02. 下跌-90%至-80%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -70 THEN '03. 下跌-80%至-70%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -60 THEN '04. 下跌-70%至-60%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -50 THEN '05. 下跌-60%至-50%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -40 THEN '06. 下跌-50%至-40%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -30 THEN '07. 下跌-40%至-30%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -20 THEN '08. 下跌-30%至-20%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -10 THEN '09. 下跌-20%至-10%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 0 THEN '10. 下跌-10%至0%'
-                -- 上漲區間：每100%一個間隔
-                WHEN (({price_field} - year_open) / year_open) * 100 < 100 THEN '11. 上漲0-100%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 200 THEN '12. 上漲100-200%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 300 THEN '13. 上漲200-300%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 400 THEN '14. 上漲300-400%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 500 THEN '15. 上漲400-500%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 600 THEN '16. 上漲500-600%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 700 THEN '17. 上漲600-700%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 800 THEN '18. 上漲700-800%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 900 THEN '19. 上漲800-900%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 1000 THEN '20. 上漲900-1000%'
-                ELSE '21. 上漲1000%以上'
-            END AS return_bin,
-            -- 為了分組排序，新增一個順序欄位
-            CASE 
-                WHEN (({price_field} - year_open) / year_open) * 100 <= -100 THEN 0
-                WHEN (({price_field} - year_open) / year_open) * 100 < -90 THEN 1
-                WHEN (({price_field} - year_open) / year_open) * 100 < -80 THEN 2
-                WHEN (({price_field} - year_open) / year_open) * 100 < -70 THEN 3
-                WHEN (({price_field} - year_open) / year_open) * 100 < -60 THEN 4
-                WHEN (({price_field} - year_open) / year_open) * 100 < -50 THEN 5
-                WHEN (({price_field} - year_open) / year_open) * 100 < -40 THEN 6
-                WHEN (({price_field} - year_open) / year_open) * 100 < -30 THEN 7
-                WHEN (({price_field} - year_open) / year_open) * 100 < -20 THEN 8
-                WHEN (({price_field} - year_open) / year_open) * 100 < -10 THEN 9
-                WHEN (({price_field} - year_open) / year_open) * 100 < 0 THEN 10
-                WHEN (({price_field} - year_open) / year_open) * 100 < 100 THEN 11
-                WHEN (({price_field} - year_open) / year_open) * 100 < 200 THEN 12
-                WHEN (({price_field} - year_open) / year_open) * 100 < 300 THEN 13
-                WHEN (({price_field} - year_open) / year_open) * 100 < 400 THEN 14
-                WHEN (({price_field} - year_open) / year_open) * 100 < 500 THEN 15
-                WHEN (({price_field} - year_open) / year_open) * 100 < 600 THEN 16
-                WHEN (({price_field} - year_open) / year_open) * 100 < 700 THEN 17
-                WHEN (({price_field} - year_open) / year_open) * 100 < 800 THEN 18
-                WHEN (({price_field} - year_open) / year_open) * 100 < 900 THEN 19
-                WHEN (({price_field} - year_open) / year_open) * 100 < 1000 THEN 20
-                ELSE 21
-            END AS bin_order
-        FROM stock_annual_k
-        WHERE year = '{year}'
-    ),
-    monthly_stats AS (
-            SELECT stock_id, report_month, {metric_col} 
-            FROM monthly_revenue
-            WHERE report_month = '{prev_minguo_year}_12'  -- 去年12月
-               OR (report_month LIKE '{minguo_year}_%' 
-                   AND report_month < '{minguo_year}_12'  -- 排除當年12月
-                   AND LENGTH(report_month) <= 7)
-    )
-    
-    SELECT 
-        b.return_bin,
-        b.bin_order,
-        m.report_month,
-        {agg_func} as val,
-        COUNT(DISTINCT b.symbol) as stock_count,
-        COUNT(m.{metric_col}) as data_points,
-        AVG(b.annual_return) as avg_annual_return  -- 新增：計算該區間的平均股價漲幅
-    FROM annual_bins b
-    JOIN monthly_stats m ON SPLIT_PART(b.symbol, '.', 1) = m.stock_id
-    WHERE m.{metric_col} IS NOT NULL
-    GROUP BY b.return_bin, b.bin_order, m.report_month
-    ORDER BY b.bin_order, m.report_month;
-    """
-    
-    with engine.connect() as conn:
-        df = pd.read_sql_query(text(query), conn)
-        df['stat_method'] = stat_method
-        df['stat_label'] = stat_label
-        # 按照bin_order排序
-        df = df.sort_values(['bin_order', 'report_month'])
-        return df
-
-# ========== 4. 統計摘要數據抓取 (修改版，下跌10%間隔，上漲100%間隔) ==========
-@st.cache_data(ttl=3600)
-def fetch_stat_summary(year, metric_col, price_field="year_close"):
-    engine = get_engine()
-    minguo_year = int(year) - 1911
-    prev_minguo_year = minguo_year - 1
-    
-    query = f"""
-    WITH annual_bins AS (
-        SELECT 
-            symbol,
-            (({price_field} - year_open) / year_open) * 100 AS annual_return,
-            CASE 
-                -- 下跌區間：每10%一個間隔（從-100%到0%）
-                WHEN (({price_field} - year_open) / year_open) * 100 <= -100 THEN '00. 下跌-100%以下'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -90 THEN '01. 下跌-100%至-90%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -80 THEN '02. 下跌-90%至-80%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -70 THEN '03. 下跌-80%至-70%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -60 THEN '04. 下跌-70%至-60%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -50 THEN '05. 下跌-60%至-50%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -40 THEN '06. 下跌-50%至-40%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -30 THEN '07. 下跌-40%至-30%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -20 THEN '08. 下跌-30%至-20%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -10 THEN '09. 下跌-20%至-10%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 0 THEN '10. 下跌-10%至0%'
-                -- 上漲區間：每100%一個間隔
-                WHEN (({price_field} - year_open) / year_open) * 100 < 100 THEN '11. 上漲0-100%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 200 THEN '12. 上漲100-200%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 300 THEN '13. 上漲200-300%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 400 THEN '14. 上漲300-400%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 500 THEN '15. 上漲400-500%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 600 THEN '16. 上漲500-600%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 700 THEN '17. 上漲600-700%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 800 THEN '18. 上漲700-800%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 900 THEN '19. 上漲800-900%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 1000 THEN '20. 上漲900-1000%'
-                ELSE '21. 上漲1000%以上'
-            END AS return_bin,
-            -- 為了分組排序，新增一個順序欄位
-            CASE 
-                WHEN (({price_field} - year_open) / year_open) * 100 <= -100 THEN 0
-                WHEN (({price_field} - year_open) / year_open) * 100 < -90 THEN 1
-                WHEN (({price_field} - year_open) / year_open) * 100 < -80 THEN 2
-                WHEN (({price_field} - year_open) / year_open) * 100 < -70 THEN 3
-                WHEN (({price_field} - year_open) / year_open) * 100 < -60 THEN 4
-                WHEN (({price_field} - year_open) / year_open) * 100 < -50 THEN 5
-                WHEN (({price_field} - year_open) / year_open) * 100 < -40 THEN 6
-                WHEN (({price_field} - year_open) / year_open) * 100 < -30 THEN 7
-                WHEN (({price_field} - year_open) / year_open) * 100 < -20 THEN 8
-                WHEN (({price_field} - year_open) / year_open) * 100 < -10 THEN 9
-                WHEN (({price_field} - year_open) / year_open) * 100 < 0 THEN 10
-                WHEN (({price_field} - year_open) / year_open) * 100 < 100 THEN 11
-                WHEN (({price_field} - year_open) / year_open) * 100 < 200 THEN 12
-                WHEN (({price_field} - year_open) / year_open) * 100 < 300 THEN 13
-                WHEN (({price_field} - year_open) / year_open) * 100 < 400 THEN 14
-                WHEN (({price_field} - year_open) / year_open) * 100 < 500 THEN 15
-                WHEN (({price_field} - year_open) / year_open) * 100 < 600 THEN 16
-                WHEN (({price_field} - year_open) / year_open) * 100 < 700 THEN 17
-                WHEN (({price_field} - year_open) / year_open) * 100 < 800 THEN 18
-                WHEN (({price_field} - year_open) / year_open) * 100 < 900 THEN 19
-                WHEN (({price_field} - year_open) / year_open) * 100 < 1000 THEN 20
-                ELSE 21
-            END AS bin_order
-        FROM stock_annual_k
-        WHERE year = '{year}'
-    ),
-    monthly_stats AS (
-            SELECT stock_id, report_month, {metric_col} 
-            FROM monthly_revenue
-            WHERE report_month = '{prev_minguo_year}_12'
-               OR (report_month LIKE '{minguo_year}_%' 
-                   AND report_month < '{minguo_year}_12'
-                   AND LENGTH(report_month) <= 7)
-        )
-    
-    SELECT 
-        b.return_bin,
-        b.bin_order,
-        COUNT(DISTINCT b.symbol) as stock_count,
-        AVG(b.annual_return) as avg_annual_return,  -- 該區間的平均股價漲幅
-        ROUND(AVG(m.{metric_col})::numeric, 2) as mean_val,
-        ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY m.{metric_col})::numeric, 2) as median_val,
-        ROUND(STDDEV(m.{metric_col})::numeric, 2) as std_val,
-        ROUND(MIN(m.{metric_col})::numeric, 2) as min_val,
-        ROUND(MAX(m.{metric_col})::numeric, 2) as max_val,
-        ROUND((STDDEV(m.{metric_col}) / NULLIF(AVG(m.{metric_col}), 0))::numeric, 2) as cv_val,
-        ROUND((percentile_cont(0.75) WITHIN GROUP (ORDER BY m.{metric_col}) - 
-               percentile_cont(0.25) WITHIN GROUP (ORDER BY m.{metric_col}))::numeric, 2) as iqr_val,
-        ROUND(SUM(CASE WHEN m.{metric_col} > 0 THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 1) as positive_rate
-    FROM annual_bins b
-    JOIN monthly_stats m ON SPLIT_PART(b.symbol, '.', 1) = m.stock_id
-    WHERE m.{metric_col} IS NOT NULL
-    GROUP BY b.return_bin, b.bin_order
-    ORDER BY b.bin_order;
-    """
-    
-    with engine.connect() as conn:
-        return pd.read_sql_query(text(query), conn)
 # ========== 5. AI分析提示詞生成 (整合全維度數據 + 保留原所有任務) ==========
 def generate_ai_prompt(target_year, metric_choice, stat_method, stat_summary, pivot_df, total_samples, price_calc, price_label):
     current_date = datetime.now().strftime("%Y-%m-%d")
@@ -371,13 +114,11 @@ def generate_ai_prompt(target_year, metric_choice, stat_method, stat_summary, pi
     # 3. 建立「全維度」數據摘要表 (升級此處，包含標準差、變異係數、四分位距等)
     summary_table = "| 漲幅區間 | 股票數量 | 均漲幅 | 均營收 | 中位數 | 標準差 | 變異係數 | 四分位距 | 正成長% |\n"
     summary_table += "|----------|----------|--------|--------|--------|--------|----------|----------|---------|\n"
-    for _, row in stat_summary.iterrows():
-        bin_name = row['return_bin']
-        summary_table += (
-            f"| {bin_name} | {row['stock_count']}檔 | {row['avg_annual_return']:.1f}% "
-            f"| {row['mean_val']:.1f}% | {row['median_val']:.1f}% | {row['std_val']:.1f} "
-            f"| {row['cv_val']:.2f} | {row['iqr_val']:.1f} | {row['positive_rate']:.1f}% |\n"
-        )
+    summary_table += "".join(markdown_rows(stat_summary, {
+        'return_bin': None, 'stock_count': "{}檔", 'avg_annual_return': "{:.1f}%",
+        'mean_val': "{:.1f}%", 'median_val': "{:.1f}%", 'std_val': "{:.1f}",
+        'cv_val': "{:.2f}", 'iqr_val': "{:.1f}", 'positive_rate': "{:.1f}%",
+    }) + "\n")
     
     # 4. 計算背景統計 (保留原邏輯)
     total_falling_stocks = stat_summary[stat_summary['return_bin'].str.contains('下跌')]['stock_count'].sum()
@@ -475,14 +216,19 @@ def generate_ai_prompt(target_year, metric_choice, stat_method, stat_summary, pi
 
 
 # ========== 7. 儀表板主視圖 ==========
+profiler.mark("7. 儀表板主視圖")
 # 初始化變數，避免頁尾報錯
 total_samples = 0
 actual_months = 0
 total_data_points = 0
 
 
-df = fetch_heatmap_data(target_year, target_col, stat_method, price_field)
-stat_summary = fetch_stat_summary(target_year, target_col, price_field)
+# 一次取回所有統計指標，切換統計模式不需重新查詢
+with profiler.section("fetch_heatmap_data"):
+    heatmap_all = fetch_heatmap_data(target_year, target_col, price_field, binning_scheme)
+    df = select_heatmap_stat(heatmap_all, stat_method)
+with profiler.section("fetch_stat_summary"):
+    stat_summary = fetch_stat_summary(target_year, target_col, price_field, binning_scheme)
 
 if not df.empty:
     # 頂部指標
@@ -498,6 +244,7 @@ if not df.empty:
     with c4: st.metric("數據點總數", f"{int(total_data_points):,}")
     
     # ========== 8. 統計摘要卡片 ==========
+    profiler.mark("8. 統計摘要卡片")
     st.subheader("📈 統計指標說明")
     col1, col2, col3, col4 = st.columns(4)
     
@@ -535,11 +282,13 @@ if not df.empty:
 
 
     # ========== 9. 熱力圖 ==========
+    profiler.mark("9. 熱力圖")
     st.subheader(f"📊 {target_year} 「{price_label}漲幅區間 vs {metric_choice}」業績對照熱力圖")
     st.info(f"**當前統計模式：{stat_method}** | **計算方式：{price_calc}** | 顏色深淺代表統計值的大小")
 
     
-    pivot_df = df.pivot(index='return_bin', columns='report_month', values='val')
+    with profiler.section("pivot"):
+        pivot_df = df.pivot(index='return_bin', columns='report_month', values='val')
 
     # 根據統計方法選擇顏色方案
     if "標準差" in stat_method or "變異係數" in stat_method or "四分位距" in stat_method:
@@ -553,20 +302,22 @@ if not df.empty:
     else:
         color_scale = "RdYlGn"  # 預設紅黃綠
     
-    fig = px.imshow(
-        pivot_df,
-        labels=dict(x="報表月份", y="漲幅區間", color=f"{metric_choice} ({df['stat_label'].iloc[0]})"),
-        x=pivot_df.columns,
-        y=pivot_df.index,
-        color_continuous_scale=color_scale,
-        aspect="auto",
-        text_auto=".2f" if "變異係數" in stat_method or "峰度" in stat_method or "偏度" in stat_method else ".1f"
-    )
-    fig.update_xaxes(side="top")
-    fig.update_layout(height=600)
-    st.plotly_chart(fig, use_container_width=True)
+    with profiler.section("px.imshow"):
+        fig = px.imshow(
+            pivot_df,
+            labels=dict(x="報表月份", y="漲幅區間", color=f"{metric_choice} ({df['stat_label'].iloc[0]})"),
+            x=pivot_df.columns,
+            y=pivot_df.index,
+            color_continuous_scale=color_scale,
+            aspect="auto",
+            text_auto=".2f" if "變異係數" in stat_method or "峰度" in stat_method or "偏度" in stat_method else ".1f"
+        )
+        fig.update_xaxes(side="top")
+        fig.update_layout(height=600)
+        st.plotly_chart(fig, use_container_width=True)
     
     # ========== 10. 統計摘要表格與AI分析 ==========
+    profiler.mark("10. 統計摘要表格與AI分析")
     with st.expander("📋 查看各漲幅區間詳細統計摘要", expanded=False):
         st.markdown("""
         **📅 數據時間範圍說明：**
@@ -595,25 +346,27 @@ if not df.empty:
                 'positive_rate': '正增長比例%'
             })
             
-            st.dataframe(
-                stat_summary_display.style.format({
-                    '平均值': '{:.1f}',
-                    '中位數': '{:.1f}',
-                    '標準差': '{:.1f}',
-                    '最小值': '{:.1f}',
-                    '最大值': '{:.1f}',
-                    '變異係數': '{:.2f}',
-                    '四分位距': '{:.1f}',
-                    '正增長比例%': '{:.1f}%'
-                }).background_gradient(cmap='YlOrRd', subset=['平均值', '中位數'])
-                .background_gradient(cmap='Blues', subset=['標準差', '四分位距'])
-                .background_gradient(cmap='RdYlGn_r', subset=['變異係數'])
-                .background_gradient(cmap='Greens', subset=['正增長比例%']),
-                use_container_width=True,
-                height=400
-            )
+            with profiler.section("Styler background_gradient"):
+                st.dataframe(
+                    stat_summary_display.style.format({
+                        '平均值': '{:.1f}',
+                        '中位數': '{:.1f}',
+                        '標準差': '{:.1f}',
+                        '最小值': '{:.1f}',
+                        '最大值': '{:.1f}',
+                        '變異係數': '{:.2f}',
+                        '四分位距': '{:.1f}',
+                        '正增長比例%': '{:.1f}%'
+                    }).background_gradient(cmap='YlOrRd', subset=['平均值', '中位數'])
+                    .background_gradient(cmap='Blues', subset=['標準差', '四分位距'])
+                    .background_gradient(cmap='RdYlGn_r', subset=['變異係數'])
+                    .background_gradient(cmap='Greens', subset=['正增長比例%']),
+                    use_container_width=True,
+                    height=400
+                )
 
             # ========== 11. AI分析提示詞區塊 ==========
+            profiler.mark("11. AI分析提示詞區塊")
             st.markdown("---")
             st.subheader("🤖 AI 智能分析助手")
             st.info("""
@@ -678,6 +431,7 @@ if not df.empty:
                     st.code("已複製到剪貼簿！請直接貼到AI對話框", language="text")
     
     # ========== 12. 深度挖掘：領頭羊與備註搜尋 ==========
+    profiler.mark("12. 深度挖掘：領頭羊與備註搜尋")
     st.write("---")
     st.write("---")
     st.subheader(f"🔍 {target_year} 深度挖掘：區間業績王與關鍵字搜尋")
@@ -697,80 +451,18 @@ if not df.empty:
     with col_c:
         search_keyword = st.text_input("💡 備註關鍵字（如：建案、訂單、CoWoS、新機）：", "")
 
-    minguo_year = int(target_year) - 1911
-    prev_minguo_year = minguo_year - 1
-    # 修改後的 detail_query 區塊
-    detail_query = f"""
-    WITH target_stocks AS (
-        SELECT symbol, 
-            -- 使用 price_field 計算漲幅（與熱力圖一致）
-            (({price_field} - year_open) / year_open) * 100 as annual_ret,
-            CASE 
-                -- 使用 price_field 計算分類（與熱力圖一致）
-                WHEN (({price_field} - year_open) / year_open) * 100 <= -100 THEN '00. 下跌-100%以下'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -90 THEN '01. 下跌-100%至-90%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -80 THEN '02. 下跌-90%至-80%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -70 THEN '03. 下跌-80%至-70%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -60 THEN '04. 下跌-70%至-60%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -50 THEN '05. 下跌-60%至-50%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -40 THEN '06. 下跌-50%至-40%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -30 THEN '07. 下跌-40%至-30%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -20 THEN '08. 下跌-30%至-20%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < -10 THEN '09. 下跌-20%至-10%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 0 THEN '10. 下跌-10%至0%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 100 THEN '11. 上漲0-100%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 200 THEN '12. 上漲100-200%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 300 THEN '13. 上漲200-300%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 400 THEN '14. 上漲300-400%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 500 THEN '15. 上漲400-500%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 600 THEN '16. 上漲500-600%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 700 THEN '17. 上漲600-700%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 800 THEN '18. 上漲700-800%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 900 THEN '19. 上漲800-900%'
-                WHEN (({price_field} - year_open) / year_open) * 100 < 1000 THEN '20. 上漲900-1000%'
-                ELSE '21. 上漲1000%以上'
-            END AS return_bin
-        FROM stock_annual_k 
-        WHERE year = '{target_year}'
-    ),
-
-    latest_remarks AS (
-        SELECT DISTINCT ON (stock_id) stock_id, remark 
-        FROM monthly_revenue 
-        WHERE (report_month LIKE '{minguo_year}_%' AND report_month < '{minguo_year}_12' OR report_month = '{prev_minguo_year}_12')
-          AND remark IS NOT NULL AND remark <> '-' AND remark <> ''
-        ORDER BY stock_id, report_month DESC
-    )
-    SELECT 
-        m.stock_id as "代號", 
-        m.stock_name as "名稱",
-        ROUND(t.annual_ret::numeric, 1) as "年度股價實際漲幅%",
-        ROUND(AVG(m.yoy_pct)::numeric, 1) as "年增YoY平均%", 
-        ROUND(AVG(m.mom_pct)::numeric, 1) as "月增MoM平均%",
-        ROUND(STDDEV(m.yoy_pct)::numeric, 1) as "年增YoY波動%",
-        ROUND(STDDEV(m.mom_pct)::numeric, 1) as "月增MoM波動%",
-        r.remark as "最新營收備註"
-    FROM monthly_revenue m
-    JOIN target_stocks t ON m.stock_id = SPLIT_PART(t.symbol, '.', 1)
-    LEFT JOIN latest_remarks r ON m.stock_id = r.stock_id
-    WHERE t.return_bin = '{selected_bin}'  -- 這裡直接對齊字串
-      AND (m.report_month LIKE '{minguo_year}_%' AND m.report_month < '{minguo_year}_12' OR m.report_month = '{prev_minguo_year}_12')
-      AND (m.stock_name LIKE '%{search_keyword}%' OR (r.remark IS NOT NULL AND r.remark LIKE '%{search_keyword}%'))
-    GROUP BY m.stock_id, m.stock_name, t.annual_ret, r.remark
-    ORDER BY "年度股價實際漲幅%" DESC 
-    LIMIT {display_limit};
-    """
-    
-    with get_engine().connect() as conn:
-        res_df = pd.read_sql_query(text(detail_query), conn)
-        if not res_df.empty:
-            st.write(f"🏆 在 **{selected_bin}** 區間中，符合條件的前 {len(res_df)} 檔公司：")
-            
-            # 添加排序選項
-            sort_col = st.selectbox("排序依據", 
-                                   ["年度股價實際漲幅%", "年增YoY平均%", "月增MoM平均%", "年增YoY波動%", "月增MoM波動%"])
-            res_df_sorted = res_df.sort_values(by=sort_col, ascending=False)
-            
+    with profiler.section("fetch_bin_detail"):
+        res_df = fetch_bin_detail(target_year, price_field, selected_bin, search_keyword, display_limit,
+                                  binning_scheme)
+    if not res_df.empty:
+        st.write(f"🏆 在 **{selected_bin}** 區間中，符合條件的前 {len(res_df)} 檔公司：")
+        
+        # 添加排序選項
+        sort_col = st.selectbox("排序依據", 
+                               ["年度股價實際漲幅%", "年增YoY平均%", "月增MoM平均%", "年增YoY波動%", "月增MoM波動%"])
+        res_df_sorted = res_df.sort_values(by=sort_col, ascending=False)
+        
+        with profiler.section("Styler background_gradient"):
             st.dataframe(
                 res_df_sorted.style.format({
                     "年度股價實際漲幅%": "{:.1f}%",
@@ -784,10 +476,11 @@ if not df.empty:
                 use_container_width=True,
                 height=500
             )
-        else:
-            st.info("💡 目前區間或關鍵字下找不到符合的公司。")
+    else:
+        st.info("💡 目前區間或關鍵字下找不到符合的公司。")
     
     # ========== 13. 原始數據矩陣 (可切換統計模式) ==========
+    profiler.mark("13. 原始數據矩陣")
     with st.expander("🔧 查看原始數據矩陣與模式切換"):
         st.markdown("""
         **📅 數據時間範圍說明：**
@@ -808,25 +501,9 @@ if not df.empty:
                              ["中位數", "平均值", "標準差", "變異係數"], 
                              horizontal=True)
         
-        # 根據選擇重新計算或顯示
-        if quick_stat == "中位數":
-            display_df = df[df['stat_method'].str.contains("中位數")]
-            if display_df.empty:
-                display_df = fetch_heatmap_data(target_year, target_col, "中位數 (排除極端值)")
-        elif quick_stat == "平均值":
-            display_df = df[df['stat_method'].str.contains("平均值")]
-            if display_df.empty:
-                display_df = fetch_heatmap_data(target_year, target_col, "平均值 (含極端值)")
-        elif quick_stat == "標準差":
-            display_df = df[df['stat_method'].str.contains("標準差")]
-            if display_df.empty:
-                display_df = fetch_heatmap_data(target_year, target_col, "標準差 (波動程度)")
-        elif quick_stat == "變異係數":
-            display_df = df[df['stat_method'].str.contains("變異係數")]
-            if display_df.empty:
-                display_df = fetch_heatmap_data(target_year, target_col, "變異係數 (相對波動)")
-        else:
-            display_df = df
+        # 直接從已取回的全統計結果切換，不需重新查詢
+        quick_method = next(m for m in stat_methods if m.startswith(quick_stat))
+        display_df = select_heatmap_stat(heatmap_all, quick_method)
         
         if not display_df.empty:
             pivot_display = display_df.pivot(index='return_bin', columns='report_month', values='val')
@@ -856,6 +533,7 @@ else:
 
 
 # ========== 14. 頁尾 (修正後) ==========
+profiler.mark("14. 頁尾")
 st.markdown("---")
 
 # 獲取當前日期
@@ -926,3 +604,6 @@ st.markdown("""
 st.caption(f"""
 Developed by StockRevenueLab | 讓 16 萬筆數據說真話 | 統計模式 v2.0 | AI分析功能已上線 | 更新時間: {current_date.strftime('%Y-%m-%d %H:%M:%S')}
 """)
+
+# 效能剖析面板（SRL_PROFILE=1 時才顯示）
+profiler.render_panel()
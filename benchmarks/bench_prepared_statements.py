@@ -0,0 +1,134 @@
+"""
+字串拼接 SQL vs 綁定參數 + prepared statement 的耗時比較
+
+舊寫法把年度、區間、關鍵字等值直接拼進 SQL，每組參數都是一段新的 SQL 文字，
+Postgres 每次都要重新 parse + plan；改成綁定參數後 SQL 文字固定，
+psycopg 3 可以在同一條連線上重用 server-side prepared statement。
+
+用法：
+    python benchmarks/bench_prepared_statements.py --dsn "postgresql://..." [--rounds 5]
+
+也可以用環境變數 DATABASE_URL 指定連線字串。需先執行 sql/001 ~ sql/003 三個 migration。
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+
+import psycopg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 專案根目錄
+from binning import DEFAULT_BINNING
+from periods import observation_window
+
+# ========== 比較用查詢（與 data_access 相同的 SQL，參數改用 psycopg 的 %(name)s） ==========
+HEATMAP_SAMPLES = """
+SELECT b.symbol, b.annual_return, m.report_month, m.yoy_pct, m.mom_pct
+FROM annual_return_bins b
+JOIN monthly_revenue m ON b.stock_id = m.stock_id
+WHERE b.year = %(year)s AND b.price_field = %(price_field)s
+  AND m.period BETWEEN %(start_period)s AND %(end_period)s
+"""
+
+BIN_DETAIL = """
+WITH target_stocks AS (
+    SELECT stock_id, annual_return AS annual_ret
+    FROM annual_return_bins
+    WHERE year = %(year)s AND price_field = %(price_field)s
+),
+latest_remarks AS (
+    SELECT DISTINCT ON (stock_id) stock_id, remark
+    FROM monthly_revenue
+    WHERE period BETWEEN %(start_period)s AND %(end_period)s
+      AND remark IS NOT NULL AND remark <> '-' AND remark <> ''
+    ORDER BY stock_id, report_month DESC
+)
+SELECT m.stock_id, m.stock_name, t.annual_ret, AVG(m.yoy_pct), AVG(m.mom_pct),
+       STDDEV(m.yoy_pct), STDDEV(m.mom_pct), r.remark
+FROM monthly_revenue m
+JOIN target_stocks t ON m.stock_id = t.stock_id
+LEFT JOIN latest_remarks r ON m.stock_id = r.stock_id
+WHERE t.annual_ret >= %(ret_lo)s AND t.annual_ret < %(ret_hi)s
+  AND m.period BETWEEN %(start_period)s AND %(end_period)s
+  AND (m.stock_name LIKE %(keyword)s OR (r.remark IS NOT NULL AND r.remark LIKE %(keyword)s))
+GROUP BY m.stock_id, m.stock_name, t.annual_ret, r.remark
+ORDER BY t.annual_ret DESC
+LIMIT %(limit)s
+"""
+
+
+def heatmap_params(years):
+    for year, price_field in itertools.product(years, ["year_close", "year_high"]):
+        start_period, end_period = observation_window(year)
+        yield {"year": str(year), "price_field": price_field,
+               "start_period": start_period, "end_period": end_period}
+
+
+def detail_params(years):
+    # 每個年度挑幾個常見區間 × 有無關鍵字，模擬使用者在深度挖掘區塊切換
+    for base, bin_order, keyword in itertools.product(heatmap_params(years), [9, 10, 11, 12], ["", "訂單"]):
+        ret_lo, ret_hi = DEFAULT_BINNING.bounds(bin_order)
+        yield dict(base, ret_lo=ret_lo, ret_hi=ret_hi, keyword=f"%{keyword}%", limit=50)
+
+
+CASES = {
+    "熱力圖樣本 (年度 × 價格欄位)": (HEATMAP_SAMPLES, heatmap_params),
+    "深度挖掘 (區間 × 關鍵字)": (BIN_DETAIL, detail_params),
+}
+
+
+def literal_sql(conn, query, params):
+    """舊寫法：把值直接展開成 SQL 文字"""
+    return psycopg.ClientCursor(conn).mogrify(query, params)
+
+
+def planning_ms(conn, query, params):
+    """字串拼接時每次都要付出的 Planning Time（EXPLAIN ANALYZE）"""
+    plan = conn.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + literal_sql(conn, query, params)).fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Planning Time"]
+
+
+def wall_ms(conn, query, param_sets, rounds, prepared):
+    """每次查詢的平均耗時 (ms)；prepared=False 時送出拼接好的 SQL 文字"""
+    elapsed = []
+    for _ in range(rounds):
+        for params in param_sets:
+            started = time.perf_counter()
+            if prepared:
+                conn.execute(query, params, prepare=True).fetchall()
+            else:
+                conn.execute(literal_sql(conn, query, params), prepare=False).fetchall()
+            elapsed.append((time.perf_counter() - started) * 1000)
+    return statistics.mean(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="prepared statement benchmark")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--years", nargs="+", type=int, default=list(range(2020, 2026)))
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("請以 --dsn 或 DATABASE_URL 指定資料庫連線字串")
+    dsn = args.dsn.replace("postgresql+psycopg://", "postgresql://").replace("postgresql+psycopg2://", "postgresql://")
+
+    with psycopg.connect(dsn, autocommit=True, prepare_threshold=None) as conn:
+        print(f"年度: {args.years[0]}~{args.years[-1]} | 重複次數: {args.rounds}")
+        print(f"{'查詢':<28} {'參數組數':>8} {'每次規劃 (ms)':>14} {'拼接 (ms)':>10} {'prepared (ms)':>14} {'加速':>7}")
+        for name, (query, make_params) in CASES.items():
+            param_sets = list(make_params(args.years))
+            plan = statistics.median(planning_ms(conn, query, p) for p in param_sets)
+            wall_ms(conn, query, param_sets, 1, prepared=False)  # 暖機，避免第一次讀盤影響結果
+            literal = wall_ms(conn, query, param_sets, args.rounds, prepared=False)
+            prepared = wall_ms(conn, query, param_sets, args.rounds, prepared=True)
+            speedup = literal / prepared if prepared else float("inf")
+            print(f"{name:<28} {len(param_sets):>8} {plan:>14.3f} {literal:>10.2f} {prepared:>14.2f} {speedup:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
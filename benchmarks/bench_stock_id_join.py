@@ -0,0 +1,100 @@
+"""
+stock_id 正規化前後的 JOIN 耗時比較
+
+用法：
+    python benchmarks/bench_stock_id_join.py --dsn "postgresql://..." [--year 2024] [--repeat 5]
+
+也可以用環境變數 DATABASE_URL 指定連線字串。
+需先執行 sql/001、sql/002 兩個 migration。
+"""
+import argparse
+import json
+import os
+import statistics
+
+from sqlalchemy import create_engine, text
+
+# ========== 比較用查詢：同一個結果，舊寫法 vs 新寫法 ==========
+CASES = {
+    "年度熱力圖 JOIN (年K x 月營收)": (
+        """
+        SELECT COUNT(*), AVG(m.yoy_pct)
+        FROM stock_annual_k k
+        JOIN monthly_revenue m ON SPLIT_PART(k.symbol, '.', 1) = m.stock_id
+        WHERE k.year = :year
+        """,
+        """
+        SELECT COUNT(*), AVG(m.yoy_pct)
+        FROM stock_annual_k k
+        JOIN monthly_revenue m ON k.stock_id = m.stock_id
+        WHERE k.year = :year
+        """,
+    ),
+    "全表 JOIN (月營收 x 全部年K)": (
+        """
+        SELECT COUNT(*)
+        FROM monthly_revenue m
+        JOIN stock_annual_k k ON SPLIT_PART(k.symbol, '.', 1) = m.stock_id
+        """,
+        """
+        SELECT COUNT(*)
+        FROM monthly_revenue m
+        JOIN stock_annual_k k ON k.stock_id = m.stock_id
+        """,
+    ),
+    "單一股票多年度查詢 (前後年度比較)": (
+        """
+        SELECT year, (year_close - year_open) / year_open * 100
+        FROM stock_annual_k
+        WHERE SPLIT_PART(symbol, '.', 1) = :stock_id
+        """,
+        """
+        SELECT year, (year_close - year_open) / year_open * 100
+        FROM stock_annual_k
+        WHERE stock_id = :stock_id
+        """,
+    ),
+}
+
+
+def explain_ms(conn, query, params):
+    """回傳 EXPLAIN ANALYZE 的 (planning, execution) 毫秒數"""
+    plan = conn.execute(text("EXPLAIN (ANALYZE, FORMAT JSON) " + query), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Planning Time"], plan[0]["Execution Time"]
+
+
+def run_case(conn, query, params, repeat):
+    explain_ms(conn, query, params)  # 暖機，避免第一次讀盤影響結果
+    timings = [explain_ms(conn, query, params) for _ in range(repeat)]
+    return (statistics.median(t[0] for t in timings),
+            statistics.median(t[1] for t in timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stock_id JOIN benchmark")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--year", default="2024")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("請以 --dsn 或 DATABASE_URL 指定資料庫連線字串")
+
+    engine = create_engine(args.dsn)
+    with engine.connect() as conn:
+        revenue_rows = conn.execute(text("SELECT COUNT(*) FROM monthly_revenue")).scalar()
+        stock_id = conn.execute(text("SELECT stock_id FROM stock_annual_k LIMIT 1")).scalar()
+        params = {"year": args.year, "stock_id": stock_id}
+
+        print(f"monthly_revenue 筆數: {revenue_rows:,} | 重複次數: {args.repeat}")
+        print(f"{'查詢':<32} {'SPLIT_PART (ms)':>16} {'stock_id (ms)':>14} {'加速':>7}")
+        for name, (old_sql, new_sql) in CASES.items():
+            _, old_exec = run_case(conn, old_sql, params, args.repeat)
+            _, new_exec = run_case(conn, new_sql, params, args.repeat)
+            speedup = old_exec / new_exec if new_exec else float("inf")
+            print(f"{name:<32} {old_exec:>16.2f} {new_exec:>14.2f} {speedup:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
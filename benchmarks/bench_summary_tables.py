@@ -0,0 +1,139 @@
+"""
+摘要表建構：逐列迴圈 vs 欄式運算 的耗時比較（不需要資料庫）
+
+比較對象：
+- 期望值評分 calculate_expected_value（原本 df.iterrows() 逐列組 dict）
+- 爆發次數統計表的 Python 分組統計（原本對 groupby 的每一組組 dict）
+- AI 提示詞的 Markdown 表格（原本 iterrows() 逐列組字串）
+
+以隨機產生的爆發次數統計表模擬更大的 hits / 區間網格，並先確認兩種寫法結果相同。
+
+用法：
+    python benchmarks/bench_summary_tables.py [--rows 100 1000 10000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 專案根目錄
+from summary_tables import calculate_expected_value, markdown_table
+
+
+# ========== 舊寫法（逐列迴圈，僅供比較） ==========
+def legacy_expected_value(df):
+    results = []
+    for _, row in df.iterrows():
+        avg_return = row["平均年度漲幅%"]
+        expected_value = avg_return * row["股票檔數"]
+        std_dev = max(row.get("標準差%", 1), 1)
+        risk_adjusted = avg_return / std_dev if std_dev > 0 else 0
+        success_adjusted = avg_return * row["勝率(>20%)"] / 100
+        results.append({
+            "爆發次數": row["爆發次數"],
+            "股票檔數": row["股票檔數"],
+            "平均年度漲幅%": avg_return,
+            "中位數漲幅%": row["中位數漲幅%"],
+            "平均-中位差": round(avg_return - row["中位數漲幅%"], 1),
+            "勝率(>20%)": row["勝率(>20%)"],
+            "翻倍率(>100%)": row["翻倍率(>100%)"],
+            "期望值分數": round(expected_value / 100, 2) if expected_value != 0 else 0,
+            "風險調整分數": round(risk_adjusted, 2),
+            "成功率分數": round(success_adjusted, 2),
+            "綜合評分": round((expected_value / 100 + risk_adjusted + success_adjusted) / 3, 2)
+            if expected_value != 0 else 0,
+        })
+    return pd.DataFrame(results)
+
+
+def legacy_prob_stats(raw_df):
+    result = []
+    for hits, group in raw_df.groupby('hits'):
+        ret_series = group['ret']
+        result.append({
+            "爆發次數": hits,
+            "股票檔數": len(group),
+            "平均年度漲幅%": round(ret_series.mean(), 1),
+            "中位數漲幅%": round(ret_series.median(), 1),
+            "勝率(>20%)": round((ret_series > 20).sum() / len(group) * 100, 1),
+            "翻倍率(>100%)": round((ret_series > 100).sum() / len(group) * 100, 1),
+            "最低漲幅%": round(ret_series.min(), 1),
+            "最高漲幅%": round(ret_series.max(), 1),
+            "標準差%": round(ret_series.std(), 1) if len(group) > 1 else 0,
+        })
+    return pd.DataFrame(result).sort_values("爆發次數", ascending=False)
+
+
+def legacy_markdown(df):
+    header = "| " + " | ".join(df.columns) + " |"
+    sep = "| " + " | ".join(["---"] * len(df.columns)) + " |"
+    rows = ["| " + " | ".join(map(str, row.values)) + " |" for _, row in df.iterrows()]
+    return "\n".join([header, sep] + rows)
+
+
+# ========== 新寫法（欄式分組統計） ==========
+def columnar_prob_stats(raw_df):
+    ret = raw_df['ret']
+    grouped = raw_df.assign(over_20=ret > 20, over_100=ret > 100).groupby('hits')
+    count = grouped.size()
+    return pd.DataFrame({
+        "爆發次數": count.index,
+        "股票檔數": count.to_numpy(),
+        "平均年度漲幅%": grouped['ret'].mean().round(1).to_numpy(),
+        "中位數漲幅%": grouped['ret'].median().round(1).to_numpy(),
+        "勝率(>20%)": (grouped['over_20'].sum() / count * 100).round(1).to_numpy(),
+        "翻倍率(>100%)": (grouped['over_100'].sum() / count * 100).round(1).to_numpy(),
+        "最低漲幅%": grouped['ret'].min().round(1).to_numpy(),
+        "最高漲幅%": grouped['ret'].max().round(1).to_numpy(),
+        "標準差%": grouped['ret'].std().round(1).where(count > 1, 0).to_numpy(),
+    }).sort_values("爆發次數", ascending=False)
+
+
+# ========== 測試資料 ==========
+def make_raw(n_groups, rng):
+    """每個爆發次數約 20 檔股票的 (hits, ret) 原始樣本，報酬為右偏分佈"""
+    hits = rng.integers(1, n_groups + 1, size=n_groups * 20)
+    ret = rng.lognormal(3.5, 1.0, size=len(hits)) - 40
+    return pd.DataFrame({"hits": hits, "ret": ret})
+
+
+def check_same(name, old, new):
+    """確認兩種寫法的結果相同（四捨五入的最後一位容許 1 個單位的差異）"""
+    old = old.reset_index(drop=True).astype(float)
+    new = new.reset_index(drop=True).astype(float)
+    pd.testing.assert_frame_equal(old, new, check_dtype=False, atol=0.0100001)
+    print(f"  ✅ {name}: 結果一致")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="summary table builder benchmark")
+    parser.add_argument("--rows", nargs="+", type=int, default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'函式':<24} {'列數':>8} {'逐列 (ms)':>11} {'欄式 (ms)':>11} {'加速':>8}")
+    for n in args.rows:
+        raw = make_raw(n, rng)
+        prob = legacy_prob_stats(raw)
+        check_same("機率統計", prob, columnar_prob_stats(raw))
+        check_same("期望值評分", legacy_expected_value(prob), calculate_expected_value(prob))
+        assert legacy_markdown(prob.astype(float)) == markdown_table(prob.astype(float))
+
+        cases = {
+            "機率統計 (groupby)": (lambda: legacy_prob_stats(raw), lambda: columnar_prob_stats(raw)),
+            "期望值評分": (lambda: legacy_expected_value(prob), lambda: calculate_expected_value(prob)),
+            "Markdown 表格": (lambda: legacy_markdown(prob), lambda: markdown_table(prob)),
+        }
+        for name, (old, new) in cases.items():
+            old_ms = min(timeit.repeat(old, number=1, repeat=args.repeat)) * 1000
+            new_ms = min(timeit.repeat(new, number=1, repeat=args.repeat)) * 1000
+            print(f"{name:<24} {len(prob):>8} {old_ms:>11.2f} {new_ms:>11.2f} {old_ms / new_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
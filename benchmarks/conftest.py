@@ -0,0 +1,57 @@
+"""
+fetch 函式基準測試 (pytest-benchmark) 的選項與資料來源
+
+    pytest benchmarks --bench-snapshot data/synthetic
+    pytest benchmarks --bench-dsn "postgresql://..."
+
+沒有指定 --bench-snapshot / --bench-dsn 時跳過（一般的 pytest 執行不跑基準測試）。
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 專案根目錄
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("srl-bench", "fetch 函式基準測試")
+    group.addoption("--bench-snapshot", help="本機 Parquet 快照目錄（DuckDB）；不存在時先產生合成資料")
+    group.addoption("--bench-dsn", help="Postgres 連線字串（先以 synthetic_data.py --dsn 寫入合成資料）")
+    group.addoption("--bench-scale", type=float, default=1, help="--bench-snapshot 不存在時產生的資料規模")
+    group.addoption("--bench-year", default=None, help="分析年度（預設為資料中最後一個完整年度）")
+    group.addoption("--bench-rounds", type=int, default=3, help="每個函式執行幾次（每次清空快取）")
+
+
+@pytest.fixture(scope="session")
+def da(request):
+    """依選項設定 backend 後 import data_access（backend 設定須在 import 之前決定）"""
+    snapshot = request.config.getoption("--bench-snapshot", None)
+    dsn = request.config.getoption("--bench-dsn", None)
+    if not snapshot and not dsn:
+        pytest.skip("需要 --bench-snapshot 或 --bench-dsn")
+
+    if snapshot:
+        if not os.path.isdir(snapshot):
+            from synthetic_data import BASE_STOCKS, write_snapshot
+            write_snapshot(snapshot, n_stocks=int(BASE_STOCKS * request.config.getoption("--bench-scale")))
+        os.environ["SRL_BACKEND"] = "local"
+        os.environ["SRL_SNAPSHOT_DIR"] = os.path.abspath(snapshot)
+    else:
+        os.environ["SRL_BACKEND"] = "postgres"
+        os.environ["SRL_DATABASE_URL"] = dsn
+    os.environ["SRL_RESULT_CACHE"] = "0"  # 量測完整成本，不讀 result_cache 的共用快取
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    # 不在 streamlit run 底下執行，關掉「No runtime found」之類的提示
+    # （設定檔解析時會重設 log level，先觸發解析再調整）
+    config.get_option("logger.level")
+    set_log_level("error")
+    import data_access
+    return data_access
+
+
+@pytest.fixture(scope="session")
+def bench_year(request, da):
+    year = request.config.getoption("--bench-year", None)
+    return str(year or da.read_sql("SELECT MAX(year) AS y FROM stock_annual_k").iloc[0, 0])
@@ -0,0 +1,311 @@
+"""
+合成台股資料集（基準測試用，可重現）
+
+產生與正式資料庫相同欄位的三張原始資料表：
+- stock_annual_k   年K（由周K彙總，開/高/低/收一致）
+- monthly_revenue  月營收（民國年 'YYY_MM'、年增 yoy_pct / 月增 mom_pct、備註）
+- stock_weekly_k   周K（幾何隨機漫步 + 市場因子，營收爆發後的月份帶一點正向漂移）
+
+以及 sql/001、004、005 migration 建立的衍生表（annual_return_bins、weekly_returns、
+spark_event_log），計算方式與 migration 相同，本機快照可以直接給 DuckDB 使用。
+
+規模：預設 2,000 檔 × 20 年（約 48 萬筆月營收、208 萬筆周K），--scale 10 為 2 萬檔；
+依股票分批產生並寫入，記憶體用量與批次大小成正比。同一組參數與 seed 產生的資料完全相同。
+
+用法：
+    python benchmarks/synthetic_data.py --out data/synthetic                 # 本機 Parquet 快照
+    python benchmarks/synthetic_data.py --scale 10 --out data/synthetic_x10
+    python benchmarks/synthetic_data.py --dsn "postgresql://..." --replace   # 寫入 Postgres 並執行 sql/ migration
+"""
+import argparse
+import io
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)  # 專案根目錄
+from binning import DEFAULT_BINNING
+from snapshot import MANIFEST_FILE
+
+BASE_STOCKS = 2000
+BASE_YEARS = 20
+LAST_YEAR = 2025
+CHUNK_STOCKS = 500
+
+BASE_TABLES = ["stock_annual_k", "monthly_revenue", "stock_weekly_k"]
+DERIVED_TABLES = ["annual_return_bins", "weekly_returns", "spark_event_log"]
+MIGRATIONS = ["001_annual_return_bins.sql", "002_stock_id_columns.sql", "003_report_period.sql",
+              "004_weekly_returns.sql", "005_spark_event_log.sql", "006_data_version_indexes.sql"]
+
+# 備註：大多數月份沒有備註（'-' 或空白），少數帶有頁面常搜尋的關鍵字
+REMARKS = np.array(["-", "", None, "訂單增加", "CoWoS 需求", "建案入帳", "新機上市", "客戶拉貨", "匯率影響"],
+                   dtype=object)
+REMARK_WEIGHTS = np.array([0.55, 0.15, 0.05, 0.06, 0.04, 0.04, 0.04, 0.04, 0.03])
+
+
+# ========== 1. 原始資料表 ==========
+def stock_codes(n_stocks):
+    """股票代號 '1101' 起算；偶數上市 (.TW)、奇數上櫃 (.TWO)"""
+    ids = np.array([str(1101 + i) for i in range(n_stocks)], dtype=object)
+    suffix = np.where(np.arange(n_stocks) % 2 == 0, ".TW", ".TWO").astype(object)
+    return ids, ids + suffix
+
+
+def generate_chunk(stock_ids, symbols, first_year, last_year, rng):
+    """一批股票的三張原始資料表（DataFrame dict，欄位與正式資料庫相同，不含生成欄位）"""
+    n = len(stock_ids)
+    n_months = (last_year - first_year + 1) * 12
+    years = np.repeat(np.arange(first_year, last_year + 1), 12)
+    months = np.tile(np.arange(1, 13), last_year - first_year + 1)
+
+    # --- 月營收：對數營收隨機漫步 + 季節性 + 偶發的爆發期（多取 13 個月計算 yoy / mom）---
+    total = n_months + 13
+    season = rng.normal(0, 0.08, size=(n, 12))[:, np.arange(total) % 12]
+    log_rev = np.cumsum(rng.normal(0.004, 0.06, size=(n, total)), axis=1) + season
+    burst_start = rng.random((n, total)) < 0.015
+    burst = np.zeros((n, total))
+    for lag in range(4):  # 爆發期延續約 4 個月
+        burst[:, lag:] += burst_start[:, :total - lag] * rng.lognormal(-0.3, 0.5, size=(n, 1))
+    revenue = np.exp(log_rev + burst) * rng.lognormal(10, 1.5, size=(n, 1))
+    yoy = np.round((revenue[:, 13:] / revenue[:, 1:-12] - 1) * 100, 2)
+    mom = np.round((revenue[:, 13:] / revenue[:, 12:-1] - 1) * 100, 2)
+    yoy[rng.random(yoy.shape) < 0.003] = np.nan  # 少數缺值
+    mom[rng.random(mom.shape) < 0.003] = np.nan
+
+    monthly_revenue = pd.DataFrame({
+        "stock_id": np.repeat(stock_ids, n_months),
+        "stock_name": np.repeat("合成" + stock_ids, n_months),
+        "report_month": np.tile([f"{y - 1911}_{m:02d}" for y, m in zip(years, months)], n),
+        "yoy_pct": yoy.ravel(),
+        "mom_pct": mom.ravel(),
+        "remark": rng.choice(REMARKS, size=n * n_months, p=REMARK_WEIGHTS),
+    })
+
+    # --- 周K：市場因子 + 個股波動；營收公告（次月10日）後的一個月帶正向漂移 ---
+    dates = pd.date_range(f"{first_year}-01-01", f"{last_year}-12-31", freq="W-FRI")
+    n_weeks = len(dates)
+    # 每週對應到「最近一次公告的營收月份」的索引（公告日 = 報表月份的次月10日）
+    announced = (dates.year - first_year) * 12 + dates.month - 2 - (dates.day < 10)
+    announced = np.clip(announced.to_numpy(), 0, n_months - 1)
+    surprise = np.clip(np.nan_to_num(yoy[:, announced]), -50, 200) / 100
+
+    market = rng.normal(0.0015, 0.025, size=n_weeks)
+    beta = rng.uniform(0.5, 1.5, size=(n, 1))
+    vol = rng.uniform(0.03, 0.08, size=(n, 1))
+    log_ret = beta * market + rng.normal(0, 1, size=(n, n_weeks)) * vol + surprise * 0.004
+    close = rng.uniform(10, 300, size=(n, 1)) * np.exp(np.cumsum(log_ret, axis=1))
+    prev_close = np.concatenate([close[:, :1], close[:, :-1]], axis=1)
+    open_ = prev_close * (1 + rng.normal(0, 0.005, size=close.shape))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.02, size=close.shape)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.02, size=close.shape)))
+
+    stock_weekly_k = pd.DataFrame({
+        "symbol": np.repeat(symbols, n_weeks),
+        "date": np.tile(dates.date, n),
+        "w_open": open_.ravel(), "w_high": high.ravel(), "w_low": low.ravel(), "w_close": close.ravel(),
+    })
+
+    # --- 年K：由周K彙總（每年第一週開盤、最後一週收盤、最高/最低）---
+    year_start = np.flatnonzero(np.r_[True, np.diff(dates.year) != 0])
+    year_end = np.r_[year_start[1:], n_weeks] - 1
+    n_years = len(year_start)
+    stock_annual_k = pd.DataFrame({
+        "symbol": np.repeat(symbols, n_years),
+        "year": np.tile(dates.year[year_start].astype(str).to_numpy(), n),
+        "year_open": open_[:, year_start].ravel(),
+        "year_high": np.maximum.reduceat(high, year_start, axis=1).ravel(),
+        "year_low": np.minimum.reduceat(low, year_start, axis=1).ravel(),
+        "year_close": close[:, year_end].ravel(),
+    })
+
+    return {"stock_annual_k": stock_annual_k, "monthly_revenue": monthly_revenue,
+            "stock_weekly_k": stock_weekly_k}
+
+
+# ========== 2. 衍生表（與 sql/ migration 相同的計算） ==========
+def add_generated_columns(base):
+    """Postgres 生成欄位：stock_id (002)、period (003)"""
+    out = dict(base)
+    for table in ("stock_annual_k", "stock_weekly_k"):
+        out[table] = base[table].assign(stock_id=base[table]["symbol"].str.split(".").str[0])
+    rm = base["monthly_revenue"]["report_month"].str.split("_", expand=True).astype(int)
+    out["monthly_revenue"] = base["monthly_revenue"].assign(period=(rm[0] + 1911) * 100 + rm[1])
+    return out
+
+
+def annual_return_bins(annual_k):
+    """sql/001：每檔股票 × 年度 × 價格欄位的漲幅與區間"""
+    frames = []
+    for price_field in ("year_close", "year_high"):
+        ret = (annual_k[price_field] - annual_k["year_open"]) / annual_k["year_open"].replace(0, np.nan) * 100
+        valid = ret.notna().to_numpy()
+        bin_order, return_bin = DEFAULT_BINNING.apply(ret[valid])
+        frames.append(pd.DataFrame({
+            "symbol": annual_k["symbol"].to_numpy()[valid],
+            "year": annual_k["year"].to_numpy()[valid],
+            "price_field": price_field,
+            "annual_return": ret.to_numpy()[valid],
+            "return_bin": return_bin,
+            "bin_order": bin_order.astype(np.int64),
+            "stock_id": annual_k["stock_id"].to_numpy()[valid],
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def weekly_returns(weekly_k):
+    """sql/004：每週收盤價 / 最高價相對上週的報酬 (%)"""
+    k = weekly_k.sort_values(["symbol", "date"])
+    grouped = k.groupby("symbol", sort=False)
+    prev_close = grouped["w_close"].shift().replace(0, np.nan)
+    prev_high = grouped["w_high"].shift().replace(0, np.nan)
+    return pd.DataFrame({
+        "symbol": k["symbol"], "date": k["date"], "w_close": k["w_close"], "w_high": k["w_high"],
+        "ret_close": (k["w_close"] - prev_close) / prev_close * 100,
+        "ret_high": (k["w_high"] - prev_high) / prev_high * 100,
+        "stock_id": k["stock_id"],
+    }).reset_index(drop=True)
+
+
+def spark_event_log(revenue):
+    """sql/005：每檔股票每個月份、每個指標的「上一筆 -> 本月」，只保留可能成為事件的列"""
+    frames = []
+    base_date = (pd.to_datetime((revenue["period"] * 100 + 10).astype(str), format="%Y%m%d")
+                 + pd.DateOffset(months=1)).dt.date
+    for metric in ("yoy_pct", "mom_pct"):
+        r = revenue.assign(metric=metric, value=revenue[metric], base_date=base_date) \
+            .sort_values(["stock_id", "period"], kind="stable")
+        grouped = r.groupby("stock_id", sort=False)
+        r = r.assign(prev_value=grouped["value"].shift(), prev_period=grouped["period"].shift())
+        prev_dec = (r["period"] // 100 - 1) * 100 + 12
+        candidate = r["value"].notna() & (r["prev_value"].isna() | (r["prev_value"] < r["value"])
+                                          | (r["prev_period"] < prev_dec))
+        frames.append(r.loc[candidate, ["stock_id", "period", "metric", "report_month", "stock_name", "remark",
+                                        "value", "prev_value", "prev_period", "base_date"]])
+    return pd.concat(frames, ignore_index=True)
+
+
+def derive_tables(tables):
+    """原始資料表（含生成欄位）-> 三張衍生表"""
+    return {
+        "annual_return_bins": annual_return_bins(tables["stock_annual_k"]),
+        "weekly_returns": weekly_returns(tables["stock_weekly_k"]),
+        "spark_event_log": spark_event_log(tables["monthly_revenue"]),
+    }
+
+
+def iter_chunks(n_stocks=BASE_STOCKS, n_years=BASE_YEARS, last_year=LAST_YEAR, seed=0,
+                chunk_stocks=CHUNK_STOCKS):
+    """依股票分批產生原始資料表；每批使用由 seed 衍生的獨立亂數，結果與批次大小無關以外的因素皆固定"""
+    stock_ids, symbols = stock_codes(n_stocks)
+    first_year = last_year - n_years + 1
+    seeds = np.random.SeedSequence(seed).spawn((n_stocks + chunk_stocks - 1) // chunk_stocks)
+    for i, start in enumerate(range(0, n_stocks, chunk_stocks)):
+        end = min(start + chunk_stocks, n_stocks)
+        yield generate_chunk(stock_ids[start:end], symbols[start:end], first_year, last_year,
+                             np.random.default_rng(seeds[i]))
+
+
+# ========== 3. 輸出：本機 Parquet 快照 ==========
+def write_snapshot(out_dir, **kwargs):
+    """寫成 snapshot.connect_snapshot 可直接讀取的目錄（含衍生表與 manifest）"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(out_dir, exist_ok=True)
+    writers, counts = {}, {t: 0 for t in BASE_TABLES + DERIVED_TABLES}
+    try:
+        for chunk in iter_chunks(**kwargs):
+            tables = add_generated_columns(chunk)
+            tables.update(derive_tables(tables))
+            for table, df in tables.items():
+                batch = pa.Table.from_pandas(df, preserve_index=False)
+                if table not in writers:
+                    writers[table] = pq.ParquetWriter(os.path.join(out_dir, f"{table}.parquet"), batch.schema)
+                writers[table].write_table(batch.cast(writers[table].schema))
+                counts[table] += len(df)
+            print(f"  … {counts['monthly_revenue']:,} 筆月營收")
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    manifest = {"exported_at": datetime.now().isoformat(timespec="seconds"),
+                "synthetic": kwargs, "tables": counts}
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+# ========== 4. 輸出：Postgres ==========
+BASE_DDL = {
+    "stock_annual_k": "symbol TEXT, year TEXT, year_open DOUBLE PRECISION, year_high DOUBLE PRECISION, "
+                      "year_low DOUBLE PRECISION, year_close DOUBLE PRECISION",
+    "monthly_revenue": "stock_id TEXT, stock_name TEXT, report_month TEXT, yoy_pct DOUBLE PRECISION, "
+                       "mom_pct DOUBLE PRECISION, remark TEXT",
+    "stock_weekly_k": "symbol TEXT, date DATE, w_open DOUBLE PRECISION, w_high DOUBLE PRECISION, "
+                      "w_low DOUBLE PRECISION, w_close DOUBLE PRECISION",
+    "stock_prices": "symbol TEXT, date DATE, close DOUBLE PRECISION",
+}
+
+
+def load_postgres(dsn, replace=False, **kwargs):
+    """建立原始資料表、以 COPY 分批寫入，再依序執行 sql/ migration 建立衍生表與 trigger"""
+    import psycopg
+
+    dsn = dsn.replace("postgresql+psycopg://", "postgresql://")
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        existing = conn.execute("SELECT to_regclass('monthly_revenue') IS NOT NULL").fetchone()[0]
+        if existing and not replace:
+            raise SystemExit("❌ 資料庫已有 monthly_revenue，確定要覆蓋請加上 --replace")
+        for table in list(BASE_DDL) + DERIVED_TABLES:
+            conn.execute(f"DROP TABLE IF EXISTS {table} CASCADE")
+        for table, ddl in BASE_DDL.items():
+            conn.execute(f"CREATE TABLE {table} ({ddl})")
+
+        counts = {t: 0 for t in BASE_TABLES}
+        for chunk in iter_chunks(**kwargs):
+            # 日K只用來取最新資料日期，以每檔股票最後一週的收盤價代替
+            weekly = chunk["stock_weekly_k"]
+            chunk["stock_prices"] = weekly[weekly["date"] == weekly["date"].max()][["symbol", "date", "w_close"]]
+            for table, df in chunk.items():
+                buffer = io.StringIO()
+                df.to_csv(buffer, index=False, header=False, na_rep="\\N")  # 區分 NULL 與空字串備註
+                with conn.cursor().copy(f"COPY {table} FROM STDIN (FORMAT CSV, NULL '\\N')") as copy:
+                    copy.write(buffer.getvalue())
+                counts[table] = counts.get(table, 0) + len(df)
+            print(f"  … {counts['monthly_revenue']:,} 筆月營收")
+
+        for name in MIGRATIONS:
+            with open(os.path.join(ROOT, "sql", name), encoding="utf-8") as f:
+                conn.execute(f.read())
+            print(f"✅ {name}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="產生 StockRevenueLab 合成資料集")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--out", help="本機 Parquet 快照輸出目錄")
+    target.add_argument("--dsn", help="寫入的 Postgres 連線字串（會重建原始資料表）")
+    parser.add_argument("--replace", action="store_true", help="--dsn 時允許覆蓋既有資料表")
+    parser.add_argument("--scale", type=float, default=1, help="股票檔數倍率（1 = 2,000 檔）")
+    parser.add_argument("--years", type=int, default=BASE_YEARS, help=f"年數（截至 {LAST_YEAR} 年）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    kwargs = {"n_stocks": int(BASE_STOCKS * args.scale), "n_years": args.years, "seed": args.seed}
+    print(f"🧪 合成資料：{kwargs['n_stocks']:,} 檔 × {args.years} 年 (seed={args.seed})")
+    if args.out:
+        manifest = write_snapshot(args.out, **kwargs)
+        print(f"📦 快照完成：{args.out} {manifest['tables']}")
+    else:
+        counts = load_postgres(args.dsn, args.replace, **kwargs)
+        print(f"📦 寫入完成：{counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+data_access 各 fetch 函式的耗時基準（合成資料集，DuckDB 或 Postgres），使用 pytest-benchmark
+
+每一輪執行前先清空 st.cache_data，量到的是快取未命中時的完整成本（查詢 + 本機統計）。
+結果以 pytest-benchmark 的 --benchmark-autosave / --benchmark-compare 存檔與比較，
+--benchmark-compare-fail 讓中位數退步超過容許範圍時以非 0 結束，方便在 CI 或改版前後手動比對。
+
+用法：
+    python benchmarks/synthetic_data.py --out data/synthetic
+    pytest benchmarks --bench-snapshot data/synthetic --benchmark-autosave
+    pytest benchmarks --bench-snapshot data/synthetic --benchmark-compare --benchmark-compare-fail=median:25%
+
+    # Postgres（先以 synthetic_data.py --dsn 寫入合成資料）
+    pytest benchmarks --bench-dsn "postgresql://..."
+
+--bench-snapshot 目錄不存在時會先以 --bench-scale 產生合成資料；其餘選項見 benchmarks/conftest.py。
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+CASES = (
+    "fetch_heatmap_data", "fetch_stat_summary", "fetch_bin_detail", "select_prob_range", "fetch_prob_surface",
+    "fetch_multi_year_stats", "fetch_burst_detail", "fetch_timing_data", "fetch_timing_sweep_data",
+    "fetch_timing_sweep_data_all_years", "fetch_event_weekly_returns", "fetch_market_weekly_returns",
+)
+
+
+def build_cases(da, year, metric="yoy_pct"):
+    """案例名稱 -> 無參數函式；參數對應頁面預設的側邊欄選項"""
+    years = tuple(str(y) for y in range(int(year) - 5, int(year) + 1))
+    binning = da.get_return_binning(year, "year_close")
+    top_bin = binning.labels[min(len(binning.labels) - 1, 11)]  # 上漲0-100%：檔數最多的區間之一
+
+    return {
+        "fetch_heatmap_data": lambda: da.fetch_heatmap_data(year, metric, "year_close"),
+        "fetch_stat_summary": lambda: da.fetch_stat_summary(year, metric, "year_close"),
+        "fetch_bin_detail": lambda: da.fetch_bin_detail(year, "year_close", top_bin, "訂單", 50),
+        "select_prob_range": lambda: da.select_prob_range(da.fetch_prob_surface(year, metric, "year_close"),
+                                                          100, 1000),
+        "fetch_prob_surface": lambda: da.fetch_prob_surface(year, metric, "year_close"),
+        "fetch_multi_year_stats": lambda: da.fetch_multi_year_stats(year, metric, 100, 1000, "year_close"),
+        "fetch_burst_detail": lambda: da.fetch_burst_detail(year, metric, 100, 1000, "year_close", 1),
+        "fetch_timing_data": lambda: da.fetch_timing_data(year, metric, 100, "", "w_close"),
+        "fetch_timing_sweep_data": lambda: da.fetch_timing_sweep_data(year, metric, "", "w_close", (30, 300)),
+        "fetch_timing_sweep_data_all_years": lambda: da.fetch_timing_sweep_data(years, metric, "", "w_close",
+                                                                               (30, 300)),
+        "fetch_event_weekly_returns": lambda: da.fetch_event_weekly_returns(year, metric, (30, 300), "",
+                                                                            "w_close", 8, 12),
+        "fetch_market_weekly_returns": lambda: da.fetch_market_weekly_returns(f"{year}-01-01", f"{year}-12-31",
+                                                                              "w_close"),
+    }
+
+
+@pytest.fixture(scope="module")
+def cases(da, bench_year):
+    return build_cases(da, bench_year)
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_fetch(benchmark, request, da, cases, name):
+    import streamlit as st
+
+    def clear():
+        st.cache_data.clear()
+        da.get_data_version()  # 資料版本的探測查詢不算進函式耗時
+
+    benchmark.group = "fetch"
+    result = benchmark.pedantic(cases[name], setup=clear, rounds=request.config.getoption("--bench-rounds"))
+    benchmark.extra_info["rows"] = len(result)
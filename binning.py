@@ -0,0 +1,109 @@
+"""
+年度股價漲幅分組 (ReturnBinning)
+
+熱力圖、統計摘要與深度挖掘都依「年度股價漲幅區間」分組。區間原本寫死在
+SQL 的 CASE 裡（下跌每10%、上漲每100%），這裡改成 edges + labels 的定義，
+用 np.digitize 對已快取的漲幅陣列分組，切換分組方式不需要重新查詢資料庫。
+
+區間規則（與 sql/001 的 classify_annual_return 一致）：
+    bin 0          : ret <= edges[0]        （最低區間包含上界）
+    bin i (1..N-1) : edges[i-1] <= ret < edges[i]（bin 1 不含下界）
+    bin N          : ret >= edges[-1]
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+
+def _fmt(value):
+    """區間端點顯示：整數不帶小數，分位數邊界保留一位"""
+    return f"{round(float(value), 1) + 0.0:g}"
+
+
+def make_bin_labels(edges):
+    """依 edges 產生排序用編號 + 中文描述的區間名稱，例如 '01. 下跌-100%至-90%'"""
+    edges = list(edges)
+    labels = []
+    for i in range(len(edges) + 1):
+        if i == 0:
+            lo, hi = None, edges[0]
+            text = f"{'下跌' if hi <= 0 else ''}{_fmt(hi)}%以下"
+        elif i == len(edges):
+            lo, hi = edges[-1], None
+            text = f"{'上漲' if lo >= 0 else ''}{_fmt(lo)}%以上"
+        else:
+            lo, hi = edges[i - 1], edges[i]
+            if hi <= 0:
+                text = f"下跌{_fmt(lo)}%至{_fmt(hi)}%"
+            elif lo >= 0:
+                text = f"上漲{_fmt(lo)}-{_fmt(hi)}%"
+            else:
+                text = f"{_fmt(lo)}%至{_fmt(hi)}%"
+        labels.append(f"{i:02d}. {text}")
+    return labels
+
+
+@dataclass(frozen=True)
+class ReturnBinning:
+    """年度漲幅 (%) 的分組定義：len(labels) == len(edges) + 1"""
+    edges: tuple
+    labels: tuple
+
+    @classmethod
+    def from_edges(cls, edges):
+        edges = tuple(float(e) for e in edges)
+        return cls(edges, tuple(make_bin_labels(edges)))
+
+    @classmethod
+    def from_quantiles(cls, returns, n_bins):
+        """依樣本分位數切成 n_bins 組（各組檔數大致相同），重複的邊界會合併"""
+        returns = np.asarray(returns, dtype=np.float64)
+        returns = returns[np.isfinite(returns)]
+        if len(returns) == 0:
+            return cls.from_edges([0.0])
+        qs = np.linspace(0, 1, n_bins + 1)[1:-1]
+        return cls.from_edges(np.unique(np.quantile(returns, qs)))
+
+    def apply(self, returns):
+        """回傳 (bin_order, return_bin) 兩個與 returns 等長的陣列"""
+        returns = np.asarray(returns, dtype=np.float64)
+        edges = np.asarray(self.edges)
+        order = np.digitize(returns, edges, right=False)
+        order[returns == edges[0]] = 0  # 最低區間包含上界
+        return order, np.asarray(self.labels, dtype=object)[order]
+
+    def bounds(self, bin_order):
+        """
+        區間對應的半開範圍 [lo, hi)，開放端為 ±inf，方便直接當成 SQL 參數：
+        bin 0 的上界與 bin 1 的下界取 edges[0] 的下一個浮點數，
+        讓 ret <= edges[0] / ret > edges[0] 也能寫成 >= lo AND < hi。
+        """
+        first = np.nextafter(self.edges[0], np.inf)
+        lo = -np.inf if bin_order == 0 else first if bin_order == 1 else self.edges[bin_order - 1]
+        hi = first if bin_order == 0 else np.inf if bin_order == len(self.edges) else self.edges[bin_order]
+        return float(lo), float(hi)
+
+
+# 下跌每10%一個間隔，上漲每100%一個間隔（原本熱力圖的分組）
+DEFAULT_BINNING = ReturnBinning.from_edges(
+    list(range(-100, 0, 10)) + list(range(0, 1001, 100))
+)
+
+# 側邊欄可選的分組方式 -> ReturnBinning，或 int 代表依當年樣本切成幾個分位數
+BINNING_SCHEMES = {
+    "標準 (下跌10% / 上漲100%)": DEFAULT_BINNING,
+    "細分 (下跌5% / 上漲50%)": ReturnBinning.from_edges(
+        list(range(-100, 0, 5)) + list(range(0, 1001, 50))
+    ),
+    "五分位數 (各組檔數相同)": 5,
+    "十分位數 (各組檔數相同)": 10,
+}
+DEFAULT_BINNING_SCHEME = "標準 (下跌10% / 上漲100%)"
+
+
+def resolve_binning(scheme, returns=None):
+    """分組方式名稱 -> ReturnBinning；分位數分組需要傳入當年的漲幅樣本"""
+    binning = BINNING_SCHEMES.get(scheme, DEFAULT_BINNING)
+    if isinstance(binning, int):
+        return ReturnBinning.from_quantiles(returns if returns is not None else [], binning)
+    return binning
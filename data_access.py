@@ -0,0 +1,843 @@
+"""
+StockRevenueLab 資料存取層
+
+所有頁面 (app.py、pages/*.py) 共用同一個 SQLAlchemy engine 與連線池，
+各頁面的查詢也集中在這裡，頁面本身只負責 UI。
+
+連線池與 backend 參數可在 .streamlit/secrets.toml 的 [database] 區段覆寫：
+
+    [database]
+    backend = "postgres"          # "local" = 使用 snapshot.py 匯出的本機 Parquet + DuckDB
+    snapshot_dir = "data/snapshot"
+    pool_size = 5
+    max_overflow = 5
+    pool_pre_ping = true
+    pool_recycle = 1800
+    statement_timeout_ms = 30000
+    prepare_threshold = 5         # 同一條連線執行幾次後改用 server-side prepared statement；-1 = 停用
+
+所有查詢的值一律以 :name 綁定參數傳入，欄位名稱等識別字只能是白名單內的值，
+同一種查詢的 SQL 文字固定不變，Postgres 才能重用 prepared statement 的查詢計畫。
+
+backend 也可以用環境變數 SRL_BACKEND / SRL_SNAPSHOT_DIR 指定（優先於 secrets）。
+
+fetch_* 的結果除了 st.cache_data，還可以存到 worker / replica 共用的快取（磁碟或 Redis，
+result_cache.py 的 [result_cache] 區段），資料同步後以 warm_cache.py 預熱所有側邊欄組合。
+"""
+import os
+import re
+import sys
+from decimal import Decimal, ROUND_HALF_UP
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from sqlalchemy import create_engine, event, text
+
+from periods import observation_window, to_period, year_range
+from binning import DEFAULT_BINNING_SCHEME, resolve_binning
+from query_log import timed_query
+from result_cache import cache_data, set_data_version, set_key_context
+from stats_engine import grouped_stats
+
+# 查詢結果不依時間過期（快取鍵包含資料版本，資料更新後自然失效）；
+# 舊版本的結果留在記憶體裡，依 max_entries 淘汰最久未使用的項目
+CACHE_MAX_ENTRIES = 500
+DATA_VERSION_TTL = 60  # 秒；多久重新確認一次資料版本
+LATEST_DATE_TTL = 3600  # 秒；首頁「最新資料日期」的快取時間（日K不列入資料版本）
+
+# ========== 1. 連線池與 backend 設定 ==========
+DEFAULT_DB_SETTINGS = {
+    "backend": "postgres",
+    "snapshot_dir": "data/snapshot",
+    "dsn": None,                 # 直接指定連線字串（本機 Postgres / 基準測試）；未指定時由 secrets 組成
+    "pool_size": 5,              # 常駐連線數（所有頁面、所有 session 共用）
+    "max_overflow": 5,           # 尖峰時可額外借出的連線數
+    "pool_pre_ping": True,       # 借出前先檢查連線，避免 pooler 斷線後的錯誤
+    "pool_recycle": 1800,        # 秒；定期汰換連線，避免被 pooler 靜默關閉
+    "statement_timeout_ms": 30000,
+    "prepare_threshold": 5,      # psycopg 3：同一 SQL 執行第 N 次起改用 prepared statement
+}
+
+
+def get_db_settings():
+    """預設參數 + secrets [database] 區段 + 環境變數覆寫"""
+    settings = dict(DEFAULT_DB_SETTINGS)
+    try:
+        settings.update(st.secrets.get("database", {}))
+    except Exception:
+        pass  # 沒有 secrets.toml 時使用預設值
+    if os.environ.get("SRL_BACKEND"):
+        settings["backend"] = os.environ["SRL_BACKEND"]
+    if os.environ.get("SRL_SNAPSHOT_DIR"):
+        settings["snapshot_dir"] = os.environ["SRL_SNAPSHOT_DIR"]
+    if os.environ.get("SRL_DATABASE_URL"):
+        settings["dsn"] = os.environ["SRL_DATABASE_URL"]
+    return settings
+
+
+def is_local_backend():
+    return get_db_settings()["backend"] == "local"
+
+
+def _result_cache_context() -> str:
+    """磁碟結果快取的鍵前綴：不同 backend / 快照目錄的結果分開存放"""
+    settings = get_db_settings()
+    if settings["backend"] == "local":
+        return f"local:{os.path.abspath(settings['snapshot_dir'])}"
+    return "postgres"
+
+
+set_key_context(_result_cache_context)
+
+
+# ========== 2. 安全資料庫連線（全域唯一 engine） ==========
+@st.cache_resource
+def get_engine():
+    try:
+        settings = get_db_settings()
+        if settings["dsn"]:
+            # prepare_threshold 是 psycopg 3 的連線參數，一律使用 psycopg driver
+            connection_string = re.sub(r"^postgres(ql)?(\+\w+)?://", "postgresql+psycopg://", settings["dsn"])
+        else:
+            DB_PASSWORD = st.secrets["DB_PASSWORD"]
+            PROJECT_REF = st.secrets["PROJECT_REF"]
+            POOLER_HOST = st.secrets["POOLER_HOST"]
+            encoded_password = urllib.parse.quote_plus(DB_PASSWORD)
+            connection_string = f"postgresql+psycopg://postgres.{PROJECT_REF}:{encoded_password}@{POOLER_HOST}:5432/postgres?sslmode=require"
+
+        prepare_threshold = int(settings["prepare_threshold"])
+        engine = create_engine(
+            connection_string,
+            connect_args={"prepare_threshold": prepare_threshold if prepare_threshold >= 0 else None},
+            pool_size=int(settings["pool_size"]),
+            max_overflow=int(settings["max_overflow"]),
+            pool_pre_ping=bool(settings["pool_pre_ping"]),
+            pool_recycle=int(settings["pool_recycle"]),
+        )
+    except Exception:
+        st.error("❌ 資料庫連線失敗，請檢查 Streamlit Secrets 設定。")
+        st.stop()
+
+    timeout_ms = int(settings["statement_timeout_ms"])
+
+    @event.listens_for(engine, "connect")
+    def _set_statement_timeout(dbapi_conn, connection_record):
+        # 每條新連線設定一次，避免慢查詢長時間佔住 pooler 連線
+        with dbapi_conn.cursor() as cursor:
+            cursor.execute(f"SET statement_timeout = {timeout_ms}")
+        dbapi_conn.commit()
+
+    return engine
+
+
+@st.cache_resource
+def get_local_connection():
+    """本機快照模式：DuckDB in-memory 連線，Parquet 註冊為同名 view"""
+    from snapshot import connect_snapshot
+    try:
+        return connect_snapshot(get_db_settings()["snapshot_dir"])
+    except (RuntimeError, FileNotFoundError) as e:
+        st.error(f"❌ 本機快照載入失敗：{e}")
+        st.stop()
+
+
+# :name 綁定參數；(?<![:\w]) 避免把 ::numeric 這類轉型語法當成參數
+_BIND_PARAM = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+
+
+def _read_duckdb(con, query, params=None) -> pd.DataFrame:
+    """在 DuckDB 連線上執行 :name 參數的查詢"""
+    # DuckDB 的具名參數寫法是 $name，且不接受查詢中沒用到的參數
+    names = set(_BIND_PARAM.findall(query))
+    duck_params = {k: v for k, v in (params or {}).items() if k in names}
+    return con.execute(_BIND_PARAM.sub(r"$\1", query), duck_params or None).df()
+
+
+def _explain_duckdb(con, query, params=None):
+    """DuckDB 的 EXPLAIN ANALYZE（沒有 BUFFERS 選項），回傳計畫文字列"""
+    return _read_duckdb(con, "EXPLAIN ANALYZE " + query, params).iloc[:, -1].tolist()
+
+
+def read_sql(query, params=None) -> pd.DataFrame:
+    """
+    執行查詢並回傳 DataFrame（所有頁面查詢的共同出入口，值一律用 :name 綁定）
+    經由 query_log.timed_query 記錄耗時、列數與 SQL，慢查詢附上執行計畫
+    """
+    caller = sys._getframe(1).f_code.co_name  # 發出查詢的 fetch_* 函式
+    if is_local_backend():
+        # DuckDB 連線不可跨執行緒共用，每次查詢開一個 cursor
+        con = get_local_connection().cursor()
+        return timed_query(lambda: _read_duckdb(con, query, params), query, params, caller,
+                           explain=lambda: _explain_duckdb(con, query, params))
+    with get_engine().connect() as conn:
+        return timed_query(
+            lambda: pd.read_sql_query(text(query), conn, params=params), query, params, caller,
+            explain=lambda: conn.execute(text("EXPLAIN (ANALYZE, BUFFERS) " + query), params or {}).scalars().all(),
+        )
+
+
+# ========== 資料版本（所有查詢快取鍵的一部分） ==========
+# 每張資料表的最大期別，以 (period, ...)、(year)、(date) 索引讀取 (sql/003、sql/006)；
+# 衍生表 (annual_return_bins、weekly_returns、spark_event_log)
+# 由這三張表的 trigger 在同一個交易內更新，不必另外偵測
+DATA_VERSION_TABLES = {
+    "monthly_revenue": "period",
+    "stock_annual_k": "year",
+    "stock_weekly_k": "date",
+}
+
+
+@st.cache_data(ttl=DATA_VERSION_TTL, show_spinner=False)
+def get_data_version() -> str:
+    """
+    目前資料的版本字串，新的營收月份或股價批次寫入後改變
+
+    Postgres 另外加上 pg_stat_user_tables 的新增 / 更新 / 刪除累計數，
+    修正既有月份營收、補上缺漏股票這類不改變最大期別的寫入也會改變版本；
+    本機快照整批重新匯出，改用 manifest 的修改時間。
+    """
+    probes = [f"(SELECT MAX({col}) FROM {table})" for table, col in DATA_VERSION_TABLES.items()]
+    query = f"SELECT {', '.join(probes)}"
+    if is_local_backend():
+        from snapshot import MANIFEST_FILE
+        manifest = os.path.join(get_db_settings()["snapshot_dir"], MANIFEST_FILE)
+        exported = int(os.path.getmtime(manifest)) if os.path.exists(manifest) else 0
+        query += f", {exported}"
+    else:
+        names = ", ".join(f"'{table}'" for table in DATA_VERSION_TABLES)
+        query += f""",
+        (SELECT SUM(n_tup_ins + n_tup_upd + n_tup_del)::bigint FROM pg_stat_user_tables
+         WHERE relname IN ({names}))"""
+    row = read_sql(query).iloc[0]
+    return "|".join(str(v) for v in row.tolist())
+
+
+set_data_version(get_data_version)
+
+
+# ========== 識別字白名單（欄位名稱無法綁定參數，只允許以下值） ==========
+METRIC_COLUMNS = ("yoy_pct", "mom_pct")
+ANNUAL_PRICE_FIELDS = ("year_close", "year_high")
+WEEKLY_PRICE_FIELDS = ("w_close", "w_high")
+
+
+def checked_identifier(value: str, allowed) -> str:
+    """只允許白名單內的欄位名稱進入 SQL 文字，其餘一律 ValueError"""
+    if value not in allowed:
+        raise ValueError(f"不支援的欄位：{value!r}（允許：{', '.join(allowed)}）")
+    return value
+
+
+def like_pattern(keyword: str) -> str:
+    """包含關鍵字的 LIKE 綁定值；跳脫 \\ % _，查詢端需寫 LIKE :x ESCAPE '\\'"""
+    escaped = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+# ========== 3. 首頁：資料庫狀態 ==========
+@st.cache_data(ttl=LATEST_DATE_TTL, show_spinner=False)
+def get_latest_data_date() -> str:
+    # 抓取股價表中最晚的日期（本機快照不含日K，改用周K）
+    # 日K只有這裡讀取，不列入資料版本（每天的股價寫入不讓所有查詢快取失效），改以時間過期
+    table = "stock_weekly_k" if is_local_backend() else "stock_prices"
+    try:
+        result = read_sql(f"SELECT MAX(date) AS latest FROM {table}").iloc[0, 0]
+
+        # 如果 result 是 datetime 物件，轉為字串格式 (YYYY-MM-DD)
+        if hasattr(result, 'strftime'):
+            return result.strftime('%Y-%m-%d')
+        return str(result)
+    except Exception:
+        return "資料擷取中"
+
+
+# ========== 4. 首頁：熱力圖與統計摘要 (單次取樣、本機統計，下跌10%間隔，上漲100%間隔) ==========
+# 側邊欄統計模式 -> (fetch_heatmap_data 回傳的欄位, 顯示標籤)
+HEATMAP_STATS = {
+    "中位數 (排除極端值)": ("median_val", "中位數"),
+    "平均值 (含極端值)": ("mean_val", "平均值"),
+    "標準差 (波動程度)": ("std_val", "標準差"),
+    "變異係數 (相對波動)": ("cv_val", "變異係數%"),
+    "偏度 (分佈形狀)": ("skew_val", "偏度"),
+    "峰度 (尾部厚度)": ("kurt_val", "峰度"),
+    "四分位距 (離散程度)": ("iqr_val", "四分位距"),
+    "正樣本比例": ("positive_rate", "正增長比例%"),
+}
+
+STAT_COLUMNS = ['median_val', 'mean_val', 'std_val', 'min_val', 'max_val',
+                'cv_val', 'skew_val', 'kurt_val', 'iqr_val', 'positive_rate']
+
+
+@cache_data(max_entries=CACHE_MAX_ENTRIES)
+def fetch_bin_samples(year: str, price_field: str = "year_close") -> pd.DataFrame:
+    """
+    熱力圖與統計摘要的原始樣本：每檔股票在觀察期內每份月報一列
+    (symbol, annual_return, report_month, yoy_pct, mom_pct)。
+    YoY / MoM 一起取回，切換成長指標或漲幅分組方式時不必重新查詢。
+    """
+    start_period, end_period = observation_window(year)  # 去年12月 ~ 當年11月
+
+    query = """
+    SELECT
+        b.symbol,
+        b.annual_return,
+        m.report_month,
+        m.yoy_pct,
+        m.mom_pct
+    FROM annual_return_bins b  -- 漲幅已預先算好 (sql/001_annual_return_bins.sql)
+    JOIN monthly_revenue m ON b.stock_id = m.stock_id
+    WHERE b.year = :year AND b.price_field = :price_field
+      AND m.period BETWEEN :start_period AND :end_period  -- 去年12月 ~ 當年11月
+    """
+
+    df = read_sql(query, {"year": str(year), "price_field": price_field,
+                          "start_period": start_period, "end_period": end_period})
+    for col in ['annual_return', 'yoy_pct', 'mom_pct']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    return df
+
+
+def get_return_binning(year: str, price_field: str = "year_close",
+                       binning_scheme: str = DEFAULT_BINNING_SCHEME):
+    """分組方式 -> ReturnBinning；分位數分組以當年各股漲幅為樣本"""
+    samples = fetch_bin_samples(year, price_field)
+    return resolve_binning(binning_scheme, samples.drop_duplicates('symbol')['annual_return'].to_numpy())
+
+
+def bin_samples(year: str, price_field: str = "year_close",
+                binning_scheme: str = DEFAULT_BINNING_SCHEME) -> pd.DataFrame:
+    """原始樣本加上 bin_order / return_bin（np.digitize，純記憶體運算）"""
+    samples = fetch_bin_samples(year, price_field)
+    binning = get_return_binning(year, price_field, binning_scheme)
+    bin_order, return_bin = binning.apply(samples['annual_return'].to_numpy())
+    return samples.assign(bin_order=bin_order, return_bin=return_bin)
+
+
+@cache_data(max_entries=CACHE_MAX_ENTRIES)
+def fetch_bin_stats(year: str, metric_col: str, price_field: str = "year_close",
+                    binning_scheme: str = DEFAULT_BINNING_SCHEME) -> pd.DataFrame:
+    """
+    熱力圖與統計摘要共用的統計表，由 stats_engine 在本機對原始樣本分組計算：
+    同時產生 (漲幅區間, 報表月份) 與 (漲幅區間) 兩種粒度，
+    is_summary = 1 的列為整個區間的彙總（report_month 為 None）。
+    """
+    metric_col = checked_identifier(metric_col, METRIC_COLUMNS)
+    samples = bin_samples(year, price_field, binning_scheme)
+    samples = samples[samples[metric_col].notna()]
+    symbol_ids = pd.factorize(samples['symbol'])[0]
+
+    frames = []
+    for keys, is_summary in ((['bin_order', 'return_bin', 'report_month'], 0),
+                             (['bin_order', 'return_bin'], 1)):
+        group_ids = samples.groupby(keys, sort=True).ngroup().to_numpy()
+        stats = grouped_stats(group_ids, samples[metric_col].to_numpy(),
+                              symbol_ids, weights=samples['annual_return'].to_numpy())
+        if stats.empty:
+            continue
+        # 該區間的平均股價漲幅
+        stats = stats.rename(columns={'weight_mean': 'avg_annual_return'})
+        labels = (samples[keys].assign(group_id=group_ids)
+                  .drop_duplicates('group_id').set_index('group_id'))
+        stats = labels.join(stats, how='inner').reset_index(drop=True)
+        if is_summary:
+            stats['report_month'] = None
+        stats['is_summary'] = is_summary
+        frames.append(stats)
+
+    if not frames:
+        return pd.DataFrame(columns=['return_bin', 'bin_order', 'report_month', 'is_summary',
+                                     *STAT_COLUMNS, 'stock_count', 'data_points', 'avg_annual_return'])
+    df = pd.concat(frames, ignore_index=True)
+    return df[['return_bin', 'bin_order', 'report_month', 'is_summary',
+               *STAT_COLUMNS, 'stock_count', 'data_points', 'avg_annual_return']]
+
+
+def fetch_heatmap_data(year: str, metric_col: str, price_field: str = "year_close",
+                       binning_scheme: str = DEFAULT_BINNING_SCHEME) -> pd.DataFrame:
+    """
+    每個 (漲幅區間, 報表月份) 一列，同時包含 HEATMAP_STATS 的所有統計欄位，
+    切換統計模式只需 select_heatmap_stat() 選欄位，不必再查資料庫。
+    """
+    df = fetch_bin_stats(year, metric_col, price_field, binning_scheme)
+    df = df[df['is_summary'] == 0].drop(columns=['is_summary'])
+    # 按照bin_order排序
+    return df.sort_values(['bin_order', 'report_month']).reset_index(drop=True)
+
+
+def select_heatmap_stat(df: pd.DataFrame, stat_method: str) -> pd.DataFrame:
+    """從 fetch_heatmap_data 的結果選出指定統計模式，放在 val 欄位（純記憶體運算）"""
+    col, stat_label = HEATMAP_STATS.get(stat_method, HEATMAP_STATS["平均值 (含極端值)"])
+    out = df.copy()
+    out['val'] = out[col]
+    out['stat_method'] = stat_method
+    out['stat_label'] = stat_label
+    return out
+
+
+def _round_sql(series: pd.Series, digits: int) -> pd.Series:
+    """與 Postgres ROUND(numeric, n) 相同的四捨五入（pandas 的 round 是銀行家捨入）"""
+    quantum = Decimal(1).scaleb(-digits)
+    return series.map(lambda v: v if pd.isna(v)
+                      else float(Decimal(repr(float(v))).quantize(quantum, rounding=ROUND_HALF_UP)))
+
+
+def fetch_stat_summary(year: str, metric_col: str, price_field: str = "year_close",
+                       binning_scheme: str = DEFAULT_BINNING_SCHEME) -> pd.DataFrame:
+    """各漲幅區間的統計摘要（與熱力圖共用 fetch_bin_stats 的同一份樣本）"""
+    df = fetch_bin_stats(year, metric_col, price_field, binning_scheme)
+    df = df[df['is_summary'] == 1].sort_values('bin_order').reset_index(drop=True)
+
+    summary = df[['return_bin', 'bin_order', 'stock_count', 'avg_annual_return']].copy()
+    for col in ['mean_val', 'median_val', 'std_val', 'min_val', 'max_val', 'iqr_val']:
+        summary[col] = _round_sql(df[col], 2)
+    # 摘要表的變異係數為 std / mean（不取絕對值、不乘 100）
+    summary['cv_val'] = _round_sql(df['std_val'] / df['mean_val'].replace(0, float('nan')), 2)
+    summary['positive_rate'] = _round_sql(df['positive_rate'], 1)
+    return summary[['return_bin', 'bin_order', 'stock_count', 'avg_annual_return', 'mean_val',
+                    'median_val', 'std_val', 'min_val', 'max_val', 'cv_val', 'iqr_val',
+                    'positive_rate']]
+
+
+# ========== 6. 首頁：深度挖掘（區間業績王與備註搜尋） ==========
+@cache_data(max_entries=CACHE_MAX_ENTRIES)
+def fetch_bin_detail(year: str, price_field: str, selected_bin: str,
+                     search_keyword: str = "", limit: int = 50,
+                     binning_scheme: str = DEFAULT_BINNING_SCHEME) -> pd.DataFrame:
+    start_period, end_period = observation_window(year)
+
+    # 區間名稱 -> 漲幅範圍 [ret_lo, ret_hi)（與 ReturnBinning.apply 的邊界規則一致）
+    binning = get_return_binning(year, price_field, binning_scheme)
+    if selected_bin not in binning.labels:
+        return pd.DataFrame()
+    ret_lo, ret_hi = binning.bounds(binning.labels.index(selected_bin))
+
+    query = """
+    WITH target_stocks AS (
+        -- 使用 price_field 的預算漲幅與分類（與熱力圖一致）
+        SELECT stock_id, annual_return AS annual_ret
+        FROM annual_return_bins
+        WHERE year = :year AND price_field = :price_field
+    ),
+
+    latest_remarks AS (
+        SELECT DISTINCT ON (stock_id) stock_id, remark
+        FROM monthly_revenue
+        WHERE period BETWEEN :start_period AND :end_period
+          AND remark IS NOT NULL AND remark <> '-' AND remark <> ''
+        ORDER BY stock_id, report_month DESC
+    )
+    SELECT
+        m.stock_id as "代號",
+        m.stock_name as "名稱",
+        ROUND(t.annual_ret::numeric, 1) as "年度股價實際漲幅%",
+        ROUND(AVG(m.yoy_pct)::numeric, 1) as "年增YoY平均%",
+        ROUND(AVG(m.mom_pct)::numeric, 1) as "月增MoM平均%",
+        ROUND(STDDEV(m.yoy_pct)::numeric, 1) as "年增YoY波動%",
+        ROUND(STDDEV(m.mom_pct)::numeric, 1) as "月增MoM波動%",
+        r.remark as "最新營收備註"
+    FROM monthly_revenue m
+    JOIN target_stocks t ON m.stock_id = t.stock_id
+    LEFT JOIN latest_remarks r ON m.stock_id = r.stock_id
+    WHERE t.annual_ret >= :ret_lo AND t.annual_ret < :ret_hi
+      AND m.period BETWEEN :start_period AND :end_period
+      AND (m.stock_name LIKE :keyword ESCAPE '\\' OR (r.remark IS NOT NULL AND r.remark LIKE :keyword ESCAPE '\\'))
+    GROUP BY m.stock_id, m.stock_name, t.annual_ret, r.remark
+    ORDER BY "年度股價實際漲幅%" DESC
+    LIMIT :limit;
+    """
+
+    return read_sql(query, {"year": str(year), "price_field": price_field,
+                            "start_period": start_period, "end_period": end_period,
+                            "ret_lo": ret_lo, "ret_hi": ret_hi,
+                            "keyword": like_pattern(search_keyword), "limit": int(limit)})
+
+
+# ========== 7. 機率研究室：爆發次數 vs 年度報酬 ==========
+def _hit_params(year: str, low: float, high: float) -> dict:
+    """hit_table（觀察期內成長率落在 [low, high) 的次數）共用的綁定參數"""
+    start_period, end_period = observation_window(year)
+    return {"year": str(year), "start_period": start_period, "end_period": end_period,
+            "low": float(low), "high": float(high)}
+
+
+# 機率研究室「爆發區間」滑桿的選項；任兩個選項組成一個 [low, high) 區間（共 45 組）
+GROWTH_RANGE_OPTIONS = (-50, 0, 20, 50, 100, 150, 200, 300, 500, 1000)
+
+PROB_STAT_COLUMNS = ["股票檔數", "平均年度漲幅%", "中位數漲幅%", "勝率(>20%)", "翻倍率(>100%)",
+                     "最低漲幅%", "最高漲幅%", "標準差%"]
+
+
+@cache_data(max_entries=CACHE_MAX_ENTRIES)
+def fetch_hit_matrix(year: str, metric_col: str, options=GROWTH_RANGE_OPTIONS) -> pd.DataFrame:
+    """
+    每檔股票在觀察期內，成長率落在相鄰兩個滑桿選項 [options[i], options[i+1]) 的月數
+
+    回傳 index 為 stock_id、欄位為區段編號 0..len(options)-2 的計數矩陣；
+    任一區間 [options[i], options[j]) 的達標次數 = 第 i ~ j-1 欄加總
+    """
+    metric_col = checked_identifier(metric_col, METRIC_COLUMNS)
+    start_period, end_period = observation_window(year)
+
+    query = f"""
+    SELECT stock_id, {metric_col} as value
+    FROM monthly_revenue
+    WHERE period BETWEEN :start_period AND :end_period
+      AND {metric_col} IS NOT NULL
+      AND stock_id IS NOT NULL  -- 孤兒列沒有股票代號，無法對應年度報酬
+    """
+
+    samples = read_sql(query, {"start_period": start_period, "end_period": end_period})
+    edges = np.asarray(options, dtype=np.float64)
+    n_buckets = len(edges) - 1
+    bucket = np.digitize(samples['value'].to_numpy(dtype=np.float64), edges, right=False) - 1
+    inside = (bucket >= 0) & (bucket < n_buckets)
+
+    stock_codes, stock_ids = pd.factorize(samples['stock_id'])
+    counts = np.bincount(stock_codes[inside] * n_buckets + bucket[inside],
+                         minlength=len(stock_ids) * n_buckets).reshape(len(stock_ids), n_buckets)
+    return pd.DataFrame(counts, index=pd.Index(stock_ids, name='stock_id'))
+
+
+@cache_data(max_entries=CACHE_MAX_ENTRIES)
+def fetch_prob_surface(year: str, metric_col: str, price_field: str = "year_close",
+                       options=GROWTH_RANGE_OPTIONS) -> pd.DataFrame:
+    """
+    機率曲面：滑桿所有 (low, high) 區間 × 爆發次數的年度報酬統計，一次算完
+
+    以 fetch_hit_matrix 的累積和取得每個區間的達標次數，再用 stats_engine 分組統計；
+    每個 (low, high) 的結果與逐一區間以 SQL 分組統計相同（同樣四捨五入到 0.1）
+    """
+    price_field = checked_identifier(price_field, ANNUAL_PRICE_FIELDS)
+    hit_matrix = fetch_hit_matrix(year, metric_col, options)
+
+    query = f"""
+    SELECT stock_id, (({price_field} - year_open) / year_open)*100 as ret
+    FROM stock_annual_k WHERE year = :year
+    """
+
+    perf = read_sql(query, {"year": str(year)})
+    columns = ["low", "high", "爆發次數"] + PROB_STAT_COLUMNS
+    joined = perf.join(hit_matrix, on='stock_id', how='inner')
+    if joined.empty:
+        return pd.DataFrame(columns=columns)
+
+    # 累積和：cum[:, j] - cum[:, i] = 區間 [options[i], options[j]) 的達標次數
+    counts = joined[hit_matrix.columns].to_numpy()
+    cum = np.concatenate([np.zeros((len(counts), 1), dtype=counts.dtype), counts.cumsum(axis=1)], axis=1)
+    lo_idx, hi_idx = np.triu_indices(len(options), k=1)
+    hits = (cum[:, hi_idx] - cum[:, lo_idx]).ravel()         # (股票, 區間) 攤平
+    pair = np.tile(np.arange(len(lo_idx)), len(counts))
+    ret = np.repeat(joined['ret'].to_numpy(dtype=np.float64), len(lo_idx))
+    row = np.repeat(np.arange(len(counts)), len(lo_idx))
+
+    # 只保留有達標的 (股票, 區間)，與 hit_table 只列出達標股票相同
+    keep = hits > 0
+    stride = int(hits.max()) + 1 if keep.any() else 1
+    group_ids = pair[keep] * stride + hits[keep]
+    ret, row = ret[keep], row[keep]
+
+    # 股票檔數與勝率的分母為 COUNT(*)（含報酬為 NULL 的股票），其餘統計量忽略 NULL
+    n_groups = len(lo_idx) * stride
+    n = np.bincount(group_ids, minlength=n_groups)
+    finite = np.isfinite(ret)
+    stats = grouped_stats(group_ids[finite], ret[finite], row[finite])
+    surface = pd.DataFrame({
+        "low": np.asarray(options)[lo_idx].repeat(stride),
+        "high": np.asarray(options)[hi_idx].repeat(stride),
+        "爆發次數": np.tile(np.arange(stride), len(lo_idx)),
+        "股票檔數": n,
+    })
+    with np.errstate(divide="ignore", invalid="ignore"):
+        surface["勝率(>20%)"] = np.bincount(group_ids, weights=ret > 20, minlength=n_groups) * 100.0 / n
+        surface["翻倍率(>100%)"] = np.bincount(group_ids, weights=ret > 100, minlength=n_groups) * 100.0 / n
+    for col, stat in [("平均年度漲幅%", "mean_val"), ("中位數漲幅%", "median_val"), ("最低漲幅%", "min_val"),
+                      ("最高漲幅%", "max_val"), ("標準差%", "std_val")]:
+        surface[col] = stats[stat].reindex(surface.index).to_numpy() if not stats.empty else np.nan
+
+    surface = surface[surface["股票檔數"] > 0]
+    for col in PROB_STAT_COLUMNS[1:]:
+        surface[col] = _round_sql(surface[col], 1)
+    return surface[columns].sort_values(["low", "high", "爆發次數"], ascending=[True, True, False]) \
+        .reset_index(drop=True)
+
+
+def select_prob_range(surface: pd.DataFrame, low: float, high: float) -> pd.DataFrame:
+    """從機率曲面取出單一 (low, high) 區間：每個爆發次數一列的年度報酬統計"""
+    df = surface[(surface["low"] == low) & (surface["high"] == high)]
+    return df.drop(columns=["low", "high"]).reset_index(drop=True)
+
+
+# ========== 8. 機率研究室：前後年度比較 ==========
+def range_hits(hit_matrix: pd.DataFrame, low: float, high: float, options=GROWTH_RANGE_OPTIONS) -> pd.Series:
+    """由 fetch_hit_matrix 取出區間 [low, high) 的達標次數（只保留有達標的股票）"""
+    lo_idx, hi_idx = list(options).index(low), list(options).index(high)
+    hits = hit_matrix.iloc[:, lo_idx:hi_idx].sum(axis=1)
+    return hits[hits > 0].rename('hits')
+
+
+@cache_data(max_entries=CACHE_MAX_ENTRIES)
+def fetch_annual_returns(first_year: int, last_year: int, price_field: str = "year_close") -> pd.DataFrame:
+    """所有股票在 first_year ~ last_year 的年度報酬（一次查詢，前後年度比較共用）"""
+    price_field = checked_identifier(price_field, ANNUAL_PRICE_FIELDS)
+
+    query = f"""
+    SELECT stock_id, year,
+           (({price_field} - year_open) / year_open) * 100 as annual_return
+    FROM stock_annual_k
+    WHERE year = ANY(:years)
+    """
+
+    # year 是文字欄位：綁定年度字串陣列，不轉型才能走 (stock_id, year) 等索引
+    years = [str(y) for y in range(int(first_year), int(last_year) + 1)]
+    return read_sql(query, {"years": years})
+
+
+def fetch_multi_year_stats(year: str, metric_col: str, low: float, high: float,
+                           price_field: str = "year_close") -> pd.DataFrame:
+    """
+    觀察期內所有達標股票，依 (爆發次數, 年度) 統計目標年度前兩年 ~ 後一年的年度報酬
+
+    達標次數取自已快取的 fetch_hit_matrix，年度報酬為單一查詢，
+    分組統計在本機向量化完成；切換區間不需要重新查詢。
+    """
+    hits = range_hits(fetch_hit_matrix(year, metric_col), low, high)
+    returns = fetch_annual_returns(int(year) - 2, int(year) + 1, price_field)
+    merged = returns.join(hits, on='stock_id', how='inner')
+    if merged.empty:
+        return pd.DataFrame(columns=['爆發次數', '年度', '平均報酬%', '中位數報酬%', '樣本數'])
+
+    stats = merged.groupby(['hits', 'year'])['annual_return'].agg(['mean', 'median', 'size']).reset_index()
+    return stats.rename(columns={'hits': '爆發次數', 'year': '年度', 'mean': '平均報酬%',
+                                 'median': '中位數報酬%', 'size': '樣本數'})
+
+
+# ========== 9. 機率研究室：區間名單點名 ==========
+def fetch_burst_detail(year: str, metric_col: str, low: float, high: float,
+                       price_field: str, selected_hits: int) -> pd.DataFrame:
+    metric_col = checked_identifier(metric_col, METRIC_COLUMNS)
+    price_field = checked_identifier(price_field, ANNUAL_PRICE_FIELDS)
+    params = _hit_params(year, low, high)
+    params.update(year_end=to_period(year, 12), selected_hits=int(selected_hits))
+
+    query = f"""
+    WITH hit_table AS (
+        SELECT stock_id, COUNT(*) as hits
+        FROM monthly_revenue
+        WHERE period BETWEEN :start_period AND :end_period
+        AND {metric_col} >= :low AND {metric_col} < :high
+        GROUP BY stock_id
+    )
+    SELECT h.stock_id as "股票代號",
+           COALESCE(m.stock_name, 'N/A') as "股票名稱",
+           h.hits as "爆發次數",
+           ROUND(((k.{price_field} - k.year_open)/k.year_open*100)::numeric, 1) as "年度漲幅%",
+           ROUND(AVG(m.{metric_col})::numeric, 1) as "平均增長%",
+           STRING_AGG(DISTINCT CASE WHEN m.remark <> '-' AND m.remark <> '' THEN m.remark END, ' | ') as "關鍵備註"
+    FROM hit_table h
+    LEFT JOIN stock_annual_k k ON h.stock_id = k.stock_id AND k.year = :year
+    LEFT JOIN monthly_revenue m ON h.stock_id = m.stock_id
+      AND m.period BETWEEN :start_period AND :year_end
+    WHERE h.hits = :selected_hits
+    GROUP BY h.stock_id, m.stock_name, k.{price_field}, k.year_open, h.hits
+    ORDER BY "年度漲幅%" DESC NULLS LAST
+    LIMIT 100;
+    """
+
+    return read_sql(query, params)
+
+
+# ========== 10. 公告行為研究室：初次爆發事件與前後週報酬 ==========
+def _spark_events_sql(metric_col: str) -> str:
+    """
+    初次爆發事件 CTE (spark_events)：當月成長率首次站上門檻 :limit，
+    base_date 為營收公告基準日（次月10日）
+
+    事件由 spark_event_log (sql/005) 的「上月值 -> 本月值」判斷，不需要對營收表開窗；
+    上一筆營收早於該事件年度的前一年12月時視為沒有上一筆，與原本只在觀察期內 LAG 相同
+    （逐列判斷，多年度一次查詢時每個年度仍各自套用自己的觀察期）。
+
+    :limit / :limit_hi 為門檻範圍的上下限，取出範圍內所有門檻事件的聯集
+    （門檻掃描用），單一門檻時兩者相同。
+    """
+    return f"""
+    spark_log AS (
+        SELECT stock_id, stock_name, report_month, period, value, remark, base_date,
+               -- period - period % 100 - 88 = 前一年12月（例如 202405 -> 202312），兩種資料庫都是整數運算
+               CASE WHEN prev_period >= period - period % 100 - 88 THEN prev_value END as prev_metric
+        FROM spark_event_log
+        WHERE metric = :metric
+          AND period BETWEEN :year_start AND :year_end
+          AND (remark LIKE :keyword ESCAPE '\\' OR stock_name LIKE :keyword ESCAPE '\\')
+    ),
+    spark_events AS (
+        SELECT stock_id, stock_name, report_month, period, value as {metric_col}, remark, base_date, prev_metric
+        FROM spark_log
+        WHERE value >= :limit
+          AND (prev_metric < :limit_hi OR prev_metric IS NULL)
+    )"""
+
+
+def _spark_events_params(year, metric_col: str, limit, keyword: str) -> dict:
+    """
+    year 可以是單一年度，或多個年度的 tuple（一次查詢涵蓋最早 ~ 最晚年度）
+    limit 可以是單一門檻，或 (最低門檻, 最高門檻) 的 tuple（取範圍內所有門檻事件的聯集）
+    """
+    years = [int(y) for y in year] if isinstance(year, (tuple, list)) else [int(year)]
+    limits = limit if isinstance(limit, (tuple, list)) else (limit,)
+    # 事件只取當年1~12月
+    year_start, year_end = year_range(min(years))[0], year_range(max(years))[1]
+    return {"metric": metric_col, "year_start": year_start, "year_end": year_end,
+            "limit": float(min(limits)), "limit_hi": float(max(limits)), "keyword": like_pattern(keyword)}
+
+
+def _weekly_ret_col(price_field: str) -> str:
+    """根據價格計算方式選擇預算好的週報酬欄位 (sql/004_weekly_returns.sql)"""
+    return "ret_high" if price_field == "w_high" else "ret_close"
+
+
+def _timing_query(year, metric_col: str, limit, keyword: str, price_field: str):
+    """
+    fetch_timing_data 的 (SQL, 參數)；門檻掃描 (fetch_timing_sweep_data) 也共用這一份
+    limit 為 (最低門檻, 最高門檻) 時取出範圍內所有門檻事件的聯集，並多回傳 prev_metric
+    """
+    metric_col = checked_identifier(metric_col, METRIC_COLUMNS)
+    ret_col = _weekly_ret_col(price_field)
+    prev_col = ", e.prev_metric" if isinstance(limit, (tuple, list)) else ""
+
+    query = f"""
+    WITH {_spark_events_sql(metric_col)},
+    final_detail AS (
+        SELECT
+            e.stock_id, e.stock_name, e.report_month, e.{metric_col} as growth_val, e.remark{prev_col},
+            AVG(CASE WHEN c.date >= e.base_date - 38 AND c.date < e.base_date - 9 THEN c.{ret_col} END) * 4 as pre_month,
+            AVG(CASE WHEN c.date >= e.base_date - 9 AND c.date <= e.base_date - 3 THEN c.{ret_col} END) as pre_week,
+            AVG(CASE WHEN c.date > e.base_date - 3 AND c.date <= e.base_date + 4 THEN c.{ret_col} END) as announce_week,
+            AVG(CASE WHEN c.date > e.base_date + 4 AND c.date <= e.base_date + 11 THEN c.{ret_col} END) as after_week_1,
+            AVG(CASE WHEN c.date > e.base_date + 11 AND c.date <= e.base_date + 30 THEN c.{ret_col} END) as after_month
+        FROM spark_events e
+        -- 只取事件前38天 ~ 後30天的週資料，走 (stock_id, date) 索引範圍掃描
+        -- date ± 整數天數仍是 date，比較時不會把索引欄位轉成 timestamp
+        JOIN weekly_returns c ON c.stock_id = e.stock_id
+         AND c.date BETWEEN e.base_date - 38 AND e.base_date + 30
+        GROUP BY e.stock_id, e.stock_name, e.report_month, e.{metric_col}, e.remark, e.base_date{prev_col}
+    )
+    SELECT * FROM final_detail WHERE pre_week IS NOT NULL ORDER BY pre_month DESC;
+    """
+
+    return query, _spark_events_params(year, metric_col, limit, keyword)
+
+
+@cache_data(max_entries=CACHE_MAX_ENTRIES)
+def fetch_timing_data(year, metric_col: str, limit: float, keyword: str,
+                      price_field: str = "w_close") -> pd.DataFrame:
+    """
+    year: 單一年度，或多個年度的 tuple（一次查詢、依報表月份排序前的所有事件）
+    price_field: 可以是 'w_close' (收盤價) 或 'w_high' (最高價)
+    """
+    return read_sql(*_timing_query(year, metric_col, limit, keyword, price_field))
+
+
+def with_event_year(df: pd.DataFrame, years) -> pd.DataFrame:
+    """
+    全部年度模式：多年度的事件表加上 year 欄（由報表月份推得）並放在第一欄，
+    只保留 years 內的事件，依 T-1月 報酬由高到低排序，用來比較各年度 T-1月效應的穩定性
+    """
+    years = {str(y) for y in years}
+    if df.empty:
+        return df.assign(year=pd.Series(dtype=str))
+    # report_month 為民國年 'YYY_MM'
+    event_year = (df['report_month'].str.split('_').str[0].astype(int) + 1911).astype(str)
+    df = df.assign(year=event_year)
+    df = df[df['year'].isin(years)]
+    df = df[['year'] + [c for c in df.columns if c != 'year']]
+    return df.sort_values('pre_month', ascending=False, na_position='last').reset_index(drop=True)
+
+
+@cache_data(max_entries=CACHE_MAX_ENTRIES)
+def fetch_timing_sweep_data(year, metric_col: str, keyword: str, price_field: str = "w_close",
+                            limit_range=(30, 300)) -> pd.DataFrame:
+    """
+    門檻掃描用：limit_range 內任一門檻的爆發事件聯集（含 prev_metric），只查詢一次；
+    個別門檻的事件以 select_threshold_events 在本機篩選，拖動門檻滑桿不需要重新查詢
+    """
+    return read_sql(*_timing_query(year, metric_col, tuple(limit_range), keyword, price_field))
+
+
+def select_threshold_events(sweep_df: pd.DataFrame, limit: float) -> pd.DataFrame:
+    """
+    從門檻掃描的聯集中取出單一門檻的事件（與 fetch_timing_data 的結果相同）：
+    本月值 >= 門檻，且上月值 < 門檻或沒有上月值
+    """
+    prev = sweep_df['prev_metric']
+    hit = (sweep_df['growth_val'] >= limit) & (prev.isna() | (prev < limit))
+    return sweep_df[hit].drop(columns='prev_metric').reset_index(drop=True)
+
+
+# ========== 11. 公告行為研究室：自訂事件視窗 (event_study.py) ==========
+@cache_data(max_entries=CACHE_MAX_ENTRIES)
+def fetch_spark_events(year: str, metric_col: str, limit, keyword: str) -> pd.DataFrame:
+    """
+    初次爆發事件清單（含公告基準日 base_date），供本機事件研究引擎使用
+    limit 傳入門檻範圍 tuple 時回傳範圍內所有門檻事件的聯集
+    """
+    metric_col = checked_identifier(metric_col, METRIC_COLUMNS)
+
+    query = f"""
+    WITH {_spark_events_sql(metric_col)}
+    SELECT stock_id, stock_name, report_month, {metric_col} as growth_val, remark, base_date
+    FROM spark_events
+    ORDER BY base_date, stock_id;
+    """
+
+    return read_sql(query, _spark_events_params(year, metric_col, limit, keyword))
+
+
+@cache_data(max_entries=CACHE_MAX_ENTRIES)
+def fetch_event_weekly_returns(year: str, metric_col: str, limit, keyword: str,
+                               price_field: str = "w_close",
+                               weeks_before: int = 8, weeks_after: int = 12) -> pd.DataFrame:
+    """
+    有爆發事件的股票，在 [第一個事件 - weeks_before 週, 最後一個事件 + weeks_after 週]
+    內的週報酬（同一 stock_id 有多個 symbol 時取同日平均）
+    """
+    metric_col = checked_identifier(metric_col, METRIC_COLUMNS)
+    ret_col = _weekly_ret_col(price_field)
+
+    query = f"""
+    WITH {_spark_events_sql(metric_col)},
+    event_stocks AS (
+        SELECT stock_id, MIN(base_date) as first_base, MAX(base_date) as last_base
+        FROM spark_events
+        GROUP BY stock_id
+    )
+    SELECT c.stock_id, c.date, AVG(c.{ret_col}) as weekly_ret
+    FROM event_stocks s
+    JOIN weekly_returns c ON c.stock_id = s.stock_id
+     AND c.date BETWEEN s.first_base - CAST(:days_before AS INTEGER)
+                    AND s.last_base + CAST(:days_after AS INTEGER)
+    GROUP BY c.stock_id, c.date
+    ORDER BY c.stock_id, c.date;
+    """
+
+    params = _spark_events_params(year, metric_col, limit, keyword)
+    # 多抓一週緩衝，T 週以 base_date - 3 天定位
+    params.update(days_before=7 * (int(weeks_before) + 1) + 3, days_after=7 * (int(weeks_after) + 1))
+    return read_sql(query, params)
+
+
+@cache_data(max_entries=CACHE_MAX_ENTRIES)
+def fetch_market_weekly_returns(start_date, end_date, price_field: str = "w_close") -> pd.DataFrame:
+    """全市場等權平均週報酬，作為異常報酬 (CAR) 的基準"""
+    ret_col = _weekly_ret_col(price_field)
+
+    query = f"""
+    SELECT date, AVG({ret_col}) as market_ret
+    FROM weekly_returns
+    WHERE date BETWEEN :start_date AND :end_date
+    GROUP BY date
+    ORDER BY date;
+    """
+
+    return read_sql(query, {"start_date": start_date, "end_date": end_date})
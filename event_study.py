@@ -0,0 +1,221 @@
+"""
+事件研究引擎 (NumPy)
+
+公告行為研究室原本只能在 SQL 裡用五個寫死的日期區間（T-1月、T-1周、T周、
+T+1周、T+1月）平均週報酬。這裡把事件相關股票的週報酬載入記憶體，
+以「週」為單位計算任意視窗（例如 T-8w ~ T+12w）的累積報酬與
+累積異常報酬 (CAR) 曲線，所有事件一次向量化完成，沒有 Python 迴圈。
+
+定位方式（as-of）：
+    每檔股票的週K依日期排序後串成一維陣列，(股票, 日期) 編成單一遞增鍵，
+    事件用 np.searchsorted 找到 T 週 = 第一根日期 > base_date - 3 天的週K，
+    且日期必須 <= base_date + 4 天，與原本 announce_week 的 (base_date - 3, base_date + 4] 區間一致
+    （週K有缺漏時不會往後抓到幾週後的K棒，T 週為 NaN）。
+    T+k 週就是同一檔股票往後第 k 根週K，超出該股票資料範圍的位置為 NaN。
+
+門檻掃描 (threshold_sweep)：
+    對門檻範圍內所有事件的聯集建立 (門檻 x 事件) 的遮罩矩陣，
+    一次算出每個門檻的事件數與各階段報酬統計，拖動門檻滑桿不需要重新查詢。
+"""
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# 原本五個 SQL 區間對應的週數視窗（T = 公告週，含頭尾）
+DEFAULT_WINDOWS = {
+    "T-1月": (-4, -2),
+    "T-1周": (-1, -1),
+    "T周": (0, 0),
+    "T+1周": (1, 1),
+    "T+1月": (2, 4),
+}
+
+# fetch_timing_data 回傳的五個階段欄位 -> 顯示名稱
+TIMING_STAGES = {
+    "pre_month": "T-1月",
+    "pre_week": "T-1周",
+    "announce_week": "T周",
+    "after_week_1": "T+1周",
+    "after_month": "T+1月",
+}
+
+
+@dataclass
+class ReturnPanel:
+    """依 (股票, 日期) 排序後串接的週報酬；starts/ends 為每檔股票在陣列中的範圍"""
+    stock_ids: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+    days: np.ndarray      # 日期 (自 1970-01-01 起的天數)
+    returns: np.ndarray   # 週報酬 (%)，已扣除市場報酬時為異常報酬
+
+    @property
+    def keys(self):
+        # 股票編號 * 2^20 + 天數：同一檔股票內遞增，跨股票也遞增
+        stock_idx = np.repeat(np.arange(len(self.stock_ids)), self.ends - self.starts)
+        return stock_idx.astype(np.int64) * (1 << 20) + self.days
+
+
+def _to_days(dates):
+    return pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[D]").astype(np.int64)
+
+
+def build_return_panel(returns_df, market_df=None, ret_col="weekly_ret"):
+    """
+    returns_df: (stock_id, date, weekly_ret) 長表
+    market_df : 選填 (date, market_ret)，提供時改用異常報酬 = 週報酬 - 同日市場平均
+    """
+    df = returns_df[["stock_id", "date", ret_col]].copy()
+    df["days"] = _to_days(df["date"])
+    df = df.sort_values(["stock_id", "days"], kind="stable").reset_index(drop=True)
+    returns = df[ret_col].to_numpy(dtype=np.float64)
+
+    if market_df is not None and not market_df.empty:
+        market_days = _to_days(market_df["date"])
+        order = np.argsort(market_days)
+        market_days = market_days[order]
+        market_ret = market_df["market_ret"].to_numpy(dtype=np.float64)[order]
+        pos = np.clip(np.searchsorted(market_days, df["days"].to_numpy()), 0, len(market_days) - 1)
+        matched = market_days[pos] == df["days"].to_numpy()
+        returns = returns - np.where(matched, market_ret[pos], np.nan)
+
+    stock_ids, starts = np.unique(df["stock_id"].to_numpy(), return_index=True)
+    ends = np.r_[starts[1:], len(df)]
+    return ReturnPanel(stock_ids, starts, ends, df["days"].to_numpy(dtype=np.int64), returns)
+
+
+def locate_events(panel, event_stock_ids, base_dates):
+    """
+    每個事件的 (所屬股票在 panel 中的編號, T 週在串接陣列中的位置)
+    找不到股票、T 週超出資料範圍或 (base_date - 3, base_date + 4] 內沒有週K時，位置為 -1
+    """
+    event_stock_ids = np.asarray(event_stock_ids)
+    if len(panel.stock_ids) == 0:
+        return np.zeros(len(event_stock_ids), dtype=np.int64), np.full(len(event_stock_ids), -1)
+    stock_idx = np.clip(np.searchsorted(panel.stock_ids, event_stock_ids), 0, len(panel.stock_ids) - 1)
+    found = panel.stock_ids[stock_idx] == event_stock_ids
+
+    base_days = _to_days(base_dates)
+    target = stock_idx.astype(np.int64) * (1 << 20) + (base_days - 3)
+    t_pos = np.searchsorted(panel.keys, target, side="right")
+    valid = (found & (t_pos < panel.ends[stock_idx])
+             & (panel.days[np.clip(t_pos, 0, len(panel.days) - 1)] <= base_days + 4))
+    return stock_idx, np.where(valid, t_pos, -1)
+
+
+def gather_offsets(panel, stock_idx, t_pos, offsets):
+    """事件 x 週位移的報酬矩陣，shape = (事件數, len(offsets))"""
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if len(panel.returns) == 0:
+        return np.full((len(t_pos), len(offsets)), np.nan)
+    idx = t_pos[:, None] + offsets[None, :]
+    valid = ((t_pos >= 0)[:, None]
+             & (idx >= panel.starts[stock_idx][:, None])
+             & (idx < panel.ends[stock_idx][:, None]))
+    safe_idx = np.clip(idx, 0, len(panel.returns) - 1)
+    return np.where(valid, panel.returns[safe_idx], np.nan)
+
+
+def window_returns(matrix, offsets, start_week, end_week):
+    """
+    由 gather_offsets 的矩陣計算視窗 [start_week, end_week] 內的
+    (複利累積報酬 %, 平均週報酬 %)；整個視窗都沒有資料時為 NaN
+    """
+    offsets = np.asarray(offsets)
+    cols = (offsets >= start_week) & (offsets <= end_week)
+    window = matrix[:, cols]
+    has_data = np.isfinite(window).any(axis=1)
+    growth = np.nanprod(1 + window / 100, axis=1)
+    with np.errstate(invalid="ignore"):
+        average = np.where(has_data, np.nanmean(np.where(has_data[:, None], window, 0), axis=1), np.nan)
+    return np.where(has_data, (growth - 1) * 100, np.nan), average
+
+
+def car_curves(matrix):
+    """累積 (異常) 報酬曲線：逐週加總，缺值視為 0；完全沒有資料的事件整列為 NaN"""
+    curves = np.nancumsum(matrix, axis=1)
+    curves[~np.isfinite(matrix).any(axis=1)] = np.nan
+    return curves
+
+
+def run_event_study(events, returns_df, market_df=None, curve_range=(-8, 12), windows=None):
+    """
+    events    : 至少包含 stock_id, base_date 的事件表
+    returns_df: (stock_id, date, weekly_ret) 事件股票的週報酬
+    market_df : 選填 (date, market_ret)，提供時計算異常報酬
+
+    回傳 (per_event, curve)：
+      per_event: events 加上每個視窗的累積報酬欄位
+      curve    : 每個週位移的 CAR 平均、中位數、25/75 百分位與樣本數
+    """
+    windows = windows or DEFAULT_WINDOWS
+    lo = min([curve_range[0]] + [w[0] for w in windows.values()])
+    hi = max([curve_range[1]] + [w[1] for w in windows.values()])
+    offsets = np.arange(lo, hi + 1)
+
+    panel = build_return_panel(returns_df, market_df)
+    stock_idx, t_pos = locate_events(panel, events["stock_id"].to_numpy(), events["base_date"])
+    matrix = gather_offsets(panel, stock_idx, t_pos, offsets)
+
+    per_event = events.reset_index(drop=True).copy()
+    for name, (start_week, end_week) in windows.items():
+        per_event[name] = window_returns(matrix, offsets, start_week, end_week)[0]
+
+    in_curve = (offsets >= curve_range[0]) & (offsets <= curve_range[1])
+    curves = car_curves(matrix[:, in_curve])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # 某週完全沒有事件資料時回傳 NaN
+        curve = pd.DataFrame({
+            "week": offsets[in_curve],
+            "car_mean": np.nanmean(curves, axis=0),
+            "car_median": np.nanmedian(curves, axis=0),
+            "car_q25": np.nanpercentile(curves, 25, axis=0),
+            "car_q75": np.nanpercentile(curves, 75, axis=0),
+            "n_events": np.isfinite(curves).sum(axis=0),
+        })
+    return per_event, curve
+
+
+# ========== 門檻掃描 ==========
+def spark_mask(values, prev_values, thresholds):
+    """
+    (門檻數, 事件數) 的布林矩陣：門檻 t 的爆發事件 = 本月值 >= t 且 (上月值 < t 或沒有上月值)
+    注意門檻提高時事件不一定是子集合（上月值介於兩個門檻之間的列只在高門檻成立）
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)[:, None]
+    values = np.asarray(values, dtype=np.float64)[None, :]
+    prev_values = np.asarray(prev_values, dtype=np.float64)[None, :]
+    return (values >= thresholds) & (np.isnan(prev_values) | (prev_values < thresholds))
+
+
+def threshold_sweep(events, thresholds, stages=None, value_col="growth_val", prev_col="prev_metric"):
+    """
+    events: 門檻範圍內所有事件的聯集（每列含本月值、上月值與各階段報酬）
+    回傳長表 (threshold, stage, mean, median, win_rate, n, n_events)，
+    每個門檻、每個階段一列，與逐一門檻查詢後以 dropna() 統計的結果相同
+    """
+    stages = stages or TIMING_STAGES
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    mask = spark_mask(events[value_col], events[prev_col], thresholds)
+    n_events = mask.sum(axis=1)
+
+    frames = []
+    for col, label in stages.items():
+        x = events[col].to_numpy(dtype=np.float64)
+        finite = np.isfinite(x)
+        hit = mask & finite[None, :]
+        n = hit.sum(axis=1)
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)  # 某門檻沒有事件時回傳 NaN
+            frames.append(pd.DataFrame({
+                "threshold": thresholds,
+                "stage": label,
+                "mean": hit.astype(np.float64) @ np.where(finite, x, 0.0) / n,
+                "median": np.nanmedian(np.where(hit, x[None, :], np.nan), axis=1),
+                "win_rate": (hit & (x > 0)[None, :]).sum(axis=1) / n * 100,
+                "n": n,
+                "n_events": n_events,
+            }))
+    return pd.concat(frames, ignore_index=True)
@@ -1,202 +1,19 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-from sqlalchemy import create_engine, text
 import urllib.parse
 import plotly.graph_objects as go
+from data_access import (
+    GROWTH_RANGE_OPTIONS, fetch_prob_surface, select_prob_range,
+    fetch_multi_year_stats, fetch_burst_detail
+)
+from summary_tables import calculate_expected_value, markdown_table
+import profiler
 
 # ========== 1. 頁面配置 ==========
 st.set_page_config(page_title="機率研究室 2.0 | StockRevenueLab", layout="wide")
-
-# ========== 2. 安全資料庫連線 ==========
-@st.cache_resource
-def get_engine():
-    try:
-        DB_PASSWORD = st.secrets["DB_PASSWORD"]
-        PROJECT_REF = st.secrets["PROJECT_REF"]
-        POOLER_HOST = st.secrets["POOLER_HOST"]
-        encoded_password = urllib.parse.quote_plus(DB_PASSWORD)
-        connection_string = f"postgresql://postgres.{PROJECT_REF}:{encoded_password}@{POOLER_HOST}:5432/postgres?sslmode=require"
-        return create_engine(connection_string)
-    except Exception:
-        st.error("❌ 資料庫連線失敗，請檢查 Secrets 設定")
-        st.stop()
-
-# ========== 3. 新增：獲取前後年度比較數據 ==========
-@st.cache_data(ttl=3600)
-def fetch_multi_year_data(stock_list, target_year, price_field="year_close"):
-    """獲取指定股票在前後年度的表現"""
-    if not stock_list:
-        return pd.DataFrame()
-    
-    engine = get_engine()
-    stock_ids = ','.join([f"'{id}'" for id in stock_list])
-    
-    query = f"""
-    WITH years_data AS (
-        SELECT 
-            SPLIT_PART(symbol, '.', 1) as stock_id,
-            year,
-            (({price_field} - year_open) / year_open) * 100 as annual_return
-        FROM stock_annual_k
-        WHERE SPLIT_PART(symbol, '.', 1) IN ({stock_ids})
-            AND year::integer BETWEEN {int(target_year)-2} AND {int(target_year)+1}
-    )
-    SELECT * FROM years_data;
-    """
-    
-    with engine.connect() as conn:
-        return pd.read_sql_query(text(query), conn)
-
-# ========== 4. 修正：數據抓取引擎 (使用PERCENTILE_CONT計算中位數) ==========
-@st.cache_data(ttl=3600)
-def fetch_prob_data(year, metric_col, low, high, price_field="year_close"):
-    engine = get_engine()
-    minguo_year = int(year) - 1911
-    prev_minguo_year = minguo_year - 1
-    
-    query = f"""
-    WITH hit_table AS (
-        SELECT stock_id, COUNT(*) as hits 
-        FROM monthly_revenue 
-        WHERE (
-            report_month = '{prev_minguo_year}_12' 
-            OR (report_month LIKE '{minguo_year}_%' AND report_month <= '{minguo_year}_11')
-        )
-        AND {metric_col} >= {low} AND {metric_col} < {high}
-        GROUP BY stock_id
-    ),
-    perf_table AS (
-        SELECT SPLIT_PART(symbol, '.', 1) as stock_id, 
-                (({price_field} - year_open) / year_open)*100 as ret
-        FROM stock_annual_k WHERE year = '{year}'
-    ),
-    joined_data AS (
-        SELECT h.hits, p.ret
-        FROM hit_table h 
-        JOIN perf_table p ON h.stock_id = p.stock_id
-    )
-    SELECT 
-        hits as "爆發次數", 
-        COUNT(*) as "股票檔數",
-        ROUND(AVG(ret)::numeric, 1) as "平均年度漲幅%",
-        ROUND(PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY ret)::numeric, 1) as "中位數漲幅%",
-        ROUND((COUNT(*) FILTER (WHERE ret > 20) * 100.0 / COUNT(*))::numeric, 1) as "勝率(>20%)",
-        ROUND((COUNT(*) FILTER (WHERE ret > 100) * 100.0 / COUNT(*))::numeric, 1) as "翻倍率(>100%)",
-        ROUND(MIN(ret)::numeric, 1) as "最低漲幅%",
-        ROUND(MAX(ret)::numeric, 1) as "最高漲幅%",
-        ROUND(STDDEV(ret)::numeric, 1) as "標準差%"
-    FROM joined_data
-    GROUP BY hits 
-    ORDER BY hits DESC;
-    """
-    
-    try:
-        with engine.connect() as conn:
-            return pd.read_sql_query(text(query), conn)
-    except Exception as e:
-        st.error(f"❌ 數據查詢失敗: {str(e)}")
-        # 如果中位數計算失敗，嘗試使用替代方法
-        st.warning("⚠️ 嘗試使用替代查詢...")
-        return fetch_prob_data_alt(year, metric_col, low, high, price_field)
-
-# ========== 4.1 替代方案：如果PERCENTILE_CONT不可用 ==========
-def fetch_prob_data_alt(year, metric_col, low, high, price_field="year_close"):
-    """替代方案：使用Python計算中位數"""
-    engine = get_engine()
-    minguo_year = int(year) - 1911
-    prev_minguo_year = minguo_year - 1
-    
-    # 先獲取原始數據
-    query = f"""
-    WITH hit_table AS (
-        SELECT stock_id, COUNT(*) as hits 
-        FROM monthly_revenue 
-        WHERE (
-            report_month = '{prev_minguo_year}_12' 
-            OR (report_month LIKE '{minguo_year}_%' AND report_month <= '{minguo_year}_11')
-        )
-        AND {metric_col} >= {low} AND {metric_col} < {high}
-        GROUP BY stock_id
-    ),
-    perf_table AS (
-        SELECT SPLIT_PART(symbol, '.', 1) as stock_id, 
-                (({price_field} - year_open) / year_open)*100 as ret
-        FROM stock_annual_k WHERE year = '{year}'
-    )
-    SELECT h.hits, p.ret
-    FROM hit_table h 
-    JOIN perf_table p ON h.stock_id = p.stock_id
-    """
-    
-    with engine.connect() as conn:
-        raw_df = pd.read_sql_query(text(query), conn)
-    
-    if raw_df.empty:
-        return pd.DataFrame()
-    
-    # 使用Python計算統計量
-    result = []
-    for hits, group in raw_df.groupby('hits'):
-        ret_series = group['ret']
-        result.append({
-            "爆發次數": hits,
-            "股票檔數": len(group),
-            "平均年度漲幅%": round(ret_series.mean(), 1),
-            "中位數漲幅%": round(ret_series.median(), 1),
-            "勝率(>20%)": round((ret_series > 20).sum() / len(group) * 100, 1),
-            "翻倍率(>100%)": round((ret_series > 100).sum() / len(group) * 100, 1),
-            "最低漲幅%": round(ret_series.min(), 1),
-            "最高漲幅%": round(ret_series.max(), 1),
-            "標準差%": round(ret_series.std(), 1) if len(group) > 1 else 0
-        })
-    
-    return pd.DataFrame(result).sort_values("爆發次數", ascending=False)
-
-# ========== 5. 新增：計算期望值指標 ==========
-def calculate_expected_value(df):
-    """計算期望值相關指標"""
-    if df.empty:
-        return pd.DataFrame()
-    
-    results = []
-    for _, row in df.iterrows():
-        hits = row["爆發次數"]
-        count = row["股票檔數"]
-        avg_return = row["平均年度漲幅%"]
-        median_return = row["中位數漲幅%"]
-        win_rate = row["勝率(>20%)"] / 100
-        
-        # 簡單期望值 = 平均報酬 * 股票檔數（權重）
-        expected_value = avg_return * count
-        
-        # 風險調整後期望值（考慮標準差）
-        std_dev = max(row.get("標準差%", 1), 1)
-        risk_adjusted = avg_return / std_dev if std_dev > 0 else 0
-        
-        # 成功率調整期望值
-        success_adjusted = avg_return * win_rate
-        
-        # 平均數與中位數差異
-        mean_median_diff = avg_return - median_return
-        
-        results.append({
-            "爆發次數": hits,
-            "股票檔數": count,
-            "平均年度漲幅%": avg_return,
-            "中位數漲幅%": median_return,
-            "平均-中位差": round(mean_median_diff, 1),
-            "勝率(>20%)": row["勝率(>20%)"],
-            "翻倍率(>100%)": row["翻倍率(>100%)"],
-            "期望值分數": round(expected_value / 100, 2) if expected_value != 0 else 0,
-            "風險調整分數": round(risk_adjusted, 2),
-            "成功率分數": round(success_adjusted, 2),
-            "綜合評分": round((expected_value/100 + risk_adjusted + success_adjusted) / 3, 2) if expected_value != 0 else 0
-        })
-    
-    return pd.DataFrame(results)
+profiler.start_run("probability")
 
 # ========== 6. UI 介面設計 ==========
+profiler.mark("6. UI 介面設計")
 st.title("🎲 營收爆發與年度報酬機率分析 2.0")
 st.markdown("""
 **研究目標**：分析月增率(MoM)或年增率(YoY)出現特定次數與股價年度報酬的關係
@@ -240,26 +57,25 @@ with st.sidebar:
     
     growth_range = st.select_slider(
         f"設定{metric_name}爆發區間 (%)", 
-        options=[-50, 0, 20, 50, 100, 150, 200, 300, 500, 1000], 
+        options=list(GROWTH_RANGE_OPTIONS), 
         value=(100, 1000)
     )
     
     st.markdown("---")
     st.markdown("### 📊 分析選項")
     show_advanced = st.checkbox("顯示進階分析", value=True)
-    show_multi_year = st.checkbox("顯示前後年度比較", value=False)  # 預設關閉，避免查詢錯誤
+    show_surface = st.checkbox("顯示區間機率曲面", value=True)
+    show_multi_year = st.checkbox("顯示前後年度比較", value=True)
     show_expected_value = st.checkbox("計算期望值評分", value=True)
 
-# ========== 7. 計算民國年份（全域變數） ==========
-# 在主要程式區域計算民國年份，以便後續查詢使用
-minguo_year = int(target_year) - 1911
-prev_minguo_year = minguo_year - 1
-
-# 獲取主要數據
-df_prob = fetch_prob_data(target_year, study_metric, growth_range[0], growth_range[1], price_field)
+# 獲取主要數據：滑桿所有區間一次算好，切換區間直接從記憶體取出
+with profiler.section("fetch_prob_surface"):
+    prob_surface = fetch_prob_surface(target_year, study_metric, price_field)
+    df_prob = select_prob_range(prob_surface, growth_range[0], growth_range[1])
 
 if not df_prob.empty:
     # ========== A. 核心數據顯示區 ==========
+    profiler.mark("A. 核心數據顯示區")
     st.subheader(f"📊 {target_year}年：{metric_name}達標次數 vs {price_label}年度報酬統計")
     st.caption(f"計算方式：{price_calc} | 使用{price_label}計算年度漲幅")
     
@@ -283,6 +99,7 @@ if not df_prob.empty:
     }), use_container_width=True)
     
     # ========== B. 視覺化分析 ==========
+    profiler.mark("B. 視覺化分析")
     if show_advanced and len(df_prob) > 1:
         col1, col2 = st.columns(2)
         
@@ -341,12 +158,51 @@ if not df_prob.empty:
                 - 當差異越大，代表該爆發次數區間的**右尾效應**越明顯
                 """)
     
+    # ========== B2. 區間機率曲面 ==========
+    profiler.mark("B2. 區間機率曲面")
+    if show_surface:
+        st.subheader(f"🗺️ 區間機率曲面：所有爆發區間 × 達標次數 ({price_label})")
+        st.caption(f"滑桿 {len(GROWTH_RANGE_OPTIONS)} 個選項組成的所有 [下限, 上限) 區間一次計算，"
+                   "方框為目前選擇的區間。")
+
+        surface_stat = st.radio("曲面統計量", ["勝率(>20%)", "中位數漲幅%", "平均年度漲幅%", "翻倍率(>100%)", "股票檔數"],
+                                horizontal=True)
+        surface_df = prob_surface.assign(區間=prob_surface["low"].astype(str) + "~" + prob_surface["high"].astype(str) + "%")
+        range_labels = surface_df.drop_duplicates(["low", "high"])["區間"].tolist()
+        surface_pivot = surface_df.pivot(index="爆發次數", columns="區間", values=surface_stat) \
+            .reindex(columns=range_labels).sort_index()
+        sample_pivot = surface_df.pivot(index="爆發次數", columns="區間", values="股票檔數") \
+            .reindex(index=surface_pivot.index, columns=range_labels)
+
+        fig_surface = go.Figure(go.Heatmap(
+            z=surface_pivot.values,
+            x=surface_pivot.columns,
+            y=surface_pivot.index,
+            customdata=sample_pivot.values,
+            colorscale="RdYlGn",
+            hovertemplate="區間 %{x}<br>達標 %{y} 次<br>" + surface_stat + ": %{z}<br>股票檔數: %{customdata}<extra></extra>",
+            colorbar=dict(title=surface_stat)
+        ))
+        current_label = f"{growth_range[0]}~{growth_range[1]}%"
+        if current_label in range_labels:
+            current_pos = range_labels.index(current_label)
+            fig_surface.add_shape(type="rect", x0=current_pos - 0.5, x1=current_pos + 0.5,
+                                  y0=surface_pivot.index.min() - 0.5, y1=surface_pivot.index.max() + 0.5,
+                                  line=dict(color="black", width=2))
+        fig_surface.update_layout(
+            title=f"{target_year}年 {metric_name}爆發區間 × 達標次數 → {surface_stat}",
+            xaxis_title=f"{metric_name}區間", yaxis_title="達標次數", height=550
+        )
+        st.plotly_chart(fig_surface, use_container_width=True)
+
     # ========== C. 期望值分析 ==========
+    profiler.mark("C. 期望值分析")
     if show_expected_value and len(df_prob) > 1:
         st.subheader("🎯 期望值與綜合評分分析")
         
         # 計算期望值指標
-        expected_df = calculate_expected_value(df_prob)
+        with profiler.section("calculate_expected_value"):
+            expected_df = calculate_expected_value(df_prob)
         
         if not expected_df.empty:
             # 找出最佳區間
@@ -375,18 +231,12 @@ if not df_prob.empty:
                 use_container_width=True)
     
     # ========== D. AI 分析助手區 ==========
+    profiler.mark("D. AI 分析助手區")
     st.markdown("---")
     st.subheader("🤖 AI 深度策略診斷")
     
     # 建構Markdown表格
-    table_data = df_prob.head(20)  # 限制行數避免過長
-    if not table_data.empty:
-        header = "| " + " | ".join(table_data.columns) + " |"
-        sep = "| " + " | ".join(["---"] * len(table_data.columns)) + " |"
-        rows = ["| " + " | ".join(map(str, row.values)) + " |" for _, row in table_data.iterrows()]
-        table_md = "\n".join([header, sep] + rows)
-    else:
-        table_md = "無數據"
+    table_md = markdown_table(df_prob.head(20))  # 限制行數避免過長
     
     # 建構完整的提示詞
     prompt_text = f"""
@@ -455,83 +305,36 @@ if not df_prob.empty:
         )
     
     # ========== E. 前後年度比較分析 ==========
+    profiler.mark("E. 前後年度比較分析")
     if show_multi_year:
         st.markdown("---")
         st.subheader("📈 前後年度表現比較分析")
         
-        st.warning("⚠️ 此功能需要查詢多年度數據，可能會影響效能。")
-        
-        # 獲取詳細股票名單
-        list_query = f"""
-        WITH hit_table AS (
-            SELECT stock_id, COUNT(*) as hits 
-            FROM monthly_revenue 
-            WHERE (
-                report_month = '{prev_minguo_year}_12' 
-                OR (report_month LIKE '{minguo_year}_%' AND report_month <= '{minguo_year}_11')
-            )
-            AND {study_metric} >= {growth_range[0]} AND {study_metric} < {growth_range[1]}
-            GROUP BY stock_id
-        )
-        SELECT h.stock_id as stock_id, h.hits as hits
-        FROM hit_table h
-        LIMIT 100  -- 限制數量避免查詢過大
-        """
-        
+        st.caption(f"所有在 {target_year} 年觀察期內達標的股票，依爆發次數分組比較 "
+                   f"{int(target_year) - 2} ~ {int(target_year) + 1} 年的年度報酬（{price_label}）")
+
         try:
-            with get_engine().connect() as conn:
-                stock_list_df = pd.read_sql_query(text(list_query), conn)
-            
-            if not stock_list_df.empty:
-                # 獲取前後年度數據
-                multi_year_df = fetch_multi_year_data(stock_list_df['stock_id'].tolist(), target_year, price_field)
-                
-                if not multi_year_df.empty:
-                    # 按爆發次數分組分析
-                    merged_df = pd.merge(stock_list_df, multi_year_df, on='stock_id')
-                    
-                    # 計算各爆發次數的前後年度表現
-                    year_stats = []
-                    
-                    for hits, group in merged_df.groupby('hits'):
-                        for year, year_group in group.groupby('year'):
-                            year_stats.append({
-                                '爆發次數': hits,
-                                '年度': year,
-                                '平均報酬%': round(year_group['annual_return'].mean(), 1),
-                                '中位數報酬%': round(year_group['annual_return'].median(), 1),
-                                '樣本數': len(year_group)
-                            })
-                    
-                    year_stats_df = pd.DataFrame(year_stats)
-                    
-                    if not year_stats_df.empty:
-                        # 轉換為寬格式
-                        pivot_mean = year_stats_df.pivot_table(
-                            index='爆發次數', 
-                            columns='年度', 
-                            values='平均報酬%',
-                            aggfunc='first'
-                        ).round(1)
-                        
-                        pivot_median = year_stats_df.pivot_table(
-                            index='爆發次數', 
-                            columns='年度', 
-                            values='中位數報酬%',
-                            aggfunc='first'
-                        ).round(1)
-                        
-                        # 合併顯示
-                        st.write("### 前後年度平均報酬 (%)")
-                        st.dataframe(pivot_mean, use_container_width=True)
-                        
-                        st.write("### 前後年度中位數報酬 (%)")
-                        st.dataframe(pivot_median, use_container_width=True)
-                        
+            with profiler.section("fetch_multi_year_stats"):
+                year_stats_df = fetch_multi_year_stats(target_year, study_metric, growth_range[0], growth_range[1],
+                                                       price_field)
+
+            if not year_stats_df.empty:
+                # 轉換為寬格式
+                pivot_mean = year_stats_df.pivot(index='爆發次數', columns='年度', values='平均報酬%').round(1)
+                pivot_median = year_stats_df.pivot(index='爆發次數', columns='年度', values='中位數報酬%').round(1)
+
+                # 合併顯示
+                st.write("### 前後年度平均報酬 (%)")
+                st.dataframe(pivot_mean, use_container_width=True)
+
+                st.write("### 前後年度中位數報酬 (%)")
+                st.dataframe(pivot_median, use_container_width=True)
+
         except Exception as e:
             st.error(f"前後年度數據查詢失敗: {str(e)}")
-    
+
     # ========== F. 區間名單點名功能 ==========
+    profiler.mark("F. 區間名單點名功能")
     st.markdown("---")
     st.subheader("🔍 詳細名單分析")
     
@@ -539,37 +342,11 @@ if not df_prob.empty:
     if hit_options:
         selected_hits = st.selectbox("選擇『爆發次數』查看具體股票名單：", hit_options, key="hits_selector")
         
-        # 獲取詳細名單
-        detail_query = f"""
-        WITH hit_table AS (
-            SELECT stock_id, COUNT(*) as hits 
-            FROM monthly_revenue 
-            WHERE (
-                report_month = '{prev_minguo_year}_12' 
-                OR (report_month LIKE '{minguo_year}_%' AND report_month <= '{minguo_year}_11')
-            )
-            AND {study_metric} >= {growth_range[0]} AND {study_metric} < {growth_range[1]}
-            GROUP BY stock_id
-        )
-        SELECT h.stock_id as "股票代號", 
-               COALESCE(m.stock_name, 'N/A') as "股票名稱",
-               h.hits as "爆發次數",
-               ROUND(((k.{price_field} - k.year_open)/k.year_open*100)::numeric, 1) as "年度漲幅%",
-               ROUND(AVG(m.{study_metric})::numeric, 1) as "平均增長%",
-               STRING_AGG(DISTINCT CASE WHEN m.remark <> '-' AND m.remark <> '' THEN m.remark END, ' | ') as "關鍵備註"
-        FROM hit_table h
-        LEFT JOIN stock_annual_k k ON h.stock_id = SPLIT_PART(k.symbol, '.', 1) AND k.year = '{target_year}'
-        LEFT JOIN monthly_revenue m ON h.stock_id = m.stock_id 
-          AND (m.report_month LIKE '{minguo_year}_%' OR m.report_month = '{prev_minguo_year}_12')
-        WHERE h.hits = {selected_hits}
-        GROUP BY h.stock_id, m.stock_name, k.{price_field}, k.year_open, h.hits
-        ORDER BY "年度漲幅%" DESC NULLS LAST
-        LIMIT 100;
-        """
-        
         try:
-            with get_engine().connect() as conn:
-                detail_df = pd.read_sql_query(text(detail_query), conn)
+            # 獲取詳細名單
+            with profiler.section("fetch_burst_detail"):
+                detail_df = fetch_burst_detail(target_year, study_metric, growth_range[0], growth_range[1],
+                                               price_field, selected_hits)
             
             if not detail_df.empty:
                 st.write(f"### 🏆 {target_year}年『營收爆發 {selected_hits} 次』股票清單（共{len(detail_df)}檔）")
@@ -612,6 +389,7 @@ else:
 
 
 # ========== 8. 頁尾資訊 ==========
+profiler.mark("8. 頁尾資訊")
 st.markdown("---")
 footer_col1, footer_col2, footer_col3 = st.columns(3)
 with footer_col1:
@@ -662,3 +440,6 @@ header {visibility: hidden;}
 </style>
 """
 st.markdown(hide_st_style, unsafe_allow_html=True)
+
+# 效能剖析面板（SRL_PROFILE=1 時才顯示）
+profiler.render_panel()
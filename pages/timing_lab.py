@@ -2,12 +2,17 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from scipy import stats
-from sqlalchemy import create_engine, text
 import urllib.parse
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 import os
+from data_access import (
+    fetch_timing_sweep_data, select_threshold_events, with_event_year,
+    fetch_spark_events, fetch_event_weekly_returns, fetch_market_weekly_returns
+)
+from event_study import DEFAULT_WINDOWS, TIMING_STAGES, run_event_study, threshold_sweep
+import profiler
 
 # 嘗試匯入 AI 套件
 try:
@@ -22,20 +27,7 @@ st.set_page_config(
     layout="wide",
     page_icon="📊"
 )
-
-# ========== 2. 安全資料庫連線 ==========
-@st.cache_resource
-def get_engine():
-    try:
-        DB_PASSWORD = st.secrets["DB_PASSWORD"]
-        PROJECT_REF = st.secrets["PROJECT_REF"]
-        POOLER_HOST = st.secrets["POOLER_HOST"]
-        encoded_password = urllib.parse.quote_plus(DB_PASSWORD)
-        connection_string = f"postgresql://postgres.{PROJECT_REF}:{encoded_password}@{POOLER_HOST}:5432/postgres?sslmode=require"
-        return create_engine(connection_string)
-    except Exception:
-        st.error("❌ 資料庫連線失敗")
-        st.stop()
+profiler.start_run("timing_lab")
 
 # ========== 3. 數據輔助函數 ==========
 def get_ai_summary_dist(df, col_name):
@@ -200,72 +192,20 @@ def detect_outliers(df, col, threshold=1.5):
     outliers = df[(df[col] < lower_bound) | (df[col] > upper_bound)]
     return outliers
 
-# ========== 4. 核心 SQL 邏輯 (初次爆發) - 修改為支援價格計算方式 ==========
-@st.cache_data(ttl=3600)
-def fetch_timing_data(year, metric_col, limit, keyword, price_field="w_close"):
-    """
-    修改SQL查詢以支援不同的價格計算方式
-    price_field: 可以是 'w_close' (收盤價) 或 'w_high' (最高價)
-    """
-    engine = get_engine()
-    minguo_year = int(year) - 1911
-    
-    # 根據價格計算方式選擇欄位
-    if price_field == "w_high":
-        price_select = "w_high"
-    else:
-        price_select = "w_close"
-    
-    query = f"""
-    WITH raw_events AS (
-        SELECT stock_id, stock_name, report_month, {metric_col}, remark,
-               LAG({metric_col}) OVER (PARTITION BY stock_id ORDER BY report_month) as prev_metric
-        FROM monthly_revenue
-        WHERE report_month LIKE '{minguo_year}_%' OR report_month LIKE '{int(minguo_year)-1}_12'
-    ),
-    spark_events AS (
-        SELECT *,
-               CASE 
-                 WHEN RIGHT(report_month, 2) = '12' THEN (LEFT(report_month, 3)::int + 1 + 1911)::text || '-01-10'
-                 ELSE (LEFT(report_month, 3)::int + 1911)::text || '-' || LPAD((RIGHT(report_month, 2)::int + 1)::text, 2, '0') || '-10'
-               END::date as base_date
-        FROM raw_events
-        WHERE {metric_col} >= {limit} 
-          AND (prev_metric < {limit} OR prev_metric IS NULL)
-          AND report_month LIKE '{minguo_year}_%'
-          AND (remark LIKE '%%{keyword}%%' OR stock_name LIKE '%%{keyword}%%')
-    ),
-    weekly_calc AS (
-        SELECT symbol, date, {price_select},
-               ({price_select} - LAG({price_select}) OVER (PARTITION BY symbol ORDER BY date)) / 
-               NULLIF(LAG({price_select}) OVER (PARTITION BY symbol ORDER BY date), 0) * 100 as weekly_ret
-        FROM stock_weekly_k
-    ),
-    final_detail AS (
-        SELECT 
-            e.stock_id, e.stock_name, e.report_month, e.{metric_col} as growth_val, e.remark,
-            AVG(CASE WHEN c.date >= e.base_date - interval '38 days' AND c.date < e.base_date - interval '9 days' THEN c.weekly_ret END) * 4 as pre_month,
-            AVG(CASE WHEN c.date >= e.base_date - interval '9 days' AND c.date <= e.base_date - interval '3 days' THEN c.weekly_ret END) as pre_week,
-            AVG(CASE WHEN c.date > e.base_date - interval '3 days' AND c.date <= e.base_date + interval '4 days' THEN c.weekly_ret END) as announce_week,
-            AVG(CASE WHEN c.date > e.base_date + interval '4 days' AND c.date <= e.base_date + interval '11 days' THEN c.weekly_ret END) as after_week_1,
-            AVG(CASE WHEN c.date > e.base_date + interval '11 days' AND c.date <= e.base_date + interval '30 days' THEN c.weekly_ret END) as after_month
-        FROM spark_events e
-        JOIN weekly_calc c ON e.stock_id = SPLIT_PART(c.symbol, '.', 1)
-        GROUP BY e.stock_id, e.stock_name, e.report_month, e.{metric_col}, e.remark, e.base_date
-    )
-    SELECT * FROM final_detail WHERE pre_week IS NOT NULL ORDER BY pre_month DESC;
-    """
-    with engine.connect() as conn:
-        return pd.read_sql_query(text(query), conn)
-
 # ========== 5. 使用介面區 ==========
+profiler.mark("5. 使用介面區")
+ALL_YEARS = "全部年度"
+THRESHOLD_RANGE = (30, 300)  # 爆發門檻滑桿範圍；範圍內所有門檻的事件只查詢一次
+
 with st.sidebar:
     st.title("🔬 參數設定")
     
     st.markdown("---")
-    target_year = st.selectbox("分析年度", [str(y) for y in range(2025, 2019, -1)], index=1)
+    year_options = [str(y) for y in range(2025, 2019, -1)]
+    target_year = st.selectbox("分析年度", year_options + [ALL_YEARS], index=1,
+                               help=f"{ALL_YEARS}：合併所有年度的事件，比較各年度 T-1月效應是否穩定")
     study_metric = st.radio("指標選擇", ["yoy_pct", "mom_pct"])
-    threshold = st.slider(f"爆發門檻 %", 30, 300, 100)
+    threshold = st.slider(f"爆發門檻 %", THRESHOLD_RANGE[0], THRESHOLD_RANGE[1], 100)
     search_remark = st.text_input("🔍 關鍵字搜尋", "")
     
     st.markdown("---")
@@ -306,8 +246,17 @@ with st.sidebar:
     6. 使用AI深度診斷
     """)
 
+# 全部年度模式：一次查詢所有年度，多一欄 year
+all_years_mode = target_year == ALL_YEARS
+if all_years_mode:
+    analysis_years = tuple(sorted(year_options))
+    year_label = f"{analysis_years[0]}~{analysis_years[-1]}"
+else:
+    analysis_years = target_year
+    year_label = target_year
+
 # 主標題
-st.title(f"📊 {target_year}年 公告行為研究室 4.4")
+st.title(f"📊 {year_label}年 公告行為研究室 4.4")
 st.caption(f"增強版 - {price_calc} | 含偏度、峰度、變異係數等進階統計分析")
 # 加入數據侷限性說明
 st.warning(f"""
@@ -321,10 +270,17 @@ st.warning(f"""
 
 # 獲取數據
 with st.spinner("正在載入數據..."):
-    df = fetch_timing_data(target_year, study_metric, threshold, search_remark, price_field)
+    # 門檻範圍內所有事件的聯集，單一門檻在本機篩選（拖動門檻滑桿不重新查詢）
+    with profiler.section("fetch_timing_sweep_data"):
+        sweep_df = fetch_timing_sweep_data(analysis_years, study_metric, search_remark, price_field, THRESHOLD_RANGE)
+    with profiler.section("fetch_timing_data"):
+        df = select_threshold_events(sweep_df, threshold)
+        if all_years_mode:
+            df = with_event_year(df, analysis_years)
 
 if not df.empty:
     # ========== A. 數據看板 (Mean vs Median) ==========
+    profiler.mark("A. 數據看板")
     total_n = len(df)
     
     # 定義統計計算函數
@@ -355,6 +311,7 @@ if not df.empty:
     st.markdown("---")
     
     # ========== B. 原始明細清單 ==========
+    profiler.mark("B. 原始明細清單")
     st.subheader(f"📋 原始數據明細 - {price_calc}")
     
     # 控制按鈕
@@ -363,7 +320,7 @@ if not df.empty:
         st.download_button(
             label="📥 下載 CSV", 
             data=df.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig'), 
-            file_name=f'stock_revenue_{target_year}_{price_label}.csv',
+            file_name=f'stock_revenue_{year_label}_{price_label}.csv',
             mime='text/csv'
         )
     with col_btn2:
@@ -376,7 +333,7 @@ if not df.empty:
         copy_data = df[['stock_id', 'stock_name', 'growth_val', 'pre_month', 'pre_week', 'after_week_1', 'after_month', 'remark']].head(300)
         md_table = copy_data.to_markdown(index=False)
         
-        st.code(f"""請針對以下 {target_year} 年營收爆發股數據進行診斷（使用{price_calc}）：
+        st.code(f"""請針對以下 {year_label} 年營收爆發股數據進行診斷（使用{price_calc}）：
 
 {md_table}
 
@@ -404,6 +361,7 @@ if not df.empty:
     st.markdown("---")
     
     # ========== C. 進階統計指標 ==========
+    profiler.mark("C. 進階統計指標")
     if show_advanced:
         st.subheader(f"🔬 進階統計分析 - {price_calc}")
         
@@ -530,6 +488,7 @@ if not df.empty:
         st.markdown("---")
     
     # ========== D. 完整五張分佈圖 ==========
+    profiler.mark("D. 完整五張分佈圖")
     st.subheader(f"📊 階段報酬分佈分析 - {price_calc}")
     
     # 使用tabs組織分佈圖
@@ -622,8 +581,145 @@ if not df.empty:
             """)
     
     st.markdown("---")
-    
+
+    # ========== D2. 自訂事件視窗 (本機事件研究引擎) ==========
+    profiler.mark("D2. 自訂事件視窗")
+    st.subheader(f"📐 自訂事件視窗與累積報酬曲線 - {price_calc}")
+    st.caption("以週為單位（T = 公告週），在本機一次計算所有事件的任意視窗累積報酬與 CAR 曲線，不需重新查詢。")
+
+    col_win1, col_win2 = st.columns([2, 1])
+    with col_win1:
+        event_window = st.slider("事件視窗（週）", -26, 26, (-8, 12), help="例如 T-8週 ~ T+12週")
+    with col_win2:
+        use_abnormal = st.checkbox("扣除市場平均（異常報酬 CAR）", value=True,
+                                   help="每週報酬減去全市場等權平均週報酬")
+
+    # 查詢門檻範圍內的事件聯集（拖動門檻滑桿不重新查詢），再篩出與上方明細同一批事件
+    with profiler.section("fetch_event_weekly_returns"):
+        spark_events = fetch_spark_events(analysis_years, study_metric, THRESHOLD_RANGE, search_remark)
+        spark_events = spark_events.merge(df[['stock_id', 'report_month']], on=['stock_id', 'report_month'])
+        event_returns = fetch_event_weekly_returns(analysis_years, study_metric, THRESHOLD_RANGE, search_remark,
+                                                   price_field, -event_window[0], event_window[1])
+        market_returns = None
+        if use_abnormal and not event_returns.empty:
+            market_returns = fetch_market_weekly_returns(event_returns['date'].min(), event_returns['date'].max(),
+                                                         price_field)
+
+    custom_windows = dict(DEFAULT_WINDOWS)
+    custom_windows[f"T{event_window[0]:+d}w ~ T{event_window[1]:+d}w"] = event_window
+    with profiler.section("run_event_study"):
+        per_event, car_curve = run_event_study(spark_events, event_returns, market_returns,
+                                               event_window, custom_windows)
+
+    if not car_curve['car_mean'].isna().all():
+        fig_car = go.Figure()
+        fig_car.add_trace(go.Scatter(x=car_curve['week'], y=car_curve['car_q75'], line=dict(width=0),
+                                     showlegend=False, hoverinfo='skip'))
+        fig_car.add_trace(go.Scatter(x=car_curve['week'], y=car_curve['car_q25'], line=dict(width=0),
+                                     fill='tonexty', fillcolor='rgba(30,144,255,0.15)', name='25%~75%'))
+        fig_car.add_trace(go.Scatter(x=car_curve['week'], y=car_curve['car_mean'], mode='lines+markers',
+                                     name='平均', line=dict(color='#1e90ff', width=3)))
+        fig_car.add_trace(go.Scatter(x=car_curve['week'], y=car_curve['car_median'], mode='lines',
+                                     name='中位數', line=dict(color='#ff4b4b', dash='dash')))
+        fig_car.add_vline(x=0, line_dash="dot", line_color="gray", annotation_text="T 公告週")
+        fig_car.add_hline(y=0, line_color="lightgray")
+        fig_car.update_layout(
+            title=f"{'累積異常報酬 (CAR)' if use_abnormal else '累積報酬'} 曲線 ({price_calc}, n={len(per_event)})",
+            xaxis_title="相對公告週", yaxis_title="累積報酬 %", height=450, hovermode="x unified"
+        )
+        st.plotly_chart(fig_car, use_container_width=True)
+
+        window_summary = pd.DataFrame([
+            {
+                "視窗": name,
+                "週數": f"T{w[0]:+d} ~ T{w[1]:+d}",
+                "平均%": per_event[name].mean(),
+                "中位數%": per_event[name].median(),
+                "上漲機率%": (per_event[name] > 0).sum() / per_event[name].notna().sum() * 100
+                if per_event[name].notna().any() else np.nan,
+                "樣本數": int(per_event[name].notna().sum()),
+            }
+            for name, w in custom_windows.items()
+        ])
+        st.dataframe(window_summary.style.format({"平均%": "{:.2f}", "中位數%": "{:.2f}", "上漲機率%": "{:.1f}"}),
+                     use_container_width=True, hide_index=True)
+    else:
+        st.info("此視窗內沒有可用的週報酬資料")
+
+    st.markdown("---")
+
+    # ========== D3. 跨年度穩定性 (全部年度模式) ==========
+    profiler.mark("D3. 跨年度穩定性")
+    if all_years_mode:
+        st.subheader(f"🗓️ 跨年度穩定性 - {price_calc}")
+        st.caption("同一套門檻與關鍵字在每個年度分別統計，檢查 T-1月 效應是否每年都存在，而不是少數年度撐起平均。")
+
+        grouped = df.groupby('year')
+        by_year = pd.concat({
+            label: pd.DataFrame({
+                "平均%": grouped[col].mean(),
+                "中位數%": grouped[col].median(),
+                "上漲機率%": grouped[col].apply(lambda s: (s > 0).sum() / s.notna().sum() * 100
+                                              if s.notna().any() else np.nan),
+            })
+            for col, label in TIMING_STAGES.items()
+        }, axis=1)
+        by_year[("樣本", "事件數")] = grouped.size()
+
+        fig_years = go.Figure()
+        fig_years.add_trace(go.Bar(x=by_year.index, y=by_year[("T-1月", "平均%")], name="T-1月 平均",
+                                   marker_color="#8a2be2"))
+        fig_years.add_trace(go.Scatter(x=by_year.index, y=by_year[("T-1月", "中位數%")], name="T-1月 中位數",
+                                       mode="lines+markers", line=dict(color="#ff4b4b", dash="dash")))
+        fig_years.add_trace(go.Scatter(x=by_year.index, y=by_year[("T-1月", "上漲機率%")], name="T-1月 上漲機率",
+                                       mode="lines+markers", yaxis="y2", line=dict(color="#32cd32")))
+        fig_years.add_hline(y=0, line_color="lightgray")
+        fig_years.update_layout(
+            title=f"各年度 T-1月 報酬 ({price_calc})", xaxis_title="年度", yaxis_title="報酬 %",
+            yaxis2=dict(title="上漲機率 %", overlaying="y", side="right", range=[0, 100]),
+            height=420, hovermode="x unified"
+        )
+        st.plotly_chart(fig_years, use_container_width=True)
+
+        pre_month_means = by_year[("T-1月", "平均%")].dropna()
+        positive_years = int((pre_month_means > 0).sum())
+        st.info(f"T-1月 平均報酬為正的年度：{positive_years} / {len(pre_month_means)}；"
+                f"年度平均的標準差 {pre_month_means.std():.2f}%")
+        st.dataframe(by_year.style.format("{:.2f}", subset=[c for c in by_year.columns if c[0] != "樣本"]),
+                     use_container_width=True)
+
+        st.markdown("---")
+
+    # ========== D4. 門檻掃描 ==========
+    profiler.mark("D4. 門檻掃描")
+    st.subheader(f"🎚️ 門檻掃描：各階段報酬 vs 爆發門檻 - {price_calc}")
+    st.caption(f"以同一批事件聯集一次算出 {THRESHOLD_RANGE[0]}%~{THRESHOLD_RANGE[1]}% 每個門檻的統計，"
+               "觀察結論是否只在特定門檻成立。")
+
+    sweep_stat = st.radio("掃描統計量", ["平均", "中位數", "上漲機率"], horizontal=True)
+    sweep_col = {"平均": "mean", "中位數": "median", "上漲機率": "win_rate"}[sweep_stat]
+    with profiler.section("threshold_sweep"):
+        sweep = threshold_sweep(sweep_df, np.arange(THRESHOLD_RANGE[0], THRESHOLD_RANGE[1] + 1))
+
+    fig_sweep = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.7, 0.3], vertical_spacing=0.06)
+    for label, color in zip(TIMING_STAGES.values(), ["#8a2be2", "#ff4b4b", "#ffaa00", "#32cd32", "#1e90ff"]):
+        stage = sweep[sweep['stage'] == label]
+        fig_sweep.add_trace(go.Scatter(x=stage['threshold'], y=stage[sweep_col], name=label,
+                                       mode='lines', line=dict(color=color)), row=1, col=1)
+    events_per_threshold = sweep.drop_duplicates('threshold')
+    fig_sweep.add_trace(go.Bar(x=events_per_threshold['threshold'], y=events_per_threshold['n_events'],
+                               name='事件數', marker_color='lightgray'), row=2, col=1)
+    fig_sweep.add_vline(x=threshold, line_dash="dot", line_color="gray", annotation_text=f"目前門檻 {threshold}%")
+    fig_sweep.update_yaxes(title_text=f"{sweep_stat} %", row=1, col=1)
+    fig_sweep.update_yaxes(title_text="事件數", row=2, col=1)
+    fig_sweep.update_xaxes(title_text="爆發門檻 %", row=2, col=1)
+    fig_sweep.update_layout(height=550, hovermode="x unified")
+    st.plotly_chart(fig_sweep, use_container_width=True)
+
+    st.markdown("---")
+
     # ========== E. AI 診斷 (增強版) ==========
+    profiler.mark("E. AI 診斷")
     st.subheader(f"🤖 AI 投資行為深度診斷 - {price_calc}")
     
     # 生成分佈摘要
@@ -652,7 +748,7 @@ if not df.empty:
 - **實務意義**: {'代表實際可實現的報酬' if price_field == 'w_close' else '代表理論最大潛力漲幅'}
 
 ## 數據概要
-- 分析年度：{target_year}
+- 分析年度：{year_label}
 - 樣本規模：{total_n}檔符合{threshold}%增長門檻
 - 指標類型：{study_metric}
 - 爆發門檻：{threshold}%
@@ -690,7 +786,7 @@ if not df.empty:
 - **重要**：請特別說明{price_calc}對策略建議的影響，以及如果換成另一種計算方式，策略應如何調整？
 
 ### 5. 年度比較洞察 ({price_calc})
-- 與過往年度相比，{target_year}年的營收公告效應呈現什麼特殊現象？
+- 與過往年度相比，{year_label}年的營收公告效應呈現什麼特殊現象？
 - 從「上漲機率」趨勢(T-1月:{advanced_stats.get('T-1月', {}).get('win_rate', 'N/A')}% → T+1月:{advanced_stats.get('T+1月', {}).get('win_rate', 'N/A')}%)看策略有效性
 - 計算方式影響：{price_calc}的選擇是否會改變對年度效應的判斷？
 
@@ -763,7 +859,8 @@ if not df.empty:
                                 if target_model:
                                     model = genai.GenerativeModel(target_model)
                                     with st.spinner(f"🤖 AI 正在深度分析 {total_n} 筆樣本數據 ({price_calc})..."):
-                                        response = model.generate_content(prompt_text)
+                                        with profiler.section("Gemini generate_content"):
+                                            response = model.generate_content(prompt_text)
                                         
                                         st.success(f"✅ AI 診斷完成 ({price_calc})")
                                         st.markdown("---")
@@ -771,11 +868,11 @@ if not df.empty:
                                         st.markdown(response.text)
                                         
                                         # 提供下載報告
-                                        report_text = f"# {target_year}年台股營收爆發分析報告 ({price_calc})\n\n" + response.text
+                                        report_text = f"# {year_label}年台股營收爆發分析報告 ({price_calc})\n\n" + response.text
                                         st.download_button(
                                             label="📥 下載 AI 報告",
                                             data=report_text.encode('utf-8'),
-                                            file_name=f"stock_revenue_ai_report_{target_year}_{price_label}.md",
+                                            file_name=f"stock_revenue_ai_report_{year_label}_{price_label}.md",
                                             mime="text/markdown"
                                         )
                                 else:
@@ -798,6 +895,7 @@ else:
     """)
 
 # ========== 6. 頁尾資訊 ==========
+profiler.mark("6. 頁尾資訊")
 st.markdown("---")
 # ========== 6. 頁尾資訊 ==========
 st.markdown("---")
@@ -810,6 +908,7 @@ with footer_col3:
     st.markdown(f"**計算方式**：{price_calc}")
 
 # ========== 7. 快速資源連結 ==========
+profiler.mark("7. 快速資源連結")
 st.divider()
 st.markdown("### 🔗 快速資源連結")
 
@@ -856,3 +955,6 @@ if 'run_ai_diagnosis' not in st.session_state:
     st.session_state.run_ai_diagnosis = False
 if 'show_stats' not in st.session_state:
     st.session_state.show_stats = False
+
+# 效能剖析面板（SRL_PROFILE=1 時才顯示）
+profiler.render_panel()
@@ -0,0 +1,29 @@
+"""
+營收報表期間 (period) 工具
+
+monthly_revenue.period 為西元年月整數，例如民國 '113_05' -> 202405。
+(見 sql/003_report_period.sql)
+"""
+
+
+def to_period(year, month):
+    """西元年、月 -> period 整數"""
+    return int(year) * 100 + int(month)
+
+
+def observation_window(year):
+    """
+    西元年度 -> 觀察期 (start_period, end_period)，兩端皆包含
+
+    台灣營收公布有滯後性，1月看到的是去年12月營收、12月看到的是11月營收，
+    因此以「去年12月 ~ 當年11月」共12份報表作為一個年度觀察期。
+    """
+    year = int(year)
+    return to_period(year - 1, 12), to_period(year, 11)
+
+
+def year_range(year):
+    """西元年度 -> 當年1月 ~ 12月的 (start_period, end_period)"""
+    year = int(year)
+    return to_period(year, 1), to_period(year, 12)
+
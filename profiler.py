@@ -0,0 +1,242 @@
+"""
+頁面 rerun 效能剖析 (opt-in)
+
+Streamlit 每次操作元件都會重跑整支腳本，這裡提供輕量的計時工具，找出每次 rerun
+的時間花在哪個區塊（資料庫查詢、pivot、px.imshow、Styler、Gemini 呼叫…）：
+
+    profiler.start_run("app")             # 腳本開頭
+    profiler.mark("9. 熱力圖")             # 編號區塊開頭：結束上一段、開始這一段（不需要縮排整段程式）
+    with profiler.section("px.imshow"):   # 區塊內的熱點另外計時
+        fig = px.imshow(...)
+    profiler.render_panel()               # 腳本結尾：可收合的計時面板 + 寫入 JSONL
+
+data_access 的查詢函式經由 profiler.cache_data 裝飾，記錄每個函式的呼叫次數與
+快取未命中次數（未命中 = 真的執行了函式本體；其中 disk_hits 次由 result_cache 的
+共用快取 disk / redis 取得，不必重新查詢）；實際送出的 SQL 由 query_log 記錄到
+record_query（耗時、列數、結果大小）。
+
+啟用方式（擇一，未啟用時以上呼叫都不做事）：
+    SRL_PROFILE=1 streamlit run app.py
+    或在 .streamlit/secrets.toml 設定
+        [profiling]
+        enabled = true
+        log_path = "logs/profile.jsonl"
+
+JSONL 每次 rerun 一行：{"ts", "page", "total_ms", "sections": [...], "cache": {...}, "queries": [...]}，
+可用 pandas.read_json(path, lines=True) 彙整。
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+DEFAULT_LOG_PATH = "logs/profile.jsonl"
+
+# 每個 Streamlit session 的腳本在自己的執行緒執行，計時狀態也依執行緒分開
+_state = threading.local()
+
+
+# ========== 1. 設定 ==========
+def get_profile_settings():
+    """secrets [profiling] 區段 + 環境變數 SRL_PROFILE / SRL_PROFILE_LOG 覆寫"""
+    settings = {"enabled": False, "log_path": DEFAULT_LOG_PATH}
+    try:
+        settings.update(st.secrets.get("profiling", {}))
+    except Exception:
+        pass  # 沒有 secrets.toml 時使用預設值
+    if os.environ.get("SRL_PROFILE"):
+        settings["enabled"] = os.environ["SRL_PROFILE"].lower() not in ("0", "false", "no")
+    if os.environ.get("SRL_PROFILE_LOG"):
+        settings["log_path"] = os.environ["SRL_PROFILE_LOG"]
+    return settings
+
+
+def is_enabled():
+    return bool(get_profile_settings()["enabled"])
+
+
+def _current_run():
+    """目前這次 rerun 的紀錄；未啟用或沒有呼叫 start_run 時為 None"""
+    return getattr(_state, "run", None)
+
+
+# ========== 2. 區塊計時 ==========
+def start_run(page: str):
+    """腳本開頭呼叫：重設這次 rerun 的計時與快取計數"""
+    if not is_enabled():
+        _state.run = None
+        return
+    _state.run = {
+        "page": page,
+        "started": time.perf_counter(),
+        "sections": [],   # (名稱, 毫秒)
+        "stack": [],      # 目前所在的 section 名稱（巢狀時以 " / " 串接）
+        "lap": None,      # (mark 名稱, 開始時間)
+        "cache": {},      # 函式名稱 -> {"calls", "misses", "disk_hits", "miss_ms"}
+        "queries": [],    # query_log.timed_query 的紀錄
+    }
+
+
+def _record(run, name, started):
+    run["sections"].append((name, (time.perf_counter() - started) * 1000))
+
+
+def _close_lap(run):
+    if run["lap"] is not None:
+        _record(run, *run["lap"])
+        run["lap"] = None
+
+
+def mark(name: str):
+    """編號區塊的分段計時：結束上一個 mark 的區段，從這裡開始計時新區段"""
+    run = _current_run()
+    if run is None:
+        return
+    _close_lap(run)
+    run["lap"] = (name, time.perf_counter())
+
+
+@contextmanager
+def section(name: str):
+    """區塊內熱點的計時；在 mark 區段內使用時名稱記為 'mark / name'"""
+    run = _current_run()
+    if run is None:
+        yield
+        return
+    parents = ([run["lap"][0]] if run["lap"] else []) + run["stack"]
+    full_name = " / ".join(parents + [name])
+    run["stack"].append(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        run["stack"].pop()
+        _record(run, full_name, started)
+
+
+# ========== 3. 快取命中率 ==========
+def cache_data(**cache_kwargs):
+    """
+    st.cache_data 的替代裝飾器，另外記錄呼叫次數與未命中次數
+
+    外層函式每次呼叫都會執行（= 呼叫次數），內層函式只在快取未命中時執行（= 未命中次數）。
+    兩層都用 functools.wraps 保留原函式名稱與 __wrapped__，st.cache_data 以
+    inspect.getsource 計算快取鍵時會追到原函式的原始碼，快取行為與直接使用 st.cache_data 相同。
+    """
+    def decorator(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        def on_miss(*args, **kwargs):
+            run = _current_run()
+            if run is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats = _cache_stats(run, name)
+                stats["misses"] += 1
+                stats["miss_ms"] += (time.perf_counter() - started) * 1000
+
+        cached = st.cache_data(**cache_kwargs)(on_miss)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            run = _current_run()
+            if run is not None:
+                _cache_stats(run, name)["calls"] += 1
+            return cached(*args, **kwargs)
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorator
+
+
+def _cache_stats(run, name):
+    return run["cache"].setdefault(name, {"calls": 0, "misses": 0, "disk_hits": 0, "miss_ms": 0.0})
+
+
+def record_disk_hit(name: str):
+    """result_cache 從共用快取（disk / redis）取得結果時呼叫（記憶體未命中、但不必重新查詢）"""
+    run = _current_run()
+    if run is not None:
+        _cache_stats(run, name)["disk_hits"] += 1
+
+
+def record_query(entry: dict):
+    """query_log 每執行一次 SQL 呼叫一次：{"caller", "fingerprint", "ms", "rows", "bytes", "statement"}"""
+    run = _current_run()
+    if run is not None:
+        run["queries"].append(entry)
+
+
+# ========== 4. 面板與 JSONL ==========
+def summary():
+    """(區段表, 快取表) 兩個 DataFrame；未啟用時為 None"""
+    run = _current_run()
+    if run is None:
+        return None
+    _close_lap(run)
+    total_ms = (time.perf_counter() - run["started"]) * 1000
+    sections = pd.DataFrame(run["sections"], columns=["區塊", "毫秒"])
+    sections["占比%"] = sections["毫秒"] / total_ms * 100 if total_ms else 0.0
+    cache = pd.DataFrame.from_dict(run["cache"], orient="index",
+                                   columns=["calls", "misses", "disk_hits", "miss_ms"]).rename_axis("函式")
+    cache["hits"] = cache["calls"] - cache["misses"]
+    cache["命中率%"] = cache["hits"] / cache["calls"].where(cache["calls"] > 0) * 100
+    return total_ms, sections, cache.reset_index()
+
+
+def write_log(total_ms, sections, cache):
+    """每次 rerun 追加一行 JSON 到 log_path"""
+    run = _current_run()
+    path = get_profile_settings()["log_path"]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    record = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "page": run["page"],
+        "total_ms": round(total_ms, 3),
+        "sections": [{"name": name, "ms": round(ms, 3)} for name, ms in run["sections"]],
+        "cache": {row["函式"]: {"calls": int(row["calls"]), "misses": int(row["misses"]),
+                                "disk_hits": int(row["disk_hits"]), "miss_ms": round(float(row["miss_ms"]), 3)}
+                  for _, row in cache.iterrows()},
+        "queries": run["queries"],
+    }
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def render_panel():
+    """腳本結尾呼叫：顯示可收合的計時面板並寫入 JSONL（未啟用時不顯示任何東西）"""
+    result = summary()
+    if result is None:
+        return
+    total_ms, sections, cache = result
+    try:
+        write_log(total_ms, sections, cache)
+    except OSError as e:
+        st.caption(f"⚠️ 效能紀錄寫入失敗：{e}")
+
+    with st.expander(f"⏱️ 效能剖析：本次 rerun {total_ms:,.0f} ms", expanded=False):
+        st.dataframe(sections.style.format({"毫秒": "{:,.1f}", "占比%": "{:.1f}"})
+                     .bar(subset=["毫秒"], color="#ffb3b3"),
+                     use_container_width=True, hide_index=True)
+        if not cache.empty:
+            st.write("**快取命中 (st.cache_data)**")
+            st.dataframe(cache[["函式", "calls", "hits", "misses", "disk_hits", "命中率%", "miss_ms"]]
+                         .style.format({"命中率%": "{:.0f}", "miss_ms": "{:,.1f}"}),
+                         use_container_width=True, hide_index=True)
+        queries = pd.DataFrame(_current_run()["queries"])
+        if not queries.empty:
+            st.write("**SQL 查詢（快取未命中時實際送出）**")
+            st.dataframe(queries[["caller", "ms", "rows", "bytes", "fingerprint", "statement"]]
+                         .style.format({"ms": "{:,.1f}", "bytes": "{:,}"}),
+                         use_container_width=True, hide_index=True)
+    _state.run = None
@@ -0,0 +1,123 @@
+"""
+查詢層級紀錄：耗時、回傳列數、結果大小、正規化後的 SQL，慢查詢另存 EXPLAIN
+
+data_access.read_sql 的每一次查詢都經過 timed_query：
+- 啟用 profiler 時，每筆查詢記到本次 rerun（計時面板的「SQL 查詢」表與 profile.jsonl）
+- 超過 slow_query_ms 的查詢另外寫一行到慢查詢紀錄，附上
+  EXPLAIN (ANALYZE, BUFFERS)（Postgres）或 EXPLAIN ANALYZE（本機 DuckDB）的執行計畫，
+  用來判斷是哪個查詢佔住 pooler 連線
+
+EXPLAIN ANALYZE 會真的再執行一次查詢，同一個 SQL（依 fingerprint）在 EXPLAIN_INTERVAL
+秒內只擷取一次計畫，其餘慢查詢只記錄耗時。
+
+設定（預設不記錄慢查詢）：
+    [query_log]
+    slow_query_ms = 1000
+    explain = true
+    log_path = "logs/slow_queries.jsonl"
+或環境變數 SRL_SLOW_QUERY_MS / SRL_SLOW_QUERY_LOG 覆寫
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+
+import streamlit as st
+
+import profiler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_LOG_SETTINGS = {
+    "slow_query_ms": 0,           # 0 = 不記錄慢查詢
+    "explain": True,              # 慢查詢是否擷取執行計畫
+    "log_path": "logs/slow_queries.jsonl",
+}
+EXPLAIN_INTERVAL = 600            # 秒；同一個 SQL 重複擷取執行計畫的最短間隔
+
+_last_explained = {}              # fingerprint -> 上次擷取執行計畫的時間
+
+
+# ========== 1. 設定 ==========
+def get_query_log_settings():
+    """預設值 + secrets [query_log] 區段 + 環境變數覆寫"""
+    settings = dict(DEFAULT_QUERY_LOG_SETTINGS)
+    try:
+        settings.update(st.secrets.get("query_log", {}))
+    except Exception:
+        pass  # 沒有 secrets.toml 時使用預設值
+    if os.environ.get("SRL_SLOW_QUERY_MS"):
+        settings["slow_query_ms"] = os.environ["SRL_SLOW_QUERY_MS"]
+    if os.environ.get("SRL_SLOW_QUERY_LOG"):
+        settings["log_path"] = os.environ["SRL_SLOW_QUERY_LOG"]
+    return settings
+
+
+# ========== 2. SQL 正規化 ==========
+_LINE_COMMENT = re.compile(r"--[^\n]*")
+_BLOCK_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(query: str) -> str:
+    """去掉註解、壓縮空白；值都以 :name 綁定，同一種查詢的正規化結果相同"""
+    query = _BLOCK_COMMENT.sub(" ", _LINE_COMMENT.sub(" ", query))
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def fingerprint(statement: str) -> str:
+    """正規化 SQL 的短雜湊，彙整紀錄時用來分組"""
+    return hashlib.sha1(statement.encode("utf-8")).hexdigest()[:12]
+
+
+# ========== 3. 計時與慢查詢紀錄 ==========
+def timed_query(execute, query, params=None, caller=None, explain=None):
+    """
+    執行 execute() 並記錄耗時、列數、結果大小；超過門檻時寫入慢查詢紀錄
+
+    execute: 無參數函式，回傳查詢結果 DataFrame
+    explain: 無參數函式，回傳執行計畫的文字列（list of str）；None 表示不擷取
+    caller:  發出查詢的函式名稱（例如 fetch_timing_data）
+    """
+    started = time.perf_counter()
+    df = execute()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    statement = normalize_sql(query)
+    entry = {
+        "caller": caller,
+        "fingerprint": fingerprint(statement),
+        "ms": round(elapsed_ms, 3),
+        "rows": len(df),
+        # 結果 DataFrame 的記憶體大小（psycopg 不提供實際傳輸位元組數，以此近似）
+        "bytes": int(df.memory_usage(index=False, deep=True).sum()),
+        "statement": statement,
+    }
+    profiler.record_query(entry)
+
+    settings = get_query_log_settings()
+    threshold = float(settings["slow_query_ms"] or 0)
+    if threshold > 0 and elapsed_ms >= threshold:
+        try:
+            _log_slow_query(entry, params, explain if settings["explain"] else None, settings["log_path"])
+        except Exception:
+            # 紀錄失敗不影響頁面（例如 EXPLAIN 逾時、log 目錄無法寫入）
+            logger.warning("慢查詢紀錄寫入失敗", exc_info=True)
+    return df
+
+
+def _log_slow_query(entry, params, explain, path):
+    record = {"ts": datetime.now().isoformat(timespec="seconds"), **entry,
+              "params": params or {}, "plan": None}
+    now = time.monotonic()
+    last = _last_explained.get(entry["fingerprint"])
+    if explain is not None and (last is None or now - last >= EXPLAIN_INTERVAL):
+        _last_explained[entry["fingerprint"]] = now
+        record["plan"] = "\n".join(str(line) for line in explain())
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
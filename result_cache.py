@@ -0,0 +1,459 @@
+"""
+持久化結果快取：fetch_* 的 DataFrame 結果以 Arrow IPC 格式存到共用的儲存後端
+
+st.cache_data 只存在目前行程的記憶體，容器重新啟動、或負載平衡後面的每個 replica
+都要各自重算一次。這裡在 st.cache_data 底下多一層共用快取：記憶體未命中時先讀後端，
+後端也沒有才真的執行函式，結果寫回後端。warm_cache.py 在每次資料同步後以 refreshing()
+重算所有側邊欄組合並覆寫，互動中的 session 就不會遇到冷查詢。
+
+儲存後端（[result_cache] backend）：
+- "disk"：目錄下的 Arrow IPC 檔，同一台機器的多個 worker 或掛載同一個 volume 的 replica 共用
+- "redis"：任何 Redis 相容伺服器（Redis、Valkey，或本機測試用的 fakeredis TcpFakeServer）
+兩者都以「最近使用時間」做 LRU：總大小超過 max_mb 時，刪除最久未使用的結果。
+
+快取不依時間過期：每次呼叫都帶上目前的資料版本（data_access.get_data_version），
+以關鍵字參數 data_version 傳給 st.cache_data，記憶體與後端的快取鍵都包含它；
+新的營收月份或股價批次寫入後版本改變，舊結果自然不再命中，之後由 LRU 淘汰。
+
+    data_access:  @cache_data(max_entries=...)    # 取代 profiler.cache_data，計數方式不變
+    warm_cache:   with result_cache.refreshing():  # 不讀後端、一律重算並覆寫
+                      fetch_heatmap_data(...)
+                  result_cache.prune(started)      # 刪掉這次沒有重算、也沒有被讀取的舊結果
+
+後端快取鍵 = 函式名稱 + 原始碼雜湊 + 套用預設值後的參數 + key context（例如 backend）+ 資料版本，
+函式改版、切換 backend 或資料更新時自然對不到舊結果。只快取 DataFrame，其他回傳值（例如日期字串）照常執行。
+
+設定（預設不啟用）：
+    [result_cache]
+    enabled = true
+    backend = "disk"              # "disk" | "redis"
+    dir = "data/result_cache"
+    redis_url = "redis://localhost:6379/0"
+    key_prefix = "srl"            # redis 的鍵前綴（多個環境共用同一台伺服器時分開）
+    max_mb = 2048                 # 總大小上限；0 = 不限制
+或環境變數 SRL_RESULT_CACHE_DIR（disk，同時啟用）/ SRL_RESULT_CACHE_URL（redis，同時啟用）/
+SRL_RESULT_CACHE=0|1 覆寫
+"""
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+import profiler
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESULT_CACHE_SETTINGS = {
+    "enabled": False,
+    "backend": "disk",
+    "dir": "data/result_cache",
+    "redis_url": None,
+    "key_prefix": "srl",
+    "max_mb": 2048,
+}
+FILE_SUFFIX = ".arrow"
+EVICT_TO = 0.9        # 超過上限時淘汰到上限的 90%，避免每次寫入都觸發淘汰
+VERSION_BUCKET = 60   # 秒；從未取得資料版本時，改用時間區段當版本
+# schema metadata：原本是 object dtype 的欄位位置、index 與欄位名稱
+OBJECT_DTYPES_KEY = b"srl_object_dtypes"
+
+_key_context = None   # 無參數函式，回傳併入快取鍵的字串（由 data_access 註冊）
+_data_version = None  # 無參數函式，回傳目前的資料版本（由 data_access 註冊）
+_last_version = None  # 最近一次成功取得的資料版本
+_refreshing = False   # warm_cache 預熱中：不讀後端，一律重算並覆寫
+
+
+# ========== 1. 設定 ==========
+def get_result_cache_settings():
+    """預設值 + secrets [result_cache] 區段 + 環境變數覆寫"""
+    settings = dict(DEFAULT_RESULT_CACHE_SETTINGS)
+    try:
+        settings.update(st.secrets.get("result_cache", {}))
+    except Exception:
+        pass  # 沒有 secrets.toml 時使用預設值
+    if os.environ.get("SRL_RESULT_CACHE_DIR"):
+        settings.update(backend="disk", dir=os.environ["SRL_RESULT_CACHE_DIR"], enabled=True)
+    if os.environ.get("SRL_RESULT_CACHE_URL"):
+        settings.update(backend="redis", redis_url=os.environ["SRL_RESULT_CACHE_URL"], enabled=True)
+    if os.environ.get("SRL_RESULT_CACHE"):
+        settings["enabled"] = os.environ["SRL_RESULT_CACHE"].lower() not in ("0", "false", "no")
+    return settings
+
+
+def set_key_context(fn):
+    """註冊快取鍵的共同前綴（例如 backend 與快照目錄），不同資料來源的結果不會互相覆蓋"""
+    global _key_context
+    _key_context = fn
+
+
+def set_data_version(fn):
+    """註冊資料版本的來源；版本改變時所有快取鍵跟著改變"""
+    global _data_version
+    _data_version = fn
+
+
+def current_data_version() -> str:
+    """
+    目前的資料版本；查詢版本失敗（例如資料庫暫時連不上）時沿用上一次的版本，
+    從未成功過則以時間區段代替，不讓版本查詢的錯誤擋住共用快取的結果
+    """
+    global _last_version
+    if _data_version is None:
+        return ""
+    try:
+        _last_version = _data_version()
+    except Exception:
+        fallback = _last_version or f"t{int(time.time() // VERSION_BUCKET)}"
+        logger.warning("資料版本查詢失敗，改用 %s", fallback, exc_info=True)
+        return fallback
+    return _last_version
+
+
+@contextmanager
+def refreshing():
+    """預熱模式：區塊內的呼叫略過後端讀取，重算後覆寫後端上的結果"""
+    global _refreshing
+    previous, _refreshing = _refreshing, True
+    try:
+        yield
+    finally:
+        _refreshing = previous
+
+
+# ========== 2. 快取鍵與 Arrow IPC 序列化 ==========
+def cache_key(func, source_hash, data_version, args, kwargs) -> str:
+    """套用預設值後的參數：位置參數與關鍵字參數的寫法不同也是同一個鍵"""
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    context = _key_context() if _key_context is not None else ""
+    raw = (f"{func.__module__}.{func.__qualname__}|{source_hash}|{context}|{data_version}"
+           f"|{sorted(bound.arguments.items())!r}")
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _object_dtypes(df: pd.DataFrame) -> dict:
+    """哪些欄位、index、欄位名稱是 object dtype（Arrow 字串讀回時一律是 str dtype）"""
+    return {
+        "columns": [i for i, dtype in enumerate(df.dtypes) if dtype == object],
+        "index": df.index.dtype == object,
+        "labels": df.columns.dtype == object,
+    }
+
+
+def serialize(df: pd.DataFrame) -> bytes:
+    """DataFrame -> Arrow IPC file 格式的位元組（含 index 與 object dtype 資訊）"""
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    table = table.replace_schema_metadata({**table.schema.metadata,
+                                           OBJECT_DTYPES_KEY: json.dumps(_object_dtypes(df)).encode()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def deserialize(data: bytes) -> pd.DataFrame:
+    table = pa.ipc.open_file(pa.BufferReader(data)).read_all()
+    df = table.to_pandas()
+    # 原本是 object 的字串欄位改從 Arrow 直接取出（保留 None，不變成 NaN），
+    # dtype 與缺值都與直接執行函式的結果相同
+    object_dtypes = json.loads((table.schema.metadata or {}).get(OBJECT_DTYPES_KEY, b"{}"))
+    for position in object_dtypes.get("columns", []):
+        column = table.column(position)
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            df.isetitem(position, pd.Series(column.to_numpy(zero_copy_only=False), index=df.index, dtype=object))
+    if object_dtypes.get("index"):
+        df.index = df.index.astype(object)
+    if object_dtypes.get("labels"):
+        df.columns = df.columns.astype(object)
+    return df
+
+
+# ========== 3. 儲存後端 ==========
+# 後端只處理位元組：get(name, key) -> bytes | None、set(name, key, data)、prune(older_than) -> 刪除數
+class DiskCache:
+    """
+    目錄下的 Arrow IPC 檔（<dir>/<函式名稱>/<key>.arrow），多個行程可共用同一個目錄
+
+    檔案修改時間即最近使用時間（讀取時更新）；寫入後若估計的總大小超過 max_bytes，
+    掃描目錄刪除最久未使用的檔案。
+    """
+
+    def __init__(self, cache_dir, max_bytes=0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._approx_bytes = None   # 估計的目錄大小；其他行程的寫入在下次掃描時才計入
+
+    def describe(self):
+        limit = f"上限 {self.max_bytes / 2**20:,.0f} MB" if self.max_bytes else "不限大小"
+        return f"disk {self.cache_dir}（{limit}）"
+
+    def _path(self, name, key):
+        return os.path.join(self.cache_dir, name, key + FILE_SUFFIX)
+
+    def get(self, name, key):
+        path = self._path(name, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # 更新最近使用時間
+        except OSError:
+            pass  # 剛好被其他行程淘汰
+        return data
+
+    def set(self, name, key, data: bytes):
+        """先寫暫存檔再 os.replace，其他行程不會讀到寫到一半的檔案"""
+        path = self._path(name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            old_size = os.path.getsize(path)  # 覆寫同一個鍵時只增加大小差
+        except OSError:
+            old_size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        if not self.max_bytes:
+            return
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = sum(size for _, size, _ in self._entries())  # 已包含剛寫入的檔案
+            else:
+                self._approx_bytes += len(data) - old_size
+            if self._approx_bytes > self.max_bytes:
+                self._approx_bytes = self.evict(int(self.max_bytes * EVICT_TO))
+
+    def _entries(self):
+        """(最近使用時間, 大小, 路徑)；掃描期間被其他行程刪除的檔案略過"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if not file.endswith(FILE_SUFFIX):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def evict(self, target_bytes):
+        """從最久未使用的檔案開始刪除，直到總大小不超過 target_bytes；回傳剩餘大小"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            self._remove(path)
+            total -= size
+        return total
+
+    def prune(self, older_than):
+        removed = sum(self._remove(path) for mtime, _, path in self._entries() if mtime < older_than)
+        with self._lock:
+            self._approx_bytes = None
+        return removed
+
+
+class RedisCache:
+    """
+    Redis 相容伺服器，負載平衡後的所有 replica 共用
+
+    只用到 GET / SET / DEL 與 sorted set、hash、INCRBY 等基本指令，Valkey、KeyDB 或本機測試用的
+    fakeredis 都能替代。最近使用時間記在 sorted set <prefix>:lru、每個結果的大小記在
+    hash <prefix>:sizes，總大小超過 max_bytes 時刪除最久未使用的鍵；
+    多個 replica 同時寫入時總大小為近似值。
+    """
+
+    def __init__(self, client, max_bytes=0, prefix="srl"):
+        self.client = client
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.lru_key = f"{prefix}:lru"
+        self.sizes_key = f"{prefix}:sizes"
+        self.total_key = f"{prefix}:bytes"
+
+    @classmethod
+    def from_url(cls, url, max_bytes=0, prefix="srl"):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("需要 redis 套件：pip install redis")
+        # 伺服器無回應時儘快放棄，改為直接執行函式
+        client = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=5)
+        return cls(client, max_bytes, prefix)
+
+    def describe(self):
+        limit = f"上限 {self.max_bytes / 2**20:,.0f} MB" if self.max_bytes else "不限大小"
+        return f"redis {self.prefix}:*（{limit}）"
+
+    def _key(self, name, key):
+        return f"{self.prefix}:{name}:{key}"
+
+    def get(self, name, key):
+        entry = self._key(name, key)
+        data = self.client.get(entry)
+        if data is None:
+            # 伺服器自己的 maxmemory 政策可能已刪掉這個鍵，順便清掉索引
+            if self.client.zscore(self.lru_key, entry) is not None:
+                self._delete([entry])
+            return None
+        self.client.zadd(self.lru_key, {entry: time.time()})
+        return data
+
+    def set(self, name, key, data: bytes):
+        entry = self._key(name, key)
+        old_size = int(self.client.hget(self.sizes_key, entry) or 0)
+        pipe = self.client.pipeline()
+        pipe.set(entry, data)
+        pipe.zadd(self.lru_key, {entry: time.time()})
+        pipe.hset(self.sizes_key, entry, len(data))
+        pipe.incrby(self.total_key, len(data) - old_size)
+        total = pipe.execute()[-1]
+        if self.max_bytes and total > self.max_bytes:
+            self.evict(int(self.max_bytes * EVICT_TO))
+
+    def _delete(self, entries):
+        sizes = self.client.hmget(self.sizes_key, entries)
+        pipe = self.client.pipeline()
+        pipe.delete(*entries)
+        pipe.zrem(self.lru_key, *entries)
+        pipe.hdel(self.sizes_key, *entries)
+        pipe.decrby(self.total_key, sum(int(size or 0) for size in sizes))
+        pipe.execute()
+
+    def evict(self, target_bytes, batch=50):
+        """從最久未使用的鍵開始刪除，直到總大小不超過 target_bytes；回傳剩餘大小"""
+        total = int(self.client.get(self.total_key) or 0)
+        while total > target_bytes:
+            oldest = [e.decode() if isinstance(e, bytes) else e
+                      for e in self.client.zrange(self.lru_key, 0, batch - 1)]
+            if not oldest:
+                break
+            # 只刪到足以降到 target_bytes 為止
+            victims, excess = [], total - target_bytes
+            for entry, size in zip(oldest, self.client.hmget(self.sizes_key, oldest)):
+                victims.append(entry)
+                excess -= int(size or 0)
+                if excess <= 0:
+                    break
+            self._delete(victims)
+            total = int(self.client.get(self.total_key) or 0)
+        return total
+
+    def prune(self, older_than):
+        stale = [e.decode() if isinstance(e, bytes) else e
+                 for e in self.client.zrangebyscore(self.lru_key, "-inf", f"({older_than}")]
+        for i in range(0, len(stale), 500):
+            self._delete(stale[i:i + 500])
+        return len(stale)
+
+
+@functools.lru_cache(maxsize=None)
+def _create_backend(kind, cache_dir, redis_url, key_prefix, max_mb):
+    max_bytes = int(float(max_mb) * 2**20)
+    if kind == "redis":
+        if not redis_url:
+            raise ValueError("backend = \"redis\" 需要設定 redis_url")
+        return RedisCache.from_url(redis_url, max_bytes, key_prefix)
+    if kind == "disk":
+        return DiskCache(cache_dir, max_bytes)
+    raise ValueError(f"不支援的結果快取 backend：{kind!r}（允許：disk, redis）")
+
+
+def get_backend(settings=None):
+    """依設定取得後端；同樣的設定共用同一個實例（連線池、大小估計）"""
+    settings = settings or get_result_cache_settings()
+    return _create_backend(settings["backend"], settings["dir"], settings["redis_url"],
+                           settings["key_prefix"], settings["max_mb"])
+
+
+def prune(older_than: float) -> int:
+    """刪除最近使用時間早於 older_than（time.time()）的結果，回傳刪除數"""
+    return get_backend().prune(older_than)
+
+
+# ========== 4. 裝飾器 ==========
+def persistent(func):
+    """記憶體快取之下的共用快取層；後端讀寫失敗時退回直接執行，不影響頁面"""
+    try:
+        source_hash = hashlib.sha1(inspect.getsource(func).encode("utf-8")).hexdigest()[:12]
+    except (OSError, TypeError):
+        source_hash = ""
+
+    @functools.wraps(func)
+    def wrapper(*args, data_version="", **kwargs):
+        settings = get_result_cache_settings()
+        if not settings["enabled"]:
+            return func(*args, **kwargs)
+        name, key = func.__name__, cache_key(func, source_hash, data_version, args, kwargs)
+        if not _refreshing:
+            try:
+                data = get_backend(settings).get(name, key)
+                df = deserialize(data) if data is not None else None
+            except Exception:
+                df = None
+                logger.warning("結果快取讀取失敗（%s）", name, exc_info=True)
+            if df is not None:
+                profiler.record_disk_hit(name)
+                return df
+
+        result = func(*args, **kwargs)
+        if isinstance(result, pd.DataFrame):
+            try:
+                get_backend(settings).set(name, key, serialize(result))
+            except Exception:
+                # 例如 Arrow 無法轉換的欄位、磁碟已滿、Redis 連不上；下次仍會重算
+                logger.warning("結果快取寫入失敗（%s）", name, exc_info=True)
+        return result
+    return wrapper
+
+
+def cache_data(**cache_kwargs):
+    """
+    data_access 使用的快取裝飾器：profiler.cache_data（st.cache_data + 命中率計數）包住共用快取層
+
+    每次呼叫多傳一個關鍵字參數 data_version（目前的資料版本），st.cache_data 會把它算進快取鍵，
+    共用快取層取出後併入後端的鍵，不會傳到原函式。每層都用 functools.wraps，
+    st.cache_data 計算快取鍵時仍追到原函式的原始碼。
+    """
+    def decorator(func):
+        cached = profiler.cache_data(**cache_kwargs)(persistent(func))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return cached(*args, data_version=current_data_version(), **kwargs)
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorator
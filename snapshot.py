@@ -0,0 +1,130 @@
+"""
+本機欄式快照 (Parquet + DuckDB)
+
+把遠端 Postgres 的分析用資料表匯出成本機 Parquet，之後將 data_access 的
+backend 切換為 "local"，所有頁面查詢就改由 DuckDB 在本機行程內執行，
+不需要網路，也適合做為離線測試環境。
+
+匯出：
+    python snapshot.py --out data/snapshot
+    python snapshot.py --dsn "postgresql://..." --out data/snapshot
+
+切換 backend（擇一）：
+    SRL_BACKEND=local streamlit run app.py
+    或在 .streamlit/secrets.toml 的 [database] 區段設定 backend = "local"
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+DEFAULT_SNAPSHOT_DIR = "data/snapshot"
+MANIFEST_FILE = "_snapshot.json"
+
+# 頁面查詢會用到的資料表（包含 sql/ 底下 migration 建立的衍生表）
+SNAPSHOT_TABLES = [
+    "stock_annual_k",
+    "monthly_revenue",
+    "stock_weekly_k",
+    "annual_return_bins",
+    "weekly_returns",
+    "spark_event_log",
+]
+
+CHUNK_ROWS = 200_000
+
+
+# ========== 1. 匯出 ==========
+def export_table(engine, table, out_dir):
+    """分批讀取整張表並寫成單一 Parquet 檔，回傳筆數"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = os.path.join(out_dir, f"{table}.parquet")
+    tmp_path = path + ".tmp"
+    writer = None
+    rows = 0
+    try:
+        with engine.connect().execution_options(stream_results=True) as conn:
+            for chunk in pd.read_sql_query(f"SELECT * FROM {table}", conn, chunksize=CHUNK_ROWS):
+                batch = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, batch.schema)
+                writer.write_table(batch.cast(writer.schema))
+                rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        return 0  # 空表不產生檔案
+    os.replace(tmp_path, path)  # 寫完才替換，避免讀到半份快照
+    return rows
+
+
+def export_snapshot(engine, out_dir=DEFAULT_SNAPSHOT_DIR, tables=SNAPSHOT_TABLES):
+    """匯出所有資料表並寫入 manifest"""
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {}
+    for table in tables:
+        counts[table] = export_table(engine, table, out_dir)
+        print(f"✅ {table}: {counts[table]:,} 筆")
+
+    manifest = {
+        "exported_at": datetime.now().isoformat(timespec="seconds"),
+        "tables": counts,
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+# ========== 2. 讀取 (DuckDB) ==========
+def connect_snapshot(snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    """
+    開啟 in-memory DuckDB，並把快照目錄中的每個 Parquet 註冊成同名 view，
+    讓原本寫給 Postgres 的查詢可以直接在本機執行。
+    """
+    if not DUCKDB_AVAILABLE:
+        raise RuntimeError("本機快照模式需要 duckdb 套件：pip install duckdb")
+    if not os.path.isdir(snapshot_dir):
+        raise FileNotFoundError(f"找不到快照目錄 {snapshot_dir}，請先執行 python snapshot.py")
+
+    con = duckdb.connect(database=":memory:")
+    for file_name in sorted(os.listdir(snapshot_dir)):
+        if not file_name.endswith(".parquet"):
+            continue
+        table = file_name[:-len(".parquet")]
+        path = os.path.abspath(os.path.join(snapshot_dir, file_name)).replace("'", "''")
+        con.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{path}')")
+    return con
+
+
+def main():
+    parser = argparse.ArgumentParser(description="匯出 StockRevenueLab 本機 Parquet 快照")
+    parser.add_argument("--out", default=DEFAULT_SNAPSHOT_DIR, help="輸出目錄")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"),
+                        help="資料庫連線字串；未指定時使用 Streamlit secrets 的設定")
+    parser.add_argument("--tables", nargs="+", default=SNAPSHOT_TABLES, help="要匯出的資料表")
+    args = parser.parse_args()
+
+    if args.dsn:
+        from sqlalchemy import create_engine
+        engine = create_engine(args.dsn)
+    else:
+        from data_access import get_engine
+        engine = get_engine()
+
+    manifest = export_snapshot(engine, args.out, args.tables)
+    print(f"📦 快照完成：{args.out} ({manifest['exported_at']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+-- ========== 001. 年度股價漲幅區間預計算表 ==========
+-- 熱力圖、統計摘要與深度挖掘原本每次查詢都要對 stock_annual_k 重算
+-- ((price_field - year_open) / year_open) * 100 並跑兩組 22 段的 CASE。
+-- 這裡把「每檔股票 × 年度 × 價格欄位」的漲幅、區間名稱與排序預先算好，
+-- 並用 trigger 在年K資料寫入/更新時增量維護。
+--
+-- 執行方式：psql "$DATABASE_URL" -f sql/001_annual_return_bins.sql
+
+CREATE TABLE IF NOT EXISTS annual_return_bins (
+    symbol        TEXT             NOT NULL,
+    year          TEXT             NOT NULL,
+    price_field   TEXT             NOT NULL,  -- 'year_close' (實戰版) 或 'year_high' (極限版)
+    annual_return DOUBLE PRECISION NOT NULL,
+    return_bin    TEXT             NOT NULL,
+    bin_order     SMALLINT         NOT NULL,
+    PRIMARY KEY (year, price_field, symbol)
+);
+
+CREATE INDEX IF NOT EXISTS idx_annual_return_bins_order
+    ON annual_return_bins (year, price_field, bin_order);
+
+-- 漲幅分類：下跌每10%一個間隔，上漲每100%一個間隔（與原本熱力圖 CASE 完全一致）
+CREATE OR REPLACE FUNCTION classify_annual_return(
+    ret DOUBLE PRECISION,
+    OUT bin_order SMALLINT,
+    OUT return_bin TEXT
+) AS $$
+BEGIN
+    bin_order := CASE
+        WHEN ret <= -100 THEN 0
+        WHEN ret < 0     THEN floor(ret / 10)::int + 11   -- 1 ~ 10
+        WHEN ret < 1000  THEN floor(ret / 100)::int + 11  -- 11 ~ 20
+        ELSE 21
+    END;
+    return_bin := (ARRAY[
+        '00. 下跌-100%以下',
+        '01. 下跌-100%至-90%',
+        '02. 下跌-90%至-80%',
+        '03. 下跌-80%至-70%',
+        '04. 下跌-70%至-60%',
+        '05. 下跌-60%至-50%',
+        '06. 下跌-50%至-40%',
+        '07. 下跌-40%至-30%',
+        '08. 下跌-30%至-20%',
+        '09. 下跌-20%至-10%',
+        '10. 下跌-10%至0%',
+        '11. 上漲0-100%',
+        '12. 上漲100-200%',
+        '13. 上漲200-300%',
+        '14. 上漲300-400%',
+        '15. 上漲400-500%',
+        '16. 上漲500-600%',
+        '17. 上漲600-700%',
+        '18. 上漲700-800%',
+        '19. 上漲800-900%',
+        '20. 上漲900-1000%',
+        '21. 上漲1000%以上'
+    ])[bin_order + 1];
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- 全量/指定年度重建（初次建置或補資料時使用）
+CREATE OR REPLACE FUNCTION refresh_annual_return_bins(p_year TEXT DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    n INTEGER;
+BEGIN
+    INSERT INTO annual_return_bins (symbol, year, price_field, annual_return, return_bin, bin_order)
+    SELECT k.symbol, k.year::text, p.price_field, p.ret, c.return_bin, c.bin_order
+    FROM stock_annual_k k
+    CROSS JOIN LATERAL (
+        VALUES ('year_close', ((k.year_close - k.year_open) / NULLIF(k.year_open, 0)) * 100),
+               ('year_high',  ((k.year_high  - k.year_open) / NULLIF(k.year_open, 0)) * 100)
+    ) AS p(price_field, ret)
+    CROSS JOIN LATERAL classify_annual_return(p.ret) AS c
+    WHERE p.ret IS NOT NULL
+      AND (p_year IS NULL OR k.year::text = p_year)
+    ON CONFLICT (year, price_field, symbol) DO UPDATE
+        SET annual_return = EXCLUDED.annual_return,
+            return_bin    = EXCLUDED.return_bin,
+            bin_order     = EXCLUDED.bin_order;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    RETURN n;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 增量維護：年K新增/更新/刪除時只處理該列
+CREATE OR REPLACE FUNCTION trg_sync_annual_return_bins()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM annual_return_bins
+        WHERE year = OLD.year::text AND symbol = OLD.symbol;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+
+    INSERT INTO annual_return_bins (symbol, year, price_field, annual_return, return_bin, bin_order)
+    SELECT NEW.symbol, NEW.year::text, p.price_field, p.ret, c.return_bin, c.bin_order
+    FROM (
+        VALUES ('year_close', ((NEW.year_close - NEW.year_open) / NULLIF(NEW.year_open, 0)) * 100),
+               ('year_high',  ((NEW.year_high  - NEW.year_open) / NULLIF(NEW.year_open, 0)) * 100)
+    ) AS p(price_field, ret)
+    CROSS JOIN LATERAL classify_annual_return(p.ret) AS c
+    WHERE p.ret IS NOT NULL
+    ON CONFLICT (year, price_field, symbol) DO UPDATE
+        SET annual_return = EXCLUDED.annual_return,
+            return_bin    = EXCLUDED.return_bin,
+            bin_order     = EXCLUDED.bin_order;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sync_annual_return_bins ON stock_annual_k;
+CREATE TRIGGER sync_annual_return_bins
+    AFTER INSERT OR DELETE OR UPDATE OF symbol, year, year_open, year_close, year_high
+    ON stock_annual_k
+    FOR EACH ROW EXECUTE FUNCTION trg_sync_annual_return_bins();
+
+-- 初次建置：回填全部歷史資料
+SELECT refresh_annual_return_bins();
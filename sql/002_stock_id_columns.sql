@@ -0,0 +1,36 @@
+-- ========== 002. 正規化 stock_id 欄位 ==========
+-- 原本所有跨表 JOIN 都寫成 SPLIT_PART(symbol, '.', 1) = m.stock_id，
+-- 運算式無法使用索引。這裡在年K、周K與漲幅區間表加上 STORED 生成欄位
+-- stock_id（'2330.TW' -> '2330'），並替兩側建立索引。
+--
+-- 執行方式：psql "$DATABASE_URL" -f sql/002_stock_id_columns.sql
+-- 需先執行 001_annual_return_bins.sql
+
+ALTER TABLE stock_annual_k
+    ADD COLUMN IF NOT EXISTS stock_id TEXT
+    GENERATED ALWAYS AS (split_part(symbol, '.', 1)) STORED;
+
+ALTER TABLE stock_weekly_k
+    ADD COLUMN IF NOT EXISTS stock_id TEXT
+    GENERATED ALWAYS AS (split_part(symbol, '.', 1)) STORED;
+
+ALTER TABLE annual_return_bins
+    ADD COLUMN IF NOT EXISTS stock_id TEXT
+    GENERATED ALWAYS AS (split_part(symbol, '.', 1)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_stock_annual_k_stock_year
+    ON stock_annual_k (stock_id, year);
+
+CREATE INDEX IF NOT EXISTS idx_stock_weekly_k_stock_date
+    ON stock_weekly_k (stock_id, date);
+
+CREATE INDEX IF NOT EXISTS idx_annual_return_bins_stock
+    ON annual_return_bins (year, price_field, stock_id);
+
+CREATE INDEX IF NOT EXISTS idx_monthly_revenue_stock_month
+    ON monthly_revenue (stock_id, report_month);
+
+ANALYZE stock_annual_k;
+ANALYZE stock_weekly_k;
+ANALYZE annual_return_bins;
+ANALYZE monthly_revenue;
@@ -0,0 +1,22 @@
+-- ========== 003. 營收報表期間 period 欄位 ==========
+-- report_month 是民國年字串（例如 '113_05'），原本只能用
+-- LIKE '113_%' / report_month < '113_12' / LENGTH(report_month) <= 7 過濾，
+-- 無法走 btree 範圍掃描（而且 '_' 在 LIKE 中是萬用字元）。
+-- 這裡新增西元年月整數欄位 period（'113_05' -> 202405），
+-- 格式不符的列為 NULL，觀察期查詢一律改用 period BETWEEN 範圍條件。
+--
+-- 執行方式：psql "$DATABASE_URL" -f sql/003_report_period.sql
+
+ALTER TABLE monthly_revenue
+    ADD COLUMN IF NOT EXISTS period INTEGER
+    GENERATED ALWAYS AS (
+        CASE WHEN report_month ~ '^[0-9]{2,3}_[0-9]{2}$'
+             THEN (split_part(report_month, '_', 1)::int + 1911) * 100
+                  + split_part(report_month, '_', 2)::int
+        END
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_monthly_revenue_period_stock
+    ON monthly_revenue (period, stock_id);
+
+ANALYZE monthly_revenue;
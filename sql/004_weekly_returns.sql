@@ -0,0 +1,128 @@
+-- ========== 004. 周報酬預計算表 ==========
+-- 公告行為研究室每次查詢都要對整張 stock_weekly_k 跑
+-- LAG(w_close) OVER (PARTITION BY symbol ORDER BY date)，
+-- 涵蓋所有年度、所有股票，最後卻只和幾百筆爆發事件 JOIN。
+-- 這裡把每檔股票每週的收盤價/最高價週報酬預先算好，
+-- 用 trigger 在周K新增/更新/刪除時只重算受影響的兩週，並以 (stock_id, date) 建索引，
+-- 事件視窗彙總只需讀取需要的列。
+--
+-- 執行方式：psql "$DATABASE_URL" -f sql/004_weekly_returns.sql
+-- 需先執行 002_stock_id_columns.sql
+
+CREATE TABLE IF NOT EXISTS weekly_returns (
+    symbol    TEXT             NOT NULL,
+    date      DATE             NOT NULL,
+    w_close   DOUBLE PRECISION,
+    w_high    DOUBLE PRECISION,
+    ret_close DOUBLE PRECISION,  -- (w_close - 上週 w_close) / 上週 w_close * 100
+    ret_high  DOUBLE PRECISION,  -- (w_high  - 上週 w_high)  / 上週 w_high  * 100
+    stock_id  TEXT GENERATED ALWAYS AS (split_part(symbol, '.', 1)) STORED,
+    PRIMARY KEY (symbol, date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_weekly_returns_stock_date
+    ON weekly_returns (stock_id, date);
+
+-- 全量/指定股票重建（初次建置或補資料時使用）
+CREATE OR REPLACE FUNCTION refresh_weekly_returns(p_symbol TEXT DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    n INTEGER;
+BEGIN
+    DELETE FROM weekly_returns w
+    WHERE (p_symbol IS NULL OR w.symbol = p_symbol)
+      AND NOT EXISTS (
+          SELECT 1 FROM stock_weekly_k k
+          WHERE k.stock_id = w.stock_id AND k.symbol = w.symbol AND k.date = w.date
+      );
+
+    INSERT INTO weekly_returns (symbol, date, w_close, w_high, ret_close, ret_high)
+    SELECT symbol, date, w_close, w_high,
+           (w_close - prev_close) / NULLIF(prev_close, 0) * 100,
+           (w_high  - prev_high)  / NULLIF(prev_high, 0)  * 100
+    FROM (
+        SELECT symbol, date, w_close, w_high,
+               LAG(w_close) OVER w AS prev_close,
+               LAG(w_high)  OVER w AS prev_high
+        FROM (
+            -- 同一週重複的列只取一筆
+            SELECT DISTINCT ON (symbol, date) symbol, date, w_close, w_high
+            FROM stock_weekly_k
+            WHERE symbol IS NOT NULL AND date IS NOT NULL
+              AND (p_symbol IS NULL OR symbol = p_symbol)
+            ORDER BY symbol, date
+        ) k
+        WINDOW w AS (PARTITION BY symbol ORDER BY date)
+    ) s
+    ON CONFLICT (symbol, date) DO UPDATE
+        SET w_close   = EXCLUDED.w_close,
+            w_high    = EXCLUDED.w_high,
+            ret_close = EXCLUDED.ret_close,
+            ret_high  = EXCLUDED.ret_high;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    RETURN n;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 重算單一股票單一週的報酬（上週價格以 (stock_id, date) 索引往回找一筆）
+CREATE OR REPLACE FUNCTION sync_weekly_return(p_symbol TEXT, p_date DATE)
+RETURNS VOID AS $$
+BEGIN
+    IF p_symbol IS NULL OR p_date IS NULL THEN
+        RETURN;
+    END IF;
+
+    DELETE FROM weekly_returns WHERE symbol = p_symbol AND date = p_date;
+
+    INSERT INTO weekly_returns (symbol, date, w_close, w_high, ret_close, ret_high)
+    SELECT k.symbol, k.date, k.w_close, k.w_high,
+           (k.w_close - p.w_close) / NULLIF(p.w_close, 0) * 100,
+           (k.w_high  - p.w_high)  / NULLIF(p.w_high, 0)  * 100
+    FROM (
+        SELECT symbol, date, w_close, w_high
+        FROM stock_weekly_k
+        WHERE stock_id = split_part(p_symbol, '.', 1) AND symbol = p_symbol AND date = p_date
+        LIMIT 1
+    ) k
+    LEFT JOIN LATERAL (
+        SELECT w_close, w_high
+        FROM stock_weekly_k
+        WHERE stock_id = split_part(p_symbol, '.', 1) AND symbol = p_symbol AND date < p_date
+        ORDER BY date DESC
+        LIMIT 1
+    ) p ON TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 增量維護：某週變動時，重算該週與下一週（下一週的報酬以這週為基準）
+CREATE OR REPLACE FUNCTION trg_sync_weekly_returns()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM sync_weekly_return(OLD.symbol, OLD.date);
+        PERFORM sync_weekly_return(OLD.symbol, (
+            SELECT MIN(date) FROM stock_weekly_k
+            WHERE stock_id = OLD.stock_id AND symbol = OLD.symbol AND date > OLD.date
+        ));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM sync_weekly_return(NEW.symbol, NEW.date);
+        PERFORM sync_weekly_return(NEW.symbol, (
+            SELECT MIN(date) FROM stock_weekly_k
+            WHERE stock_id = NEW.stock_id AND symbol = NEW.symbol AND date > NEW.date
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sync_weekly_returns ON stock_weekly_k;
+CREATE TRIGGER sync_weekly_returns
+    AFTER INSERT OR DELETE OR UPDATE OF symbol, date, w_close, w_high
+    ON stock_weekly_k
+    FOR EACH ROW EXECUTE FUNCTION trg_sync_weekly_returns();
+
+-- 初次建置：回填全部歷史資料
+SELECT refresh_weekly_returns();
+
+ANALYZE weekly_returns;
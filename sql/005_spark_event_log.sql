@@ -0,0 +1,143 @@
+-- ========== 005. 營收爆發事件表 ==========
+-- 公告行為研究室每次調整門檻或關鍵字，都要對 monthly_revenue 重跑
+-- LAG(yoy_pct / mom_pct) OVER (PARTITION BY stock_id ORDER BY period) 找「首次站上門檻」的月份。
+-- 這裡把每檔股票每個月份、每個指標的「上月值 -> 本月值」預先存成一列：
+--     門檻 t 的爆發事件 = value >= t AND (prev_value < t OR prev_value IS NULL)
+-- 一列就涵蓋所有門檻（等同於把門檻切成無限細的 bucket），頁面查詢只需要
+-- 依 (metric, period) 範圍讀取，不再對營收表開窗。
+--
+-- prev_period 記錄上一筆營收的期間：原本的 LAG 只在觀察期 (前一年12月 ~ 當年12月)
+-- 內開窗，上一筆早於觀察期起點時視為 NULL，查詢時以 prev_period < :prev_dec 還原同樣的判斷。
+-- 對任何觀察期都不可能成為事件的列（本月值沒有高於上月，且上月就在前一年12月之後）不寫入。
+--
+-- 增量維護：monthly_revenue 新增/更新/刪除一列時，只重算該月份與同一檔股票的下一個月份
+-- （下一個月份的 prev_value 以這個月為基準）；新月份入庫時下一個月份還不存在，只會動到當月。
+--
+-- 執行方式：psql "$DATABASE_URL" -f sql/005_spark_event_log.sql
+-- 需先執行 002_stock_id_columns.sql、003_report_period.sql
+
+CREATE TABLE IF NOT EXISTS spark_event_log (
+    stock_id     TEXT             NOT NULL,
+    period       INTEGER          NOT NULL,
+    metric       TEXT             NOT NULL,  -- 'yoy_pct' 或 'mom_pct'
+    report_month TEXT,
+    stock_name   TEXT,
+    remark       TEXT,
+    value        DOUBLE PRECISION NOT NULL,  -- 本月成長率
+    prev_value   DOUBLE PRECISION,           -- 上一筆營收的成長率
+    prev_period  INTEGER,                    -- 上一筆營收的期間 (沒有上一筆為 NULL)
+    base_date    DATE             NOT NULL,  -- 營收公告基準日（次月10日）
+    PRIMARY KEY (stock_id, period, metric)
+);
+
+CREATE INDEX IF NOT EXISTS idx_spark_event_log_metric_period
+    ON spark_event_log (metric, period);
+
+-- 增量維護時往回找上一筆營收
+CREATE INDEX IF NOT EXISTS idx_monthly_revenue_stock_period
+    ON monthly_revenue (stock_id, period);
+
+-- 每個指標一列 (metric, value)；新增指標時只需要在這裡多加一列
+CREATE OR REPLACE VIEW revenue_metrics AS
+SELECT m.stock_id, m.period, m.report_month, m.stock_name, m.remark, v.metric, v.value
+FROM monthly_revenue m
+CROSS JOIN LATERAL (VALUES ('yoy_pct', m.yoy_pct), ('mom_pct', m.mom_pct)) AS v(metric, value)
+WHERE m.stock_id IS NOT NULL AND m.period IS NOT NULL;
+
+-- 可能成為事件的列：本月值高於上月，或上一筆早於前一年12月（某些觀察期內視為沒有上一筆）
+CREATE OR REPLACE FUNCTION is_spark_candidate(p_period INTEGER, p_value DOUBLE PRECISION,
+                                              p_prev_value DOUBLE PRECISION, p_prev_period INTEGER)
+RETURNS BOOLEAN AS $$
+    SELECT p_value IS NOT NULL
+       AND (p_prev_value IS NULL OR p_prev_value < p_value
+            OR p_prev_period < (p_period / 100 - 1) * 100 + 12);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- 全量/指定股票重建（初次建置或補資料時使用）
+CREATE OR REPLACE FUNCTION refresh_spark_event_log(p_stock_id TEXT DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    n INTEGER;
+BEGIN
+    DELETE FROM spark_event_log WHERE p_stock_id IS NULL OR stock_id = p_stock_id;
+
+    INSERT INTO spark_event_log (stock_id, period, metric, report_month, stock_name, remark,
+                                 value, prev_value, prev_period, base_date)
+    SELECT stock_id, period, metric, report_month, stock_name, remark, value, prev_value, prev_period,
+           (make_date(period / 100, period % 100, 10) + interval '1 month')::date
+    FROM (
+        SELECT r.*,
+               LAG(value)  OVER w AS prev_value,
+               LAG(period) OVER w AS prev_period
+        FROM revenue_metrics r
+        WHERE p_stock_id IS NULL OR r.stock_id = p_stock_id
+        WINDOW w AS (PARTITION BY stock_id, metric ORDER BY period)
+    ) s
+    WHERE is_spark_candidate(period, value, prev_value, prev_period)
+    ON CONFLICT (stock_id, period, metric) DO NOTHING;  -- 同一股票同一月份重複申報時保留一筆
+    GET DIAGNOSTICS n = ROW_COUNT;
+    RETURN n;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 重算單一股票單一月份（兩個指標）的事件列，上一筆營收以 (stock_id, period) 索引往回找
+CREATE OR REPLACE FUNCTION sync_spark_event(p_stock_id TEXT, p_period INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    IF p_stock_id IS NULL OR p_period IS NULL THEN
+        RETURN;
+    END IF;
+
+    DELETE FROM spark_event_log WHERE stock_id = p_stock_id AND period = p_period;
+
+    INSERT INTO spark_event_log (stock_id, period, metric, report_month, stock_name, remark,
+                                 value, prev_value, prev_period, base_date)
+    SELECT r.stock_id, r.period, r.metric, r.report_month, r.stock_name, r.remark,
+           r.value, p.value, p.period,
+           (make_date(r.period / 100, r.period % 100, 10) + interval '1 month')::date
+    FROM revenue_metrics r
+    LEFT JOIN LATERAL (
+        SELECT prev.period, prev.value
+        FROM revenue_metrics prev
+        WHERE prev.stock_id = p_stock_id AND prev.metric = r.metric AND prev.period < p_period
+        ORDER BY prev.period DESC
+        LIMIT 1
+    ) p ON TRUE
+    WHERE r.stock_id = p_stock_id AND r.period = p_period
+      AND is_spark_candidate(r.period, r.value, p.value, p.period)
+    ON CONFLICT (stock_id, period, metric) DO NOTHING;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 增量維護：某月份變動時，重算該月份與同一檔股票的下一個月份
+CREATE OR REPLACE FUNCTION trg_sync_spark_event_log()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM sync_spark_event(OLD.stock_id, OLD.period);
+        PERFORM sync_spark_event(OLD.stock_id, (
+            SELECT MIN(period) FROM monthly_revenue
+            WHERE stock_id = OLD.stock_id AND period > OLD.period
+        ));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM sync_spark_event(NEW.stock_id, NEW.period);
+        PERFORM sync_spark_event(NEW.stock_id, (
+            SELECT MIN(period) FROM monthly_revenue
+            WHERE stock_id = NEW.stock_id AND period > NEW.period
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sync_spark_event_log ON monthly_revenue;
+CREATE TRIGGER sync_spark_event_log
+    AFTER INSERT OR DELETE OR UPDATE OF stock_id, report_month, stock_name, remark, yoy_pct, mom_pct
+    ON monthly_revenue
+    FOR EACH ROW EXECUTE FUNCTION trg_sync_spark_event_log();
+
+-- 初次建置：回填全部歷史資料
+SELECT refresh_spark_event_log();
+
+ANALYZE spark_event_log;
@@ -0,0 +1,17 @@
+-- ========== 006. 資料版本探測用索引 ==========
+-- data_access.get_data_version 每 60 秒在每個行程執行一次
+-- MAX(period) / MAX(year) / MAX(date)。monthly_revenue 已有 (period, stock_id) 索引 (003)，
+-- 但年K、周K只有 (stock_id, year)、(stock_id, date) 索引 (002)，MAX 無法走索引，
+-- 每次都要掃描整張周K。這裡補上以年度、日期開頭的索引，MAX 只讀索引的最後一筆。
+--
+-- 執行方式：psql "$DATABASE_URL" -f sql/006_data_version_indexes.sql
+-- 需先執行 002_stock_id_columns.sql
+
+CREATE INDEX IF NOT EXISTS idx_stock_annual_k_year
+    ON stock_annual_k (year);
+
+CREATE INDEX IF NOT EXISTS idx_stock_weekly_k_date
+    ON stock_weekly_k (date);
+
+ANALYZE stock_annual_k;
+ANALYZE stock_weekly_k;
@@ -0,0 +1,75 @@
+"""
+摘要表與提示詞表格 (欄式運算)
+
+機率研究室的期望值評分、各頁 AI 提示詞裡的 Markdown 表格，原本都是
+df.iterrows() 逐列組 dict / 字串；爆發次數與區間網格變大後，這些迴圈會出現在
+每次 rerun 的耗時裡。這裡一律對整個欄位運算，列數再多也只有「欄數」次的操作。
+"""
+import numpy as np
+import pandas as pd
+
+
+# ========== 1. Markdown 表格 ==========
+def markdown_rows(df, formats=None):
+    """
+    每列一個 '| a | b | c |' 字串（回傳 Series）
+    formats: {欄位: 格式字串}，例如 {"stock_count": "{}檔", "mean_val": "{:.1f}%"}；
+             未指定的欄位用 str()；formats 有給時只輸出其中的欄位（依其順序）
+    """
+    formats = formats if formats is not None else {col: None for col in df.columns}
+    # 每欄以 Series.map 轉成字串後整欄串接，不逐列組字串
+    cells = df.reset_index(drop=True)
+    rows = pd.Series("|", index=cells.index, dtype=object)
+    for col, fmt in formats.items():
+        rows = rows + " " + cells[col].map(fmt.format if fmt else str).astype(object) + " |"
+    return rows.set_axis(df.index)
+
+
+def markdown_table(df, formats=None, header=None):
+    """整張表轉成 Markdown；header 預設為欄位名稱，空表回傳 '無數據'"""
+    if df.empty:
+        return "無數據"
+    columns = list(formats) if formats is not None else list(df.columns)
+    header = header or columns
+    lines = ["| " + " | ".join(header) + " |", "| " + " | ".join(["---"] * len(header)) + " |"]
+    return "\n".join(lines + markdown_rows(df, formats).tolist())
+
+
+# ========== 2. 機率研究室：期望值評分 ==========
+def calculate_expected_value(df):
+    """計算期望值相關指標（df 為 select_prob_range 格式的爆發次數統計表）"""
+    if df.empty:
+        return pd.DataFrame()
+
+    count = df["股票檔數"].to_numpy(dtype=np.float64)
+    avg_return = df["平均年度漲幅%"].to_numpy(dtype=np.float64)
+    median_return = df["中位數漲幅%"].to_numpy(dtype=np.float64)
+    win_rate = df["勝率(>20%)"].to_numpy(dtype=np.float64) / 100
+
+    # 簡單期望值 = 平均報酬 * 股票檔數（權重）
+    expected_value = avg_return * count
+
+    # 風險調整後期望值（考慮標準差，至少以 1 計；標準差為 NaN 時為 0）
+    std_dev = np.maximum(df["標準差%"].to_numpy(dtype=np.float64), 1) if "標準差%" in df.columns \
+        else np.ones(len(df))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        risk_adjusted = np.where(std_dev > 0, avg_return / std_dev, 0.0)
+
+    # 成功率調整期望值
+    success_adjusted = avg_return * win_rate
+
+    has_value = expected_value != 0
+    return pd.DataFrame({
+        "爆發次數": df["爆發次數"].to_numpy(),
+        "股票檔數": df["股票檔數"].to_numpy(),
+        "平均年度漲幅%": avg_return,
+        "中位數漲幅%": median_return,
+        "平均-中位差": np.round(avg_return - median_return, 1),
+        "勝率(>20%)": df["勝率(>20%)"].to_numpy(),
+        "翻倍率(>100%)": df["翻倍率(>100%)"].to_numpy(),
+        "期望值分數": np.where(has_value, np.round(expected_value / 100, 2), 0.0),
+        "風險調整分數": np.round(risk_adjusted, 2),
+        "成功率分數": np.round(success_adjusted, 2),
+        "綜合評分": np.where(has_value,
+                            np.round((expected_value / 100 + risk_adjusted + success_adjusted) / 3, 2), 0.0),
+    }, index=df.index).reset_index(drop=True)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 專案模組都在根目錄（沒有 package），測試直接 import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
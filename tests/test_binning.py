@@ -0,0 +1,65 @@
+import math
+
+import numpy as np
+
+from binning import DEFAULT_BINNING, ReturnBinning, resolve_binning
+
+
+def classify_annual_return(ret):
+    """sql/001 classify_annual_return 的 CASE（原本熱力圖的分組）"""
+    if ret <= -100:
+        return 0
+    if ret < 0:
+        return math.floor(ret / 10) + 11
+    if ret < 1000:
+        return math.floor(ret / 100) + 11
+    return 21
+
+
+SQL_LABELS = {0: "00. 下跌-100%以下", 1: "01. 下跌-100%至-90%", 10: "10. 下跌-10%至0%",
+              11: "11. 上漲0-100%", 20: "20. 上漲900-1000%", 21: "21. 上漲1000%以上"}
+
+
+def test_default_binning_matches_sql_case():
+    returns = [-250.0, -100.0, -99.99, -90.0, -10.0, -0.01, 0.0, 99.99, 100.0, 999.9, 1000.0, 5000.0]
+    order, labels = DEFAULT_BINNING.apply(returns)
+    assert order.tolist() == [classify_annual_return(r) for r in returns]
+    for o, label in zip(order, labels):
+        if o in SQL_LABELS:
+            assert label == SQL_LABELS[o]
+    assert len(DEFAULT_BINNING.labels) == 22
+
+
+def test_edges_and_open_ends():
+    binning = ReturnBinning.from_edges([-10, 0, 100])
+    order, _ = binning.apply([-50.0, -10.0, -9.0, 0.0, 99.0, 100.0, 1e9])
+    # bin 0 含上界；中間各組 [lo, hi)；最後一組 >= 最後一個邊界
+    assert order.tolist() == [0, 0, 1, 2, 2, 3, 3]
+    assert binning.labels == ("00. 下跌-10%以下", "01. 下跌-10%至0%", "02. 上漲0-100%", "03. 上漲100%以上")
+
+
+def test_bounds_are_consistent_with_apply():
+    binning = ReturnBinning.from_edges([-10, 0, 100])
+    assert binning.bounds(0) == (-np.inf, np.nextafter(-10.0, np.inf))
+    assert binning.bounds(1) == (np.nextafter(-10.0, np.inf), 0.0)
+    assert binning.bounds(3) == (100.0, np.inf)
+
+    returns = np.array([-1e6, -10.0, np.nextafter(-10.0, np.inf), -0.5, 0.0, 99.9, 100.0, 1e6])
+    order, _ = binning.apply(returns)
+    for ret, o in zip(returns, order):
+        lo, hi = binning.bounds(o)
+        assert lo <= ret < hi  # 深度挖掘的 SQL 條件 annual_ret >= lo AND annual_ret < hi
+
+
+def test_quantile_binning_balances_counts():
+    returns = np.arange(100, dtype=float)
+    binning = resolve_binning("五分位數 (各組檔數相同)", returns)
+    order, _ = binning.apply(returns)
+    assert len(binning.labels) == 5
+    # 分位數邊界本身落在 bin 0 (含上界) 或下一組 (不含下界)，各組檔數差距不超過 1
+    assert np.bincount(order).max() - np.bincount(order).min() <= 1
+
+
+def test_quantile_binning_without_samples():
+    binning = ReturnBinning.from_quantiles([np.nan], 10)
+    assert binning.edges == (0.0,)
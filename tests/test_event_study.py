@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from event_study import (TIMING_STAGES, build_return_panel, locate_events, run_event_study, spark_mask,
+                         threshold_sweep)
+
+# 門檻範圍內的事件聯集：本月值、上月值（NaN = 沒有上月值）與各階段報酬（NaN = 缺資料）
+EVENTS = pd.DataFrame({
+    "growth_val":    [40.0, 120.0, 80.0, 300.0, 55.0, 200.0],
+    "prev_metric":   [np.nan, 60.0, 10.0, 250.0, 70.0, np.nan],
+    "pre_month":     [1.0, -2.0, np.nan, 4.0, 0.0, 6.0],
+    "pre_week":      [0.5, np.nan, np.nan, -1.0, 2.0, 3.0],
+    "announce_week": [-3.0, 5.0, 1.0, 2.0, np.nan, -4.0],
+    "after_week_1":  [2.0, 2.0, -1.0, np.nan, 1.0, 0.0],
+    "after_month":   [np.nan, 10.0, -5.0, 3.0, 7.0, 1.0],
+})
+
+
+def per_threshold(limit):
+    """逐一門檻篩選事件後以 dropna() 統計（原本每次拖動滑桿重新查詢的算法）"""
+    spark = EVENTS[(EVENTS["growth_val"] >= limit)
+                   & (EVENTS["prev_metric"].isna() | (EVENTS["prev_metric"] < limit))]
+    rows = []
+    for col, label in TIMING_STAGES.items():
+        x = spark[col].dropna()
+        rows.append({
+            "threshold": float(limit), "stage": label,
+            "mean": x.mean(), "median": x.median(),
+            "win_rate": (x > 0).mean() * 100 if len(x) else np.nan,
+            "n": len(x), "n_events": len(spark),
+        })
+    return pd.DataFrame(rows)
+
+
+def test_spark_mask_hand_computed():
+    mask = spark_mask(EVENTS["growth_val"], EVENTS["prev_metric"], [50, 100])
+    # 門檻 50：40 未達；上月 60 / 250 / 70 已 >= 50 不算爆發
+    assert mask[0].tolist() == [False, False, True, False, False, True]
+    # 門檻 100：上月 60 < 100 的 120 成為新事件（不是門檻 50 事件的子集合）
+    assert mask[1].tolist() == [False, True, False, False, False, True]
+
+
+@pytest.mark.parametrize("limit", [30, 50, 60, 61, 100, 250, 251, 300, 301])
+def test_matches_per_threshold_dropna(limit):
+    swept = threshold_sweep(EVENTS, [limit])
+    pd.testing.assert_frame_equal(swept, per_threshold(limit), check_dtype=False)
+
+
+def test_hand_computed_threshold_100():
+    swept = threshold_sweep(EVENTS, [30, 100]).set_index(["threshold", "stage"])
+    # 門檻 100 的事件：120（上月 60）與 200（沒有上月值）
+    row = swept.loc[(100.0, "T周")]
+    assert (row["mean"], row["median"], row["win_rate"], row["n"], row["n_events"]) == (0.5, 0.5, 50.0, 2, 2)
+    # T-1周 只有 200 那筆有資料
+    row = swept.loc[(100.0, "T-1周")]
+    assert (row["mean"], row["win_rate"], row["n"]) == (3.0, 100.0, 1)
+
+
+def test_no_events_gives_nan_statistics():
+    swept = threshold_sweep(EVENTS, [1000])
+    assert (swept["n"] == 0).all() and (swept["n_events"] == 0).all()
+    assert swept[["mean", "median", "win_rate"]].isna().all().all()
+
+
+def test_locate_events_requires_bar_inside_announce_week():
+    # 2330 每週五一根週K，但 2024-03-08 ~ 2024-03-22 停牌（缺三根）
+    dates = pd.to_datetime(["2024-02-23", "2024-03-01", "2024-03-29", "2024-04-05"])
+    returns = pd.DataFrame({"stock_id": 2330, "date": dates, "weekly_ret": [1.0, 2.0, 3.0, 4.0]})
+    panel = build_return_panel(returns)
+    base_dates = pd.to_datetime(["2024-02-28", "2024-03-12", "2024-03-26", "2024-04-10"])
+    _, t_pos = locate_events(panel, [2330] * 4, base_dates)
+    # (base-3, base+4]：02-25~03-03 有 03-01；03-09~03-16 停牌；03-23~03-30 有 03-29；04-07 之後沒有資料
+    assert t_pos.tolist() == [1, -1, 2, -1]
+
+    events = pd.DataFrame({"stock_id": [2330] * 4, "base_date": base_dates})
+    per_event, _ = run_event_study(events, returns, curve_range=(-1, 1), windows={"T周": (0, 0)})
+    # 停牌那週是 NaN（與 SQL 的 announce_week 相同），不會拿 03-29 的報酬當 T 週
+    np.testing.assert_allclose(per_event["T周"], [2.0, np.nan, 3.0, np.nan])
@@ -0,0 +1,52 @@
+import json
+import time
+
+import profiler
+
+
+def test_sections_and_cache_counters_in_jsonl(tmp_path, monkeypatch):
+    log_path = tmp_path / "profile.jsonl"
+    monkeypatch.setenv("SRL_PROFILE", "1")
+    monkeypatch.setenv("SRL_PROFILE_LOG", str(log_path))
+
+    @profiler.cache_data()
+    def square(x):
+        return x * x
+
+    square.clear()
+    profiler.start_run("test_page")
+    profiler.mark("1. 查詢")
+    with profiler.section("fetch"):
+        time.sleep(0.02)
+        square(2), square(2), square(3)  # 2 次未命中、1 次命中
+    profiler.record_disk_hit("square")
+    profiler.mark("2. 繪圖")
+    profiler.record_query({"caller": "square", "fingerprint": "abc", "ms": 1.0, "rows": 1, "bytes": 8,
+                           "statement": "SELECT 1"})
+    total_ms, sections, cache = profiler.summary()
+    profiler.write_log(total_ms, sections, cache)
+
+    record = json.loads(log_path.read_text(encoding="utf-8").strip())
+    assert record["page"] == "test_page"
+    ms = {s["name"]: s["ms"] for s in record["sections"]}
+    # section 在 mark 區段內，名稱前面加上 mark；mark 區段包含其中的 section
+    assert list(ms) == ["1. 查詢 / fetch", "1. 查詢", "2. 繪圖"]
+    assert ms["1. 查詢 / fetch"] >= 20
+    assert ms["1. 查詢"] >= ms["1. 查詢 / fetch"]
+    assert record["total_ms"] >= ms["1. 查詢"] + ms["2. 繪圖"]
+
+    stats = record["cache"]["square"]
+    assert (stats["calls"], stats["misses"], stats["disk_hits"]) == (3, 2, 1)
+    assert record["queries"][0]["statement"] == "SELECT 1"
+    assert cache.set_index("函式").loc["square", "hits"] == 1
+    profiler._state.run = None  # 與 render_panel 結尾相同，不影響其他測試
+
+
+def test_disabled_records_nothing(monkeypatch):
+    monkeypatch.setenv("SRL_PROFILE", "0")
+    profiler.start_run("test_page")
+    profiler.mark("1. 查詢")
+    with profiler.section("fetch"):
+        pass
+    profiler.record_disk_hit("square")
+    assert profiler.summary() is None
@@ -0,0 +1,54 @@
+import json
+import logging
+
+import pandas as pd
+
+import query_log
+
+
+def test_normalize_sql_strips_comments_and_whitespace():
+    query = """
+    WITH hits AS (  -- 觀察期內的達標次數
+        SELECT stock_id, COUNT(*) /* 月數 */ as hits
+        FROM monthly_revenue
+        WHERE period BETWEEN :start_period AND :end_period
+    )
+    SELECT * FROM hits
+    """
+    assert query_log.normalize_sql(query) == (
+        "WITH hits AS ( SELECT stock_id, COUNT(*) as hits FROM monthly_revenue "
+        "WHERE period BETWEEN :start_period AND :end_period ) SELECT * FROM hits"
+    )
+    # 縮排、換行不同的同一種查詢有相同的 fingerprint
+    assert query_log.fingerprint(query_log.normalize_sql(query)) == \
+        query_log.fingerprint(query_log.normalize_sql(query.replace("\n    ", "\n\t\t")))
+
+
+def test_slow_query_written_with_plan(tmp_path, monkeypatch):
+    log_path = tmp_path / "slow.jsonl"
+    monkeypatch.setenv("SRL_SLOW_QUERY_MS", "0.000001")
+    monkeypatch.setenv("SRL_SLOW_QUERY_LOG", str(log_path))
+    monkeypatch.setattr(query_log, "_last_explained", {})
+
+    df = query_log.timed_query(lambda: pd.DataFrame({"x": [1, 2]}), "SELECT x FROM t WHERE y = :y", {"y": 3},
+                               "fetch_x", explain=lambda: ["Seq Scan on t", "  Filter: (y = 3)"])
+    assert len(df) == 2
+    record = json.loads(log_path.read_text(encoding="utf-8"))
+    assert (record["caller"], record["rows"], record["params"]) == ("fetch_x", 2, {"y": 3})
+    assert record["plan"] == "Seq Scan on t\n  Filter: (y = 3)"
+
+
+def test_failed_explain_is_logged_not_raised(tmp_path, monkeypatch, caplog):
+    monkeypatch.setenv("SRL_SLOW_QUERY_MS", "0.000001")
+    monkeypatch.setenv("SRL_SLOW_QUERY_LOG", str(tmp_path / "slow.jsonl"))
+    monkeypatch.setattr(query_log, "_last_explained", {})
+
+    def explain():
+        raise TimeoutError("canceling statement due to statement timeout")
+
+    with caplog.at_level(logging.WARNING, logger="query_log"):
+        df = query_log.timed_query(lambda: pd.DataFrame({"x": [1]}), "SELECT x FROM t", None, "fetch_x",
+                                   explain=explain)
+    assert len(df) == 1
+    assert "慢查詢紀錄寫入失敗" in caplog.text
+    assert caplog.records[0].exc_info[0] is TimeoutError
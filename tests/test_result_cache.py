@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import result_cache
+
+
+@pytest.fixture
+def disk_cache(tmp_path, monkeypatch):
+    """啟用磁碟快取，資料版本由測試控制"""
+    monkeypatch.setenv("SRL_RESULT_CACHE_DIR", str(tmp_path / "cache"))
+    version = {"value": "v1"}
+    monkeypatch.setattr(result_cache, "_data_version", lambda: version["value"])
+    monkeypatch.setattr(result_cache, "_last_version", None)
+    monkeypatch.setattr(result_cache, "_key_context", None)
+    return version
+
+
+def test_serialize_round_trip_keeps_index_and_object_columns():
+    # 查詢結果的字串欄位是 object dtype（缺值為 None），Arrow 讀回時預設會變成 str dtype
+    index = pd.Index(["a", "b", "c"], dtype=object, name="key")
+    df = pd.DataFrame({
+        "stock_id": pd.Series(["2330", None, "2317"], index=index, dtype=object),
+        "remark": pd.Series([None, "訂單增加", ""], index=index, dtype=object),
+        "ret": [12.5, np.nan, -3.0],
+        "hits": np.array([3, 1, 2], dtype=np.int64),
+        "date": pd.to_datetime(["2024-01-05", "2024-01-12", "2024-01-19"]),
+    }, index=index)
+
+    restored = result_cache.deserialize(result_cache.serialize(df))
+    pd.testing.assert_frame_equal(restored, df)
+    assert restored["stock_id"].dtype == object and restored.index.dtype == object
+    assert restored.loc["b", "stock_id"] is None and restored.loc["a", "remark"] is None
+
+
+def test_serialize_round_trip_keeps_default_index():
+    df = pd.DataFrame({"爆發次數": [3, 2], "股票檔數": [10, 20]})
+    pd.testing.assert_frame_equal(result_cache.deserialize(result_cache.serialize(df)), df)
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = result_cache.DiskCache(str(tmp_path), max_bytes=3000)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.set("f", key, b"x" * 1000)
+        os.utime(cache._path("f", key), (100 + i, 100 + i))  # 寫入順序 a < b < c
+    assert cache.get("f", "a") is not None  # 讀取後 a 變成最近使用
+
+    cache.set("f", "d", b"x" * 1000)  # 4000 > 3000：淘汰到 2700 以下
+    assert [cache.get("f", key) is not None for key in "abcd"] == [True, False, False, True]
+    assert cache._approx_bytes == 2000
+
+
+def test_disk_cache_overwrite_counts_size_change_only(tmp_path):
+    cache = result_cache.DiskCache(str(tmp_path), max_bytes=2000)
+    cache.set("f", "k", b"x" * 1000)
+    for _ in range(10):
+        cache.set("f", "k", b"y" * 1500)  # 同一個鍵重複覆寫不累加大小，不觸發淘汰
+    assert cache._approx_bytes == 1500
+    assert cache.get("f", "k") == b"y" * 1500
+
+    cache.set("f", "k", b"z" * 500)
+    cache.set("f", "k2", b"z" * 10)
+    assert cache._approx_bytes == sum(size for _, size, _ in cache._entries()) == 510
+
+
+def test_cache_key_follows_data_version(disk_cache):
+    calls = []
+
+    @result_cache.cache_data(max_entries=10)
+    def fetch_numbers(n, scale=1):
+        calls.append(n)
+        return pd.DataFrame({"x": np.arange(n) * scale})
+
+    fetch_numbers.clear()
+    first = fetch_numbers(3)
+    pd.testing.assert_frame_equal(fetch_numbers(3, scale=1), first)  # 位置 / 關鍵字參數同一個鍵
+    assert calls == [3]
+
+    disk_cache["value"] = "v2"  # 資料更新：記憶體與磁碟的鍵都改變，重新執行
+    fetch_numbers(3)
+    assert calls == [3, 3]
+
+    fetch_numbers.clear()  # 清空記憶體快取後，v2 的結果從磁碟取得
+    fetch_numbers(3)
+    assert calls == [3, 3]
+
+    key = lambda version: result_cache.cache_key(fetch_numbers.__wrapped__, "", version, (3,), {})
+    assert key("v1") != key("v2")
+
+
+def test_data_version_failure_falls_back_to_last_version(disk_cache, monkeypatch):
+    assert result_cache.current_data_version() == "v1"
+
+    def broken():
+        raise ConnectionError("pooler unavailable")
+
+    monkeypatch.setattr(result_cache, "_data_version", broken)
+    assert result_cache.current_data_version() == "v1"
+    monkeypatch.setattr(result_cache, "_last_version", None)
+    assert result_cache.current_data_version().startswith("t")
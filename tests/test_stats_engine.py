@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stats_engine import grouped_stats
+
+
+@pytest.fixture
+def samples():
+    # 三組：一般樣本、單一樣本（標準差 NaN）、全部相同（標準差 0）
+    return pd.DataFrame({
+        "group": [0, 0, 0, 0, 0, 2, 5, 5, 5],
+        "x": [3.0, -1.0, 10.0, 4.0, 0.0, 7.5, 2.0, 2.0, 2.0],
+        "symbol": [1, 2, 2, 3, 4, 9, 1, 1, 6],
+        "w": [10.0, 20.0, 30.0, 40.0, 50.0, 1.0, 2.0, 4.0, 6.0],
+    })
+
+
+def test_matches_pandas_groupby(samples):
+    result = grouped_stats(samples["group"], samples["x"], samples["symbol"], weights=samples["w"])
+    grouped = samples.groupby("group")
+    expected = pd.DataFrame({
+        "median_val": grouped["x"].median(),
+        "mean_val": grouped["x"].mean(),
+        "std_val": grouped["x"].std(ddof=1),
+        "min_val": grouped["x"].min(),
+        "max_val": grouped["x"].max(),
+        "iqr_val": grouped["x"].quantile(0.75) - grouped["x"].quantile(0.25),
+        "positive_rate": grouped["x"].apply(lambda s: (s > 0).mean() * 100),
+        "stock_count": grouped["symbol"].nunique(),
+        "data_points": grouped["x"].size(),
+        "weight_mean": grouped["w"].mean(),
+    })
+
+    assert list(result.index) == [0, 2, 5]
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False,
+                                  check_index_type=False, check_names=False)
+
+
+def test_moments_match_sql_definitions(samples):
+    result = grouped_stats(samples["group"], samples["x"], samples["symbol"])
+    x = np.array([3.0, -1.0, 10.0, 4.0, 0.0])
+    mu, s = x.mean(), x.std(ddof=1)
+    # 偏度 = E[(x-μ)^3] / s^3、峰度 = E[(x-μ)^4] / s^4 - 3（母體動差除以樣本標準差）
+    assert result.loc[0, "skew_val"] == pytest.approx(((x - mu) ** 3).mean() / s ** 3)
+    assert result.loc[0, "kurt_val"] == pytest.approx(((x - mu) ** 4).mean() / s ** 4 - 3)
+    assert result.loc[0, "cv_val"] == pytest.approx(s / abs(mu) * 100)
+    # 單一樣本：標準差 NaN，偏度 / 峰度為 0；全部相同：標準差 0
+    assert np.isnan(result.loc[2, "std_val"])
+    assert result.loc[2, ["skew_val", "kurt_val"]].tolist() == [0.0, 0.0]
+    assert result.loc[5, ["std_val", "skew_val", "kurt_val"]].tolist() == [0.0, 0.0, 0.0]
+
+
+def test_empty_input():
+    assert grouped_stats([], [], []).empty
@@ -0,0 +1,144 @@
+"""
+結果快取預熱：資料同步後重算所有側邊欄組合，寫入 result_cache 的共用快取（disk / redis）
+
+側邊欄的選項空間很小且可列舉（6 個年度 × 2 種成長指標 × 2 種價格欄位 × 分組方式 / 門檻…），
+同步完成後跑一次，互動中的 session（所有 worker / replica）都從共用快取取得結果，不會遇到冷查詢：
+
+    python warm_cache.py                          # 依 [result_cache] / [database] 設定
+    python warm_cache.py --dir data/result_cache  # 指定快取目錄（同時啟用磁碟快取）
+    python warm_cache.py --redis redis://cache:6379/0
+    python warm_cache.py --only app probability   # 只預熱部分頁面（不清除舊結果）
+
+預熱以 result_cache.refreshing() 執行：不讀舊檔、一律重算覆寫。快取鍵包含資料版本，
+預熱寫入的是同步後新版本的結果；全部頁面跑完後，修改時間早於這次預熱開始的檔案
+（且之後沒有被讀取過：舊版本的結果、過時的關鍵字搜尋）一併刪除。
+只列舉不帶關鍵字的查詢；關鍵字搜尋與頁面內的下拉選單（例如爆發次數名單）仍於使用時查詢。
+"""
+import argparse
+import os
+import sys
+import time
+from functools import partial
+
+PAGES = ("app", "probability", "timing")
+
+# 以下需與各頁面側邊欄的選項一致（app.py、pages/probability.py、pages/timing_lab.py）
+YEAR_OPTIONS = [str(y) for y in range(2025, 2019, -1)]
+THRESHOLD_RANGE = (30, 300)      # 公告行為研究室的爆發門檻滑桿
+DEFAULT_EVENT_WINDOW = (-8, 12)  # 自訂事件視窗滑桿的預設值（週）
+DEFAULT_DETAIL_LIMIT = 50        # 深度挖掘「顯示筆數」的預設值
+
+
+def warm_app(da, years):
+    """首頁：熱力圖與統計摘要（所有統計模式共用同一張表）、各漲幅區間的業績王名單"""
+    from binning import BINNING_SCHEMES
+    for year in years:
+        for price_field in da.ANNUAL_PRICE_FIELDS:
+            for scheme in BINNING_SCHEMES:
+                for metric in da.METRIC_COLUMNS:
+                    yield partial(da.fetch_heatmap_data, year, metric, price_field, scheme)
+                for label in da.get_return_binning(year, price_field, scheme).labels:
+                    yield partial(da.fetch_bin_detail, year, price_field, label, "", DEFAULT_DETAIL_LIMIT, scheme)
+
+
+def warm_probability(da, years):
+    """機率研究室：機率曲面涵蓋滑桿的 45 個區間；前後年度比較的達標矩陣與年度報酬"""
+    for year in years:
+        for metric in da.METRIC_COLUMNS:
+            for price_field in da.ANNUAL_PRICE_FIELDS:
+                yield partial(da.fetch_prob_surface, year, metric, price_field)
+        for price_field in da.ANNUAL_PRICE_FIELDS:
+            yield partial(da.fetch_annual_returns, int(year) - 2, int(year) + 1, price_field)
+
+
+def event_returns(da, years, metric, price_field, weeks_before, weeks_after):
+    """事件視窗：事件股票的週報酬，以及涵蓋同一段日期的市場平均週報酬"""
+    df = da.fetch_event_weekly_returns(years, metric, THRESHOLD_RANGE, "", price_field, weeks_before, weeks_after)
+    if not df.empty:
+        da.fetch_market_weekly_returns(df['date'].min(), df['date'].max(), price_field)
+    return df
+
+
+def warm_timing(da, years):
+    """公告行為研究室：門檻掃描聯集（涵蓋整個門檻滑桿，全部年度模式也由聯集篩選）、事件視窗"""
+    all_years = tuple(sorted(years))
+    weeks_before, weeks_after = -DEFAULT_EVENT_WINDOW[0], DEFAULT_EVENT_WINDOW[1]
+
+    for analysis_years in list(years) + [all_years]:
+        for metric in da.METRIC_COLUMNS:
+            yield partial(da.fetch_spark_events, analysis_years, metric, THRESHOLD_RANGE, "")
+            for price_field in da.WEEKLY_PRICE_FIELDS:
+                yield partial(da.fetch_timing_sweep_data, analysis_years, metric, "", price_field, THRESHOLD_RANGE)
+                yield partial(event_returns, da, analysis_years, metric, price_field, weeks_before, weeks_after)
+
+
+def run(tasks, label, clear):
+    """依序執行一個頁面的所有組合，回傳 (執行數, 失敗數)"""
+    started = time.perf_counter()
+    done = failed = 0
+    for task in tasks:
+        try:
+            task()
+        except Exception as e:
+            # 單一組合失敗（例如該年度沒有資料）不中斷整批預熱
+            failed += 1
+            print(f"⚠️ {label}：{e}")
+        done += 1
+    clear()  # 記憶體快取只是預熱過程的副產品，結果已在共用快取上
+    print(f"✅ {label}：{done} 組（失敗 {failed}），{time.perf_counter() - started:,.1f} 秒")
+    return done, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重算所有側邊欄組合並寫入共用結果快取")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--dir", help="磁碟快取目錄（預設依 [result_cache] 設定）")
+    target.add_argument("--redis", help="Redis 相容伺服器的 URL")
+    parser.add_argument("--only", nargs="+", choices=PAGES, help="只預熱指定頁面")
+    parser.add_argument("--years", nargs="+", default=YEAR_OPTIONS, help="預熱的年度")
+    parser.add_argument("--no-prune", action="store_true", help="不刪除這次沒有重算到的舊結果")
+    args = parser.parse_args()
+
+    # 快取設定須在 import data_access 之前決定
+    if args.dir:
+        os.environ["SRL_RESULT_CACHE_DIR"] = os.path.abspath(args.dir)
+    if args.redis:
+        os.environ["SRL_RESULT_CACHE_URL"] = args.redis
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    # 不在 streamlit run 底下執行，關掉「No runtime found」之類的提示
+    # （設定檔解析時會重設 log level，先觸發解析再調整）
+    config.get_option("logger.level")
+    set_log_level("error")
+    import streamlit as st
+    import data_access as da
+    import result_cache
+
+    settings = result_cache.get_result_cache_settings()
+    if not settings["enabled"]:
+        sys.exit("❌ 結果快取未啟用：請以 --dir / --redis 指定，或在 [result_cache] 設定 enabled = true")
+
+    pages = args.only or PAGES
+    years = [str(y) for y in args.years]
+    builders = {
+        "app": lambda: warm_app(da, years),
+        "probability": lambda: warm_probability(da, years),
+        "timing": lambda: warm_timing(da, years),
+    }
+    print(f"🔥 預熱 {', '.join(pages)} | 年度 {', '.join(years)} → {result_cache.get_backend().describe()}")
+
+    started = time.time()
+    failed = 0
+    with result_cache.refreshing():
+        for page in pages:
+            failed += run(builders[page](), page, st.cache_data.clear)[1]
+
+    if failed:
+        # 有組合失敗時保留舊結果，避免把還能用的快取刪掉
+        sys.exit(f"❌ {failed} 組預熱失敗，未清除舊結果")
+    if not args.only and not args.no_prune:
+        print(f"🧹 刪除 {result_cache.prune(started)} 個過期結果")
+
+
+if __name__ == "__main__":
+    main()